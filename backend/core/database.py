@@ -1,13 +1,141 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./data.db"
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+from core.config import (
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
 )
 
+
+# Async driver used for each database by the AsyncSession routes
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    """The same database as `url`, through its asyncio driver (sqlite+aiosqlite, postgresql+asyncpg)."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def _engine_options(url: str, pool_options: dict, sqlite_busy_timeout_ms: int) -> dict:
+    """create_engine() arguments shared by the sync and the async engine."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return pool_options
+    options = {"connect_args": {"check_same_thread": False, "timeout": sqlite_busy_timeout_ms / 1000}}
+    # In-memory databases live in a single connection; only file databases get a pool
+    if parsed.database not in (None, "", ":memory:"):
+        options.update(pool_options)
+    return options
+
+
+def _configure_sqlite(
+    engine: Engine, url: str, journal_mode: str | None, synchronous: str | None, busy_timeout_ms: int
+):
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return
+    in_memory = parsed.database in (None, "", ":memory:")
+
+    @event.listens_for(engine, "connect")
+    def configure_sqlite(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # First, so switching the journal mode waits for a lock too
+            cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+            if journal_mode and not in_memory:
+                cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+            if synchronous:
+                cursor.execute(f"PRAGMA synchronous={synchronous}")
+        except Exception:
+            # The pool never sees this connection; an aiosqlite one left open keeps its thread alive
+            cursor.close()
+            dbapi_connection.close()
+            raise
+        cursor.close()
+
+
+def create_database_engine(
+    url: str = DATABASE_URL,
+    pool_size: int = DB_POOL_SIZE,
+    max_overflow: int = DB_MAX_OVERFLOW,
+    pool_timeout: float = DB_POOL_TIMEOUT,
+    pool_pre_ping: bool = DB_POOL_PRE_PING,
+    pool_recycle: int = DB_POOL_RECYCLE,
+    sqlite_journal_mode: str | None = SQLITE_JOURNAL_MODE,
+    sqlite_synchronous: str | None = SQLITE_SYNCHRONOUS,
+    sqlite_busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+) -> Engine:
+    """
+    Engine for `url` with a connection pool of `pool_size` connections plus
+    up to `max_overflow` more under load. On SQLite every new connection
+    also gets the journal mode (WAL lets readers run while a write
+    commits), the synchronous level and a busy timeout, so writers wait
+    for the lock instead of failing with "database is locked".
+    """
+    pool_options = {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_pre_ping": pool_pre_ping,
+        "pool_recycle": pool_recycle,
+    }
+    engine = create_engine(url, **_engine_options(url, pool_options, sqlite_busy_timeout_ms))
+    _configure_sqlite(engine, url, sqlite_journal_mode, sqlite_synchronous, sqlite_busy_timeout_ms)
+    return engine
+
+
+def create_async_database_engine(
+    url: str = DATABASE_URL,
+    pool_size: int = DB_POOL_SIZE,
+    max_overflow: int = DB_MAX_OVERFLOW,
+    pool_timeout: float = DB_POOL_TIMEOUT,
+    pool_pre_ping: bool = DB_POOL_PRE_PING,
+    pool_recycle: int = DB_POOL_RECYCLE,
+    sqlite_journal_mode: str | None = SQLITE_JOURNAL_MODE,
+    sqlite_synchronous: str | None = SQLITE_SYNCHRONOUS,
+    sqlite_busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+    poolclass=None,
+) -> AsyncEngine:
+    """
+    Async engine for the database at `url` (a sync URL, as in DATABASE_URL),
+    with the same pool and SQLite settings as create_database_engine().
+    Pass `poolclass` (e.g. NullPool) to replace the pool; the pool sizes are
+    then ignored.
+    """
+    pool_options = {} if poolclass is not None else {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_pre_ping": pool_pre_ping,
+        "pool_recycle": pool_recycle,
+    }
+    options = _engine_options(url, pool_options, sqlite_busy_timeout_ms)
+    if poolclass is not None:
+        options["poolclass"] = poolclass
+    engine = create_async_engine(async_database_url(url), **options)
+    _configure_sqlite(engine.sync_engine, url, sqlite_journal_mode, sqlite_synchronous, sqlite_busy_timeout_ms)
+    return engine
+
+
+engine = create_database_engine()
+async_engine = create_async_database_engine()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay usable after commit; reloading expired attributes would need an await
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # NEW: Database dependency for routes
@@ -17,3 +145,20 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """AsyncSession for routes that run on the event loop; queries don't block other requests."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def dialect_insert(db: Session, table):
+    """
+    INSERT construct for the session's database that supports
+    on_conflict_do_update / on_conflict_do_nothing (SQLite or PostgreSQL).
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
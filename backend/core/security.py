@@ -6,11 +6,13 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 import secrets
 
-from core.config import JWT_SECRET_KEY, JWT_ALGORITHM, JWT_EXPIRES_MINUTES
+from core.config import BCRYPT_ROUNDS, JWT_SECRET_KEY, JWT_ALGORITHM, JWT_EXPIRES_MINUTES
 from core.database import get_db
 from models import User, UserFile
+from services.password_hashing import PasswordHashingBusy, password_hasher
+from services.user_cache import AuthenticatedUser, authenticated_user_cache
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 security = HTTPBearer()
 
 def generate_verification_token(length: int = 32) -> str: 
@@ -28,30 +30,56 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return pwd_context.verify(password, hashed)
 
-def create_access_token(subject: str) -> str:
-    expire = datetime.utcnow() + timedelta(minutes=JWT_EXPIRES_MINUTES)
-    to_encode = {"sub": subject, "exp": expire}
+async def run_password_hashing(fn, *args):
+    """Run hash_password or verify_password on the password hashing pool; 429 when it is saturated."""
+    try:
+        return await password_hasher.run(fn, *args)
+    except PasswordHashingBusy:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many sign-in attempts right now, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+def create_access_token(subject: str, user_id: int | None = None) -> str:
+    now = datetime.utcnow()
+    to_encode = {"sub": subject, "iat": now, "exp": now + timedelta(minutes=JWT_EXPIRES_MINUTES)}
+    if user_id is not None:
+        # Lets get_current_user load the user by primary key
+        to_encode["uid"] = user_id
     return jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
 
+def load_token_user(db: Session, email: str, user_id: int | None) -> AuthenticatedUser | None:
+    if user_id is not None:
+        user = db.get(User, user_id)
+        # A token issued before an email change no longer matches
+        if user is not None and user.email != email:
+            user = None
+    else:
+        user = db.query(User).filter(User.email == email).first()
+    return AuthenticatedUser.from_user(user) if user is not None else None
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db),
-):
+) -> AuthenticatedUser:
     token = credentials.credentials
 
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        email = payload.get("sub")
-
-        if email is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-
-        user = db.query(User).filter(User.email == email).first()
-
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-
-        return user
-
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+
+    email = payload.get("sub")
+    user_id = payload.get("uid")
+    if email is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    # Signature and expiry are checked on every request above; only the
+    # user lookup is cached
+    user = authenticated_user_cache.get_or_load(
+        (email, user_id, payload.get("iat")), lambda: load_token_user(db, email, user_id)
+    )
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
@@ -1,15 +1,44 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from core.database import Base, engine
+from core.database import SessionLocal, async_engine, engine
+from migrations import prepare_database
 from routes.auth_routes import router as auth_router
 from routes.file_routes import router as file_router
 from routes.storage_routes import router as storage_router
 from routes.folder_routes import router as folder_router
 from routes.billing_routes import router as billing_router
+from services.deleted_files import run_deleted_file_compaction
+from services.email_service import run_email_sender
+from services.purge_queue import run_purge_worker
+from services.upload_sessions import run_upload_session_cleanup
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema setup runs once the server starts, not whenever main is imported
+    await asyncio.to_thread(prepare_database, engine)
+    # Deletes queue their S3 objects; this drains the queue in the background
+    purge_worker = asyncio.create_task(run_purge_worker(SessionLocal))
+    # Aborts the multipart uploads of abandoned resumable uploads
+    upload_cleanup = asyncio.create_task(run_upload_session_cleanup(SessionLocal))
+    # Removes the rows of files deleted before last month; the ledger keeps their usage
+    compaction = asyncio.create_task(run_deleted_file_compaction(SessionLocal))
+    # Delivers the email outbox over one kept-open SMTP connection
+    email_sender = asyncio.create_task(run_email_sender(SessionLocal))
+    try:
+        yield
+    finally:
+        purge_worker.cancel()
+        upload_cleanup.cancel()
+        compaction.cancel()
+        email_sender.cancel()
+        await async_engine.dispose()
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,6 +46,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Routers
@@ -0,0 +1,62 @@
+"""
+Schema migrations for databases created before a model change.
+
+Base.metadata.create_all() only creates missing tables, so anything that
+changes an existing table (new indexes, columns, backfills) lives here.
+Each migration runs once, in order, and is recorded in schema_migrations.
+
+prepare_database() creates missing tables and then applies the pending
+migrations; the app calls it on startup. Run manually with:
+python -m migrations
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from migrations import (
+    m0001_file_folder_indexes,
+    m0002_storage_usage_counters,
+    m0003_file_content_hash,
+    m0004_storage_ledger,
+    m0005_invoice_period_unique,
+    m0006_unified_file_lifecycle,
+)
+
+MIGRATIONS = [
+    ("0001_file_folder_indexes", m0001_file_folder_indexes.upgrade),
+    ("0002_storage_usage_counters", m0002_storage_usage_counters.upgrade),
+    ("0003_file_content_hash", m0003_file_content_hash.upgrade),
+    ("0004_storage_ledger", m0004_storage_ledger.upgrade),
+    ("0005_invoice_period_unique", m0005_invoice_period_unique.upgrade),
+    ("0006_unified_file_lifecycle", m0006_unified_file_lifecycle.upgrade),
+]
+
+
+def run_migrations(engine: Engine) -> list[str]:
+    """Apply every migration not yet recorded. Returns the names of those applied."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR PRIMARY KEY, "
+            "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        ))
+        applied = {row.name for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+
+    newly_applied = []
+    for name, upgrade in MIGRATIONS:
+        if name in applied:
+            continue
+        # Each migration commits together with its schema_migrations row
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+        newly_applied.append(name)
+    return newly_applied
+
+
+def prepare_database(engine: Engine) -> list[str]:
+    """Create the tables that don't exist yet, then apply pending migrations. Returns the migrations applied."""
+    from core.database import Base
+    import models  # noqa: F401  (registers every table on Base.metadata)
+
+    Base.metadata.create_all(bind=engine)
+    return run_migrations(engine)
@@ -0,0 +1,13 @@
+import logging
+
+from core.database import engine
+from migrations import prepare_database
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+applied = prepare_database(engine)
+
+if applied:
+    for name in applied:
+        print(f"Applied {name}")
+else:
+    print("Database is up to date.")
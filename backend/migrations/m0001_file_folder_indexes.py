@@ -0,0 +1,57 @@
+"""
+Composite indexes for the hot user_files and folders queries, and a unique
+index on live filenames per folder.
+"""
+import logging
+import os
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# The indexes as this migration shipped them. Later model changes belong to
+# later migrations (0006 rebuilds the listing indexes on live rows only), so
+# every database ends up with the same schema.
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_user_files_user_folder_name ON user_files (user_id, folder_id, filename)",
+    "CREATE INDEX IF NOT EXISTS ix_user_files_user_folder_uploaded ON user_files (user_id, folder_id, uploaded_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_user_files_user_uploaded ON user_files (user_id, uploaded_at, id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_user_files_live_name ON user_files "
+    "(user_id, coalesce(folder_id, 0), filename) WHERE deleted_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS ix_folders_user_parent_name ON folders (user_id, parent_id, name)",
+]
+
+
+def rename_duplicate_live_files(conn) -> int:
+    """
+    Older rows that share a live name in the same folder would block the
+    unique index. Keep the newest row's name and suffix the others with
+    their id, e.g. "report (12).pdf". Returns the number of renamed rows.
+    """
+    rows = conn.execute(text(
+        "SELECT f.id, f.filename FROM user_files f "
+        "WHERE f.deleted_at IS NULL AND EXISTS ("
+        "  SELECT 1 FROM user_files newer "
+        "  WHERE newer.user_id = f.user_id "
+        "  AND COALESCE(newer.folder_id, 0) = COALESCE(f.folder_id, 0) "
+        "  AND newer.filename = f.filename "
+        "  AND newer.deleted_at IS NULL "
+        "  AND newer.id > f.id)"
+    )).all()
+
+    for row in rows:
+        stem, ext = os.path.splitext(row.filename)
+        conn.execute(
+            text("UPDATE user_files SET filename = :name WHERE id = :id"),
+            {"name": f"{stem} ({row.id}){ext}", "id": row.id}
+        )
+    return len(rows)
+
+
+def upgrade(conn):
+    renamed = rename_duplicate_live_files(conn)
+    if renamed:
+        logger.info("Renamed %d duplicate files so filenames are unique per folder", renamed)
+
+    for statement in INDEXES:
+        conn.execute(text(statement))
@@ -0,0 +1,20 @@
+"""
+Backfill user_storage_usage and folder_storage_usage from existing files.
+"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text("DELETE FROM folder_storage_usage"))
+    conn.execute(text("DELETE FROM user_storage_usage"))
+    # Files at the root count under folder 0
+    conn.execute(text(
+        "INSERT INTO folder_storage_usage (user_id, folder_id, file_count, total_bytes) "
+        "SELECT user_id, COALESCE(folder_id, 0), COUNT(*), COALESCE(SUM(file_size), 0) FROM user_files "
+        "WHERE deleted_at IS NULL GROUP BY user_id, COALESCE(folder_id, 0)"
+    ))
+    conn.execute(text(
+        "INSERT INTO user_storage_usage (user_id, file_count, total_bytes) "
+        "SELECT user_id, COUNT(*), COALESCE(SUM(file_size), 0) FROM user_files "
+        "WHERE deleted_at IS NULL GROUP BY user_id"
+    ))
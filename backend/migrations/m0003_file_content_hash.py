@@ -0,0 +1,12 @@
+"""
+Add user_files.content_hash and its index. Existing files keep a NULL hash
+and are not deduplicated; storage_blobs itself is created by create_all().
+"""
+from sqlalchemy import inspect, text
+
+
+def upgrade(conn):
+    columns = {column["name"] for column in inspect(conn).get_columns("user_files")}
+    if "content_hash" not in columns:
+        conn.execute(text("ALTER TABLE user_files ADD COLUMN content_hash VARCHAR(64)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_user_files_content_hash ON user_files (content_hash)"))
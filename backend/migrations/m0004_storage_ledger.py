@@ -0,0 +1,80 @@
+"""
+Fill storage_events from existing files and their storage history, and
+build the monthly usage accumulators from it.
+
+The backfill and the replay are the ledger's rules as this migration
+shipped them, written out here so later changes to services.storage_ledger
+don't change what the migration does.
+"""
+from datetime import datetime
+
+from sqlalchemy import DateTime, inspect, text
+
+
+def backfill_events(conn):
+    """
+    An upload event per file and per file_storage_history row, and a delete
+    event for each deleted file and history row. Migration 0006 moves the
+    history into user_files later.
+    """
+    conn.execute(text(
+        "INSERT INTO storage_events (user_id, file_id, event_type, byte_delta, occurred_at) "
+        "SELECT user_id, id, 'upload', file_size, uploaded_at FROM user_files"
+    ))
+    conn.execute(text(
+        "INSERT INTO storage_events (user_id, file_id, event_type, byte_delta, occurred_at) "
+        "SELECT user_id, id, 'delete', -file_size, deleted_at FROM user_files WHERE deleted_at IS NOT NULL"
+    ))
+    if not inspect(conn).has_table("file_storage_history"):
+        return
+    conn.execute(text(
+        "INSERT INTO storage_events (user_id, file_id, event_type, byte_delta, occurred_at) "
+        "SELECT user_id, NULL, 'upload', file_size, uploaded_at FROM file_storage_history"
+    ))
+    conn.execute(text(
+        "INSERT INTO storage_events (user_id, file_id, event_type, byte_delta, occurred_at) "
+        "SELECT user_id, NULL, 'delete', -file_size, deleted_at FROM file_storage_history"
+    ))
+
+
+def build_usage_months(conn) -> int:
+    """
+    Write storage_usage_months by replaying storage_events in time order: each
+    event adds active_bytes times the seconds since the previous one to the
+    month's byte_seconds, and a month opens with the previous month's
+    balance. Returns the number of month rows written.
+    """
+    events = conn.execute(
+        text("SELECT user_id, byte_delta, occurred_at FROM storage_events ORDER BY user_id, occurred_at, id")
+        .columns(occurred_at=DateTime)
+    )
+    rows = []
+    current = None
+    for event in events:
+        at = event.occurred_at
+        if current is None or (current["user_id"], current["year"], current["month"]) != (event.user_id, at.year, at.month):
+            opening = current["active_bytes"] if current and current["user_id"] == event.user_id else 0
+            current = {
+                "user_id": event.user_id, "year": at.year, "month": at.month,
+                "active_bytes": opening, "byte_seconds": 0.0, "accounted_seconds": 0.0,
+            }
+            rows.append(current)
+        seconds = (at - datetime(at.year, at.month, 1)).total_seconds()
+        current["byte_seconds"] += current["active_bytes"] * (seconds - current["accounted_seconds"])
+        current["active_bytes"] += event.byte_delta
+        current["accounted_seconds"] = seconds
+
+    conn.execute(text("DELETE FROM storage_usage_months"))
+    if rows:
+        conn.execute(text(
+            "INSERT INTO storage_usage_months (user_id, year, month, active_bytes, byte_seconds, accounted_seconds) "
+            "VALUES (:user_id, :year, :month, :active_bytes, :byte_seconds, :accounted_seconds)"
+        ), rows)
+    return len(rows)
+
+
+def upgrade(conn):
+    if conn.execute(text("SELECT COUNT(*) FROM storage_events")).scalar():
+        return
+    backfill_events(conn)
+    build_usage_months(conn)
@@ -0,0 +1,66 @@
+"""
+Unique index on invoices (user_id, billing_year, billing_month), so batch
+invoicing can skip periods that are already billed.
+"""
+import logging
+from itertools import groupby
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+
+def is_settled(row) -> bool:
+    """Whether an invoice went past a draft: paid, failed or refunded, or sent to Stripe."""
+    return row.status != "pending" or bool(row.stripe_invoice_id or row.stripe_payment_intent_id)
+
+
+def remove_duplicate_invoices(conn) -> int:
+    """
+    The invoice route checked for an existing invoice before inserting, so
+    duplicates only come from concurrent requests. Of each duplicated
+    period keep the invoice that was paid or sent to Stripe (the earliest
+    one if none was) and delete the pending drafts. Periods with more than
+    one settled invoice are left for someone to resolve by hand: the
+    migration fails and lists them. Returns the number of removed rows.
+    """
+    rows = conn.execute(text(
+        "SELECT id, user_id, billing_year, billing_month, status, stripe_invoice_id, stripe_payment_intent_id "
+        "FROM invoices WHERE EXISTS ("
+        "  SELECT 1 FROM invoices other "
+        "  WHERE other.user_id = invoices.user_id "
+        "  AND other.billing_year = invoices.billing_year "
+        "  AND other.billing_month = invoices.billing_month "
+        "  AND other.id != invoices.id) "
+        "ORDER BY user_id, billing_year, billing_month, id"
+    )).all()
+
+    removed, conflicts = [], []
+    for (user_id, year, month), group in groupby(rows, key=lambda row: (row.user_id, row.billing_year, row.billing_month)):
+        group = list(group)
+        settled = [row for row in group if is_settled(row)]
+        if len(settled) > 1:
+            invoices = ", ".join(f"#{row.id} ({row.status})" for row in group)
+            conflicts.append(f"user {user_id} {year}-{month:02d}: {invoices}")
+            continue
+        keep = settled[0] if settled else group[0]
+        removed.extend(row.id for row in group if row.id != keep.id)
+
+    if conflicts:
+        raise RuntimeError(
+            "Several settled invoices bill the same period; resolve them by hand and run the migrations again:\n"
+            + "\n".join(conflicts)
+        )
+    for invoice_id in removed:
+        conn.execute(text("DELETE FROM invoices WHERE id = :id"), {"id": invoice_id})
+    return len(removed)
+
+
+def upgrade(conn):
+    removed = remove_duplicate_invoices(conn)
+    if removed:
+        logger.warning("Removed %d duplicate pending invoices so each period is billed once", removed)
+
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_invoices_user_period ON invoices (user_id, billing_year, billing_month)"
+    ))
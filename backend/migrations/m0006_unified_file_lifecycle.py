@@ -0,0 +1,77 @@
+"""
+One lifecycle for deleted files: they stay in user_files with deleted_at
+set until services.deleted_files compacts them.
+
+Moves file_storage_history into user_files as deleted rows and drops it,
+queues the objects of rows that were marked deleted before deletes
+released them, and rebuilds the listing indexes as partial indexes on live
+rows. Migration 0004 built storage events for the history rows, so the
+storage ledger is left as is.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, inspect, text
+
+logger = logging.getLogger(__name__)
+
+# Listing indexes on live rows only, and an index on the deleted ones
+REBUILT_INDEXES = {
+    "ix_user_files_user_folder_name":
+        "CREATE INDEX ix_user_files_user_folder_name ON user_files (user_id, folder_id, filename) "
+        "WHERE deleted_at IS NULL",
+    "ix_user_files_user_folder_uploaded":
+        "CREATE INDEX ix_user_files_user_folder_uploaded ON user_files (user_id, folder_id, uploaded_at, id) "
+        "WHERE deleted_at IS NULL",
+    "ix_user_files_user_uploaded":
+        "CREATE INDEX ix_user_files_user_uploaded ON user_files (user_id, uploaded_at, id) WHERE deleted_at IS NULL",
+    "ix_user_files_user_deleted":
+        "CREATE INDEX ix_user_files_user_deleted ON user_files (user_id, deleted_at) WHERE deleted_at IS NOT NULL",
+}
+
+
+def release_orphaned_objects(conn) -> int:
+    """
+    Rows marked deleted by hand or by old code kept their objects. Queue the
+    keys no live file or blob uses. Returns the number of queued keys.
+    """
+    keys = conn.execute(text(
+        "SELECT DISTINCT f.file_key FROM user_files f "
+        "WHERE f.deleted_at IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM user_files live WHERE live.file_key = f.file_key AND live.deleted_at IS NULL) "
+        "AND NOT EXISTS (SELECT 1 FROM storage_blobs b WHERE b.file_key = f.file_key)"
+    )).scalars().all()
+    if keys:
+        conn.execute(
+            text(
+                "INSERT INTO s3_purge_queue (file_key, status, attempts, next_attempt_at) "
+                "VALUES (:file_key, 'pending', 0, :now)"
+            ).bindparams(bindparam("now", type_=DateTime)),
+            [{"file_key": key, "now": datetime.utcnow()} for key in sorted(keys)]
+        )
+    return len(keys)
+
+
+def merge_storage_history(conn) -> int:
+    """Copy file_storage_history rows into user_files as deleted files and drop the table. Returns the rows moved."""
+    if not inspect(conn).has_table("file_storage_history"):
+        return 0
+    moved = conn.execute(text(
+        "INSERT INTO user_files (user_id, folder_id, filename, file_key, file_size, uploaded_at, deleted_at) "
+        "SELECT user_id, NULL, filename, file_key, file_size, uploaded_at, deleted_at FROM file_storage_history"
+    )).rowcount
+    conn.execute(text("DROP TABLE file_storage_history"))
+    return moved
+
+
+def upgrade(conn):
+    released = release_orphaned_objects(conn)
+    if released:
+        logger.info("Queued %d objects of deleted files for purging", released)
+    moved = merge_storage_history(conn)
+    if moved:
+        logger.info("Moved %d storage history rows into user_files as deleted files", moved)
+
+    for name, statement in REBUILT_INDEXES.items():
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text(statement))
@@ -1,6 +1,12 @@
 from .user import User
-from .file import UserFile, FileStorageHistory
+from .file import UserFile
 from .folder import Folder
 from .invoice import Invoice, StripeCustomer
+from .storage_usage import UserStorageUsage, FolderStorageUsage
+from .purge_queue import S3PurgeQueue
+from .storage_blob import StorageBlob
+from .upload_session import UploadSession, UploadSessionPart
+from .storage_ledger import StorageEvent, StorageUsageMonth
+from .email_outbox import EmailOutbox
 
-__all__ = ["User", "UserFile", "FileStorageHistory", "Folder", "Invoice", "StripeCustomer"]
+__all__ = ["User", "UserFile", "Folder", "Invoice", "StripeCustomer", "UserStorageUsage", "FolderStorageUsage", "S3PurgeQueue", "StorageBlob", "UploadSession", "UploadSessionPart", "StorageEvent", "StorageUsageMonth", "EmailOutbox"]
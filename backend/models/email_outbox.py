@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from sqlalchemy.sql import func
+from core.database import Base
+from datetime import datetime
+
+
+class EmailOutbox(Base):
+    """Emails written with the change that triggers them, sent later by the background sender"""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    html_body = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # The sender picks up due pending rows in order
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", status, next_attempt_at, id),
+    )
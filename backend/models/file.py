@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, BigInteger, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, BigInteger, DateTime, Index
 from sqlalchemy.sql import func
 from core.database import Base
 from sqlalchemy.orm import relationship
@@ -14,24 +14,44 @@ class UserFile(Base):
     filename = Column(String, nullable=False)
     file_key = Column(String, nullable=False, index=True)  # S3 object key (removed unique constraint)
     file_size = Column(BigInteger, nullable=False)  # Size in bytes
+    # SHA-256 of the content, computed during upload; NULL for direct-to-S3 uploads
+    content_hash = Column(String(64), nullable=True, index=True)
 
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
 
     folder = relationship("Folder", back_populates="files")
     deleted_at = Column(DateTime(timezone=True), nullable=True)
 
+    __table_args__ = (
+        # Listing and lookup indexes cover live rows only; deleted rows stay
+        # for billing until compacted (services.deleted_files)
+        # Duplicate-name checks within a folder
+        Index(
+            "ix_user_files_user_folder_name", user_id, folder_id, filename,
+            sqlite_where=deleted_at.is_(None), postgresql_where=deleted_at.is_(None),
+        ),
+        # Folder listings, newest first
+        Index(
+            "ix_user_files_user_folder_uploaded", user_id, folder_id, uploaded_at, id,
+            sqlite_where=deleted_at.is_(None), postgresql_where=deleted_at.is_(None),
+        ),
+        # /files/list ordering and keyset pagination
+        Index(
+            "ix_user_files_user_uploaded", user_id, uploaded_at, id,
+            sqlite_where=deleted_at.is_(None), postgresql_where=deleted_at.is_(None),
+        ),
+        # Deleted rows, for per-file billing breakdowns and compaction
+        Index(
+            "ix_user_files_user_deleted", user_id, deleted_at,
+            sqlite_where=deleted_at.is_not(None), postgresql_where=deleted_at.is_not(None),
+        ),
+        # One live file per name and folder; root-level files have folder_id NULL
+        Index(
+            "uq_user_files_live_name",
+            user_id, func.coalesce(folder_id, 0), filename,
+            unique=True,
+            sqlite_where=deleted_at.is_(None),
+            postgresql_where=deleted_at.is_(None),
+        ),
+    )
 
-class FileStorageHistory(Base):
-    """Track file storage periods for billing calculations"""
-    __tablename__ = "file_storage_history"
-
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    filename = Column(String, nullable=False)
-    file_key = Column(String, nullable=False)
-    file_size = Column(BigInteger, nullable=False)  # Size in bytes
-    uploaded_at = Column(DateTime(timezone=True), nullable=False)
-    deleted_at = Column(DateTime(timezone=True), nullable=False)
-    
-    # Store calculated cost for this storage period
-    storage_cost = Column(BigInteger, nullable=True)  # Cost in smallest currency unit (e.g., cents)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from core.database import Base
 from datetime import datetime
@@ -18,4 +18,9 @@ class Folder(Base):
 
     # A folder contains subfolders
     parent = relationship("Folder", remote_side=[id], back_populates="children")
-    children = relationship("Folder", back_populates="parent")
\ No newline at end of file
+    children = relationship("Folder", back_populates="parent")
+
+    # Subfolder listings and duplicate-name checks under a parent
+    __table_args__ = (
+        Index("ix_folders_user_parent_name", user_id, parent_id, name),
+    )
\ No newline at end of file
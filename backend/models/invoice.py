@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, BigInteger, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.sql import func
 from core.database import Base
 
@@ -32,6 +32,11 @@ class Invoice(Base):
     # Detailed breakdown (JSON field)
     details = Column(JSON, nullable=True)  # Store file-by-file breakdown
 
+    __table_args__ = (
+        # One invoice per user and billing period
+        Index("uq_invoices_user_period", user_id, billing_year, billing_month, unique=True),
+    )
+
 
 class StripeCustomer(Base):
     """Map users to Stripe customer IDs"""
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from sqlalchemy.sql import func
+from core.database import Base
+from datetime import datetime
+
+
+class S3PurgeQueue(Base):
+    """S3 keys whose database rows are gone and whose objects still have to be deleted"""
+    __tablename__ = "s3_purge_queue"
+
+    id = Column(Integer, primary_key=True)
+    file_key = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    enqueued_at = Column(DateTime(timezone=True), server_default=func.now())
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # The worker picks up due pending rows in order
+    __table_args__ = (
+        Index("ix_s3_purge_queue_status_next_attempt", status, next_attempt_at, id),
+    )
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, BigInteger, DateTime
+from sqlalchemy.sql import func
+from core.database import Base
+
+
+class StorageBlob(Base):
+    """One stored S3 object per distinct content of a user, shared by every file row with that hash"""
+    __tablename__ = "storage_blobs"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    content_hash = Column(String(64), primary_key=True)  # SHA-256, hex
+    file_key = Column(String, nullable=False, unique=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # user_files rows pointing at file_key
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
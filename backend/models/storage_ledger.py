@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, BigInteger, DateTime, Float, Index
+from core.database import Base
+from datetime import datetime
+
+
+class StorageEvent(Base):
+    """Append-only log of changes to a user's stored bytes, the source of truth for billing"""
+    __tablename__ = "storage_events"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    file_id = Column(Integer, nullable=True)  # user_files.id; the row itself may be gone
+    event_type = Column(String, nullable=False)  # upload, delete or resize
+    byte_delta = Column(BigInteger, nullable=False)
+    occurred_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_storage_events_user_occurred", user_id, occurred_at, id),
+    )
+
+
+class StorageUsageMonth(Base):
+    """
+    Running byte-seconds of one user in one calendar month (UTC), advanced on
+    every storage event. Usage up to any later moment is byte_seconds plus
+    active_bytes times the seconds since accounted_seconds.
+    """
+    __tablename__ = "storage_usage_months"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    active_bytes = Column(BigInteger, nullable=False, default=0)  # Bytes stored after the last event
+    byte_seconds = Column(Float, nullable=False, default=0)
+    accounted_seconds = Column(Float, nullable=False, default=0)  # Seconds into the month byte_seconds covers
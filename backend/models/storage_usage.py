@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, ForeignKey, BigInteger, DateTime
+from sqlalchemy.sql import func
+from core.database import Base
+
+
+class UserStorageUsage(Base):
+    """Running totals of a user's live files, maintained on every upload and delete"""
+    __tablename__ = "user_storage_usage"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    file_count = Column(BigInteger, nullable=False, default=0)
+    total_bytes = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class FolderStorageUsage(Base):
+    """Running totals of the live files directly inside one folder"""
+    __tablename__ = "folder_storage_usage"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    folder_id = Column(Integer, primary_key=True)  # 0 for files at the root
+    file_count = Column(BigInteger, nullable=False, default=0)
+    total_bytes = Column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, BigInteger, DateTime, Index
+from sqlalchemy.sql import func
+from core.database import Base
+
+
+class UploadSession(Base):
+    """A resumable upload in progress, backed by an S3 multipart upload"""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True)  # Random token the client uses in the URLs
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    folder_id = Column(Integer, ForeignKey("folders.id"), nullable=True)
+    filename = Column(String, nullable=False)
+    file_size = Column(BigInteger, nullable=False)
+    part_size = Column(BigInteger, nullable=False)
+    file_key = Column(String, nullable=False)
+    s3_upload_id = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime, nullable=False)  # Pushed back on every chunk received
+
+    # The cleanup job looks up expired sessions
+    __table_args__ = (
+        Index("ix_upload_sessions_expires_at", expires_at),
+    )
+
+
+class UploadSessionPart(Base):
+    """A chunk of an upload session that S3 has accepted as a multipart part"""
+    __tablename__ = "upload_session_parts"
+
+    session_id = Column(String(32), ForeignKey("upload_sessions.id"), primary_key=True)
+    part_number = Column(Integer, primary_key=True)
+    etag = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)
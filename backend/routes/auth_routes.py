@@ -1,56 +1,67 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from core.database import get_db
+from core.database import get_async_db, get_db
 from models import User
 from schemas.auth_schemas import RegisterSchema, UserResponse, LoginSchema, LoginResponse
-from core.security import hash_password, verify_password, create_access_token, get_current_user, generate_verification_token, generate_verification_link
-from services.email_service import send_verification_email
+from core.security import hash_password, verify_password, run_password_hashing, create_access_token, get_current_user, generate_verification_token, generate_verification_link
+from services.email_service import enqueue_verification_email
+from services.user_cache import authenticated_user_cache
 
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
 
 @router.post("/register", response_model=UserResponse)
-def register(payload: RegisterSchema, db: Session = Depends(get_db)):
+async def register(payload: RegisterSchema, db: AsyncSession = Depends(get_async_db)):
 
     if payload.password != payload.confirm_password:
         raise HTTPException(status_code=400, detail="Passwords don't match try again")
 
     # Check duplicate email
-    existing = db.query(User).filter(User.email == payload.email.lower()).first()
+    existing = await db.scalar(select(User.id).where(User.email == payload.email.lower()))
     if existing:
         raise HTTPException(status_code=400, detail="Email already taken")
+    # Hand the connection back to the pool while the password is hashed
+    await db.rollback()
+    hashed_password = await run_password_hashing(hash_password, payload.password)
 
     # Create new user
     new_user = User(
         email=payload.email.lower(),
-        password=hash_password(payload.password),
+        password=hashed_password,
         name=payload.name.capitalize(),
         is_verified=False,
         verification_token=generate_verification_token()
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-
-    # Send email verification
-    send_verification_email(
+    # Queued in the same transaction; the background sender delivers it
+    await db.run_sync(
+        enqueue_verification_email,
         to=new_user.email,
         name=new_user.name,
         link=generate_verification_link(new_user.verification_token)
     )
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
 
 @router.post("/login", response_model=LoginResponse)
-def login(payload: LoginSchema, db: Session = Depends(get_db)):
+async def login(payload: LoginSchema, db: AsyncSession = Depends(get_async_db)):
     # Look up user by email
-    user = db.query(User).filter(User.email == payload.email.lower()).first()
-
-    if not user or not verify_password(payload.password, user.password):
+    user = (await db.execute(
+        select(User.id, User.name, User.email, User.password, User.is_verified)
+        .where(User.email == payload.email.lower())
+    )).first()
+    # Hand the connection back to the pool while the password is checked
+    await db.rollback()
+
+    if not user or not await run_password_hashing(verify_password, payload.password, user.password):
         raise HTTPException(status_code=400, detail="Invalid email or password")
 
     if not user.is_verified:
@@ -59,7 +70,7 @@ def login(payload: LoginSchema, db: Session = Depends(get_db)):
             detail="Email not verified. Please check your inbox."
         )
 
-    token = create_access_token(user.email)
+    token = create_access_token(user.email, user.id)
 
     return LoginResponse(
         access_token=token,
@@ -93,5 +104,6 @@ def verify_account(token: str, db: Session = Depends(get_db)):
     user.is_verified = True
     user.verification_token = None
     db.commit()
+    authenticated_user_cache.invalidate(user.id)
 
     return {"message": "Email verified successfully"}
@@ -1,25 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 from typing import List
 import os
 
+import numpy as np
+
 from core.database import get_db
 from core.security import get_current_user
-from models.user import User
-from models.file import UserFile, FileStorageHistory
 from models.invoice import Invoice, StripeCustomer
+from services.billing_engine import PRICE_PER_GB_CENTS, PRICE_PER_GB_DAY_CENTS, file_usage, load_file_columns
+from services.storage_ledger import get_month_usage, to_gb_days
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/billing", tags=["Billing"])
 
-# Pricing configuration (AWS S3 Standard Storage pricing)
-PRICE_PER_GB_CENTS = 2.3  # $0.023 per GB per month (first 50 TB tier)
-DAYS_PER_MONTH = 30  # Average days in a month
-PRICE_PER_GB_DAY_CENTS = PRICE_PER_GB_CENTS / DAYS_PER_MONTH  # Cost per GB-day
-
-
 def calculate_gb_days(file_size_bytes: int, days: float) -> float:
     """Calculate GB-days for a file"""
     gb = file_size_bytes / (1024 ** 3)  # Convert bytes to GB
@@ -81,77 +78,51 @@ def test_billing():
     return {"status": "ok", "message": "Billing routes are working"}
 
 
+def get_files_breakdown(db: Session, user_id: int, month_start: datetime, now: datetime):
+    """Per-file usage this month: (live files, files deleted this month)."""
+    files = load_file_columns(db, user_id, month_start, now)
+    usage = file_usage(files, month_start, now, PRICE_PER_GB_DAY_CENTS)
+    
+    live = np.isnat(files.deleted)
+    # Deleted files are pro-rated
+    deleted = ~live & (usage.days_stored > 0)
+    
+    def breakdown(mask):
+        return [
+            {"filename": filename, "size_gb": size_gb, "days_stored": days_stored, "cost_this_month": cost}
+            for filename, size_gb, days_stored, cost in zip(
+                files.filenames[mask].tolist(), usage.size_gb[mask].tolist(),
+                usage.days_stored[mask].tolist(), usage.cost_cents[mask].tolist()
+            )
+        ]
+    
+    return breakdown(live), breakdown(deleted)
+
+
 @router.get("/usage", response_model=BillingUsageResponse)
 def get_current_usage(
+    include_files: bool = True,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user = Depends(get_current_user)
 ):
-    """Get current month's storage usage and projected cost"""
+    """
+    Get current month's storage usage and cost so far.
+    Totals come from the storage ledger in constant time; the per-file
+    breakdown scans the user's files, so callers that only need the totals
+    pass include_files=false.
+    """
     now = datetime.utcnow()
     month_start = datetime(now.year, now.month, 1)
     
-    # Get all active files
-    active_files = db.query(UserFile).filter(
-        UserFile.user_id == current_user.id,
-        UserFile.deleted_at.is_(None)
-    ).all()
-    
-    # Get files deleted this month
-    deleted_files = db.query(UserFile).filter(
-        UserFile.user_id == current_user.id,
-        UserFile.deleted_at.isnot(None),
-        UserFile.deleted_at >= month_start
-    ).all()
+    byte_seconds, _ = get_month_usage(db, current_user.id, now.year, now.month, now)
+    total_gb_days = to_gb_days(byte_seconds)
     
-    total_cost_cents = 0
-    total_gb_days = 0.0
-    active_files_breakdown = []
-    deleted_files_breakdown = []
-    
-    # Calculate cost for active files
-    for file in active_files:
-        upload_time = file.uploaded_at.replace(tzinfo=None) if file.uploaded_at.tzinfo else file.uploaded_at
-        start_time = max(upload_time, month_start)
-        days_stored = (now - start_time).total_seconds() / 86400  # 86400 seconds in a day
-        
-        gb_days = calculate_gb_days(file.file_size, days_stored)
-        cost_cents = calculate_storage_cost(gb_days)
-        
-        total_gb_days += gb_days
-        total_cost_cents += cost_cents
-        
-        active_files_breakdown.append({
-            "filename": file.filename,
-            "size_gb": file.file_size / (1024 ** 3),
-            "days_stored": days_stored,
-            "cost_this_month": cost_cents
-        })
-    
-    # Calculate cost for deleted files (pro-rated)
-    for file in deleted_files:
-        upload_time = file.uploaded_at.replace(tzinfo=None) if file.uploaded_at.tzinfo else file.uploaded_at
-        delete_time = file.deleted_at.replace(tzinfo=None) if file.deleted_at.tzinfo else file.deleted_at
-        
-        start_time = max(upload_time, month_start)
-        end_time = min(delete_time, now)
-        days_stored = (end_time - start_time).total_seconds() / 86400
-        
-        if days_stored > 0:
-            gb_days = calculate_gb_days(file.file_size, days_stored)
-            cost_cents = calculate_storage_cost(gb_days)
-            
-            total_gb_days += gb_days
-            total_cost_cents += cost_cents
-            
-            deleted_files_breakdown.append({
-                "filename": file.filename,
-                "size_gb": file.file_size / (1024 ** 3),
-                "days_stored": days_stored,
-                "cost_this_month": cost_cents
-            })
+    active_files_breakdown, deleted_files_breakdown = [], []
+    if include_files:
+        active_files_breakdown, deleted_files_breakdown = get_files_breakdown(db, current_user.id, month_start, now)
     
     return BillingUsageResponse(
-        current_month_cost=total_cost_cents,
+        current_month_cost=calculate_storage_cost(total_gb_days),
         current_month_gb_hours=total_gb_days,  # Field name kept for compatibility
         active_files=active_files_breakdown,
         deleted_files=deleted_files_breakdown
@@ -161,7 +132,7 @@ def get_current_usage(
 @router.get("/invoices", response_model=List[InvoiceResponse])
 def get_invoices(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user = Depends(get_current_user)
 ):
     """Get all invoices for the current user"""
     invoices = db.query(Invoice).filter(
@@ -188,7 +159,7 @@ def get_invoices(
 def get_invoice_detail(
     invoice_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user = Depends(get_current_user)
 ):
     """Get detailed invoice information"""
     invoice = db.query(Invoice).filter(
@@ -220,11 +191,12 @@ def generate_invoice(
     year: int = None,
     month: int = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user = Depends(get_current_user)
 ):
     """
     Generate an invoice for a specific billing period.
     Defaults to previous month if no period specified.
+    Month-end invoices for all users come from services.invoice_batch.
     """
     start_date, end_date = get_billing_period(year, month)
     billing_year = start_date.year
@@ -240,52 +212,32 @@ def generate_invoice(
     if existing:
         raise HTTPException(status_code=400, detail="Invoice already exists for this period")
     
-    # Get all files (active and deleted) for the billing period
-    all_files = db.query(UserFile).filter(
-        UserFile.user_id == current_user.id,
-        UserFile.uploaded_at < end_date
-    ).all()
+    # Totals come from the storage ledger, which still counts files whose
+    # rows were compacted away after deletion
+    byte_seconds, _ = get_month_usage(db, current_user.id, billing_year, billing_month, end_date)
+    total_gb_days = to_gb_days(byte_seconds)
+    total_cost_cents = calculate_storage_cost(total_gb_days)
     
-    total_gb_days = 0.0
-    total_cost_cents = 0
-    file_details = []
-    
-    for file in all_files:
-        upload_time = file.uploaded_at.replace(tzinfo=None) if file.uploaded_at.tzinfo else file.uploaded_at
-        
-        # Determine when file was deleted (if at all)
-        if file.deleted_at:
-            delete_time = file.deleted_at.replace(tzinfo=None) if file.deleted_at.tzinfo else file.deleted_at
-            # Skip if deleted before billing period
-            if delete_time < start_date:
-                continue
-            end_time = min(delete_time, end_date)
-        else:
-            end_time = end_date
-        
-        # Calculate days stored during billing period
-        start_time = max(upload_time, start_date)
-        if start_time >= end_date:
-            continue  # File uploaded after billing period
-        
-        days_stored = (end_time - start_time).total_seconds() / 86400
-        
-        if days_stored > 0:
-            gb_days = calculate_gb_days(file.file_size, days_stored)
-            cost_cents = calculate_storage_cost(gb_days)
-            
-            total_gb_days += gb_days
-            total_cost_cents += cost_cents
-            
-            file_details.append({
-                "filename": file.filename,
-                "size_bytes": file.file_size,
-                "size_gb": file.file_size / (1024 ** 3),
-                "days_stored": days_stored,
-                "gb_days": gb_days,
-                "cost_cents": cost_cents,
-                "was_deleted": file.deleted_at is not None
-            })
+    # Per-file breakdown of the files (live and deleted) still in user_files
+    files = load_file_columns(db, current_user.id, start_date, end_date)
+    usage = file_usage(files, start_date, end_date, PRICE_PER_GB_DAY_CENTS)
+    stored = usage.days_stored > 0
+    file_details = [
+        {
+            "filename": filename,
+            "size_bytes": size_bytes,
+            "size_gb": size_gb,
+            "days_stored": days_stored,
+            "gb_days": gb_days,
+            "cost_cents": cost_cents,
+            "was_deleted": was_deleted
+        }
+        for filename, size_bytes, size_gb, days_stored, gb_days, cost_cents, was_deleted in zip(
+            files.filenames[stored].tolist(), files.sizes[stored].tolist(), usage.size_gb[stored].tolist(),
+            usage.days_stored[stored].tolist(), usage.gb_days[stored].tolist(),
+            usage.cost_cents[stored].tolist(), (~np.isnat(files.deleted[stored])).tolist()
+        )
+    ]
     
     # Create invoice
     invoice = Invoice(
@@ -305,7 +257,12 @@ def generate_invoice(
     )
     
     db.add(invoice)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Generated concurrently by another request or the batch job
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Invoice already exists for this period")
     db.refresh(invoice)
     
     return {
@@ -320,7 +277,7 @@ def generate_invoice(
 def delete_invoice(
     invoice_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user = Depends(get_current_user)
 ):
     """
     Delete an invoice (admin function).
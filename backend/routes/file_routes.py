@@ -1,23 +1,149 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form, Query, Request, Response
 from typing import List
+from fastapi.responses import StreamingResponse
+from botocore.exceptions import ClientError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from io import BytesIO
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import hashlib
+import os
+from urllib.parse import quote
 
 from core.security import get_current_user
-from core.database import get_db
-from models import User, UserFile, FileStorageHistory, Folder
-from schemas.file_schemas import FileDetailResponse, FileListItem
-from services.s3_client import upload_file_to_s3, delete_file_from_s3, generate_presigned_url, generate_download_url, copy_file_in_s3, copy_file_in_s3
-from datetime import datetime, timedelta
-
+from core.database import get_async_db, get_db
+from models import User, UserFile, Folder, UploadSession
+from schemas.file_schemas import FileDetailResponse, FileListItem, FileUrlsRequest, FileUrls, PresignUploadRequest, PresignUploadResponse, CompleteUploadRequest, AbortUploadRequest
+from schemas.file_schemas import BulkMoveRequest, BulkDeleteRequest, BulkRenameRequest, BulkItemResult
+from schemas.file_schemas import UploadSessionRequest, UploadSessionStatus, CompleteUploadSessionRequest
+from services.s3_client import upload_file_to_s3, delete_file_from_s3, delete_files_from_s3, generate_presigned_url, generate_download_url, guess_content_type
+from services.s3_client import (
+    PRESIGNED_MULTIPART_THRESHOLD, PRESIGNED_UPLOAD_EXPIRES, get_multipart_part_size, generate_upload_url,
+    create_multipart_upload, generate_upload_part_url, complete_multipart_upload, abort_multipart_upload, head_file_in_s3,
+    upload_part
+)
+from services.upload_service import upload_executor, upload_files_concurrently
+from services.upload_sessions import (
+    chunk_size_at, create_upload_session, delete_upload_session, get_parts, part_count, part_for_chunk, record_part,
+    spool_chunk, upload_session_status
+)
+from services.file_records import new_file_key, is_file_key_of_user, find_existing_filenames, insert_file_records, paginate_files, soft_delete_files
+from services.blob_store import HashingReader, acquire_blob
+from services.purge_queue import enqueue_s3_deletes, referenced_keys
+from services.bulk_file_ops import bulk_delete_files, bulk_move_files, bulk_rename_files
+from services.object_cache import read_object_range
+from services.storage_ledger import get_month_usage, month_bounds, to_gb_days
+from datetime import datetime, timezone
+
+# Routes that run on the event loop use the AsyncSession (get_async_db), so a
+# slow query doesn't hold up other requests. The ones that also make blocking
+# S3 calls stay plain `def` routes on get_db and run on FastAPI's threadpool.
 router = APIRouter(prefix="/files", tags=["Files"])
 
+# Largest page a listing returns, and most ids accepted by /files/urls and /files/bulk/*
+MAX_PAGE_SIZE = 1000
+
+
+def get_upload_size(file: UploadFile) -> int:
+    """Size of an uploaded file in bytes, measured on its spool without reading it."""
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    (start, end) of a single "bytes=" range, inclusive and clamped to the file.
+    None for headers served as the whole file (other units, several ranges,
+    malformed). Raises ValueError if the range lies outside the file.
+    """
+    unit, _, spec = header.partition("=")
+    first, dash, last = spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or "," in spec or not dash:
+        return None
+    if not (first.isdigit() or first == "") or not (last.isdigit() or last == "") or first == last == "":
+        return None
+
+    if first == "":
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def file_etag(file: UserFile) -> str:
+    """Strong ETag for a file's content, which never changes for a given file id."""
+    return f'"{file.content_hash or hashlib.sha256(file.file_key.encode()).hexdigest()}"'
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header matches the ETag (weak comparison, as RFC 9110 asks)."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+async def get_files_page(db: AsyncSession, filters: list, limit: int | None, cursor: str | None, response: Response):
+    """Page through the user's files matching `filters` and expose the next cursor in the X-Next-Cursor header."""
+    def page(sync_db: Session):
+        return paginate_files(sync_db.query(UserFile).filter(*filters), limit, cursor)
+
+    try:
+        files, next_cursor = await db.run_sync(page)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return files
+
+
+def file_list_item(file: UserFile, include_urls: bool = True) -> dict:
+    """Listing entry for a file, with uploaded_at as a UTC ISO timestamp."""
+    uploaded_at = file.uploaded_at
+    if isinstance(uploaded_at, str):
+        try:
+            dt = datetime.strptime(uploaded_at, "%Y-%m-%d %H:%M:%S")
+            uploaded_at = dt.replace(tzinfo=timezone.utc).isoformat()
+        except ValueError:
+            pass
+    elif isinstance(uploaded_at, datetime):
+        if uploaded_at.tzinfo is None:
+            uploaded_at = uploaded_at.replace(tzinfo=timezone.utc)
+        uploaded_at = uploaded_at.isoformat()
+
+    item = {
+        "id": file.id,
+        "filename": file.filename,
+        "file_size": file.file_size,
+        "uploaded_at": uploaded_at,
+        "folder_id": file.folder_id
+    }
+    if include_urls:
+        item["preview_url"] = generate_presigned_url(file.file_key, filename=file.filename)
+        item["download_url"] = generate_download_url(file.file_key, file.filename)
+    return item
+
+
 @router.post("/upload")
 async def upload_files(
     files: List[UploadFile] = File(...),
     folder_id: int | None = None,
     folder_name: str | None = Form(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     uploaded = []
@@ -28,11 +154,11 @@ async def upload_files(
     # If folder_name is provided, create a new folder and use its ID
     if folder_name:
         # Check if folder already exists under root
-        existing = db.query(Folder).filter(
+        existing = await db.scalar(select(Folder).where(
             Folder.user_id == current_user.id,
             Folder.parent_id == None,
             Folder.name == folder_name
-        ).first()
+        ))
         
         if existing:
             folder_id = existing.id
@@ -44,175 +170,477 @@ async def upload_files(
                 parent_id=None
             )
             db.add(new_folder)
-            db.commit()
-            db.refresh(new_folder)
+            await db.commit()
+            await db.refresh(new_folder)
             folder_id = new_folder.id
 
+    # Validate the whole batch before anything is stored
+    pending = []
+    batch_names = set()
     for file in files:
         filename = file.filename
         # Extract just the basename from the filename (in case it contains path separators)
-        import os
         filename = os.path.basename(filename)
         
-        if folder_id:
-            key = f"users/{current_user.id}/folders/{folder_id}/{filename}"
-        else:
-            key = f"users/{current_user.id}/{filename}"
-
-        # Check if file with same name already exists for this user in the same folder
-        existing_file = (
-            db.query(UserFile)
-            .filter(
-                UserFile.user_id == current_user.id,
-                UserFile.filename == filename,
-                UserFile.folder_id == folder_id,
-                UserFile.deleted_at.is_(None)
-            )
-            .first()
-        )
-        
-        if existing_file:
+        key = new_file_key(current_user.id)
+
+        if filename in batch_names:
             raise HTTPException(
                 status_code=400, 
                 detail=f"File '{filename}' already exists in this location. Please rename the file or delete the existing one first."
             )
+        batch_names.add(filename)
 
-        # ✅ Read file into memory
-        file_bytes = await file.read()
-        buffer = BytesIO(file_bytes)
+        # ✅ Get the size from the spooled upload without reading it into memory
+        file_size = get_upload_size(file)
 
         # Reject empty files
-        if len(file_bytes) == 0:
+        if file_size == 0:
             raise HTTPException(status_code=400, detail=f"File {filename} is empty")
 
-        # ✅ Save metadata to DB first
-        db_file = UserFile(
-            user_id=current_user.id,
-            filename=filename,
-            file_key=key,
-            file_size=len(file_bytes),
-            folder_id=folder_id
-        )
-        db.add(db_file)
-        
-        try:
-            db.commit()
-            db.refresh(db_file)
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-        
-        # ✅ Only upload to S3 after successful DB commit
-        try:
-            upload_file_to_s3(buffer, key)
-        except Exception as e:
-            # If S3 upload fails, delete the DB record
-            db.delete(db_file)
-            db.commit()
-            raise HTTPException(status_code=500, detail=f"S3 upload failed: {str(e)}")
+        pending.append((file, filename, key, file_size))
 
-        uploaded.append({
-            "file_id": db_file.id,
-            "filename": filename
-        })
+    # Check the whole batch against existing files with a single query
+    existing_names = await db.run_sync(find_existing_filenames, current_user.id, folder_id, [p[1] for p in pending])
+    for _, filename, _, _ in pending:
+        if filename in existing_names:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"File '{filename}' already exists in this location. Please rename the file or delete the existing one first."
+            )
+
+    # ✅ Upload to S3 several files at a time, hashing the content on the way
+    readers = []
+    for file, _, _, _ in pending:
+        file.file.seek(0)
+        readers.append(HashingReader(file.file))
+    errors = await upload_files_concurrently(
+        [(reader, key) for reader, (_, _, key, _) in zip(readers, pending)],
+        upload_file_to_s3
+    )
+    stored = [(item, reader) for item, reader, error in zip(pending, readers, errors) if error is None]
+
+    # ✅ Save metadata for every stored file in one statement and one commit.
+    # Content the user already has is kept once: the file points at the
+    # existing object and the copy just uploaded is queued for deletion.
+    def save_records(sync_db: Session) -> list[int]:
+        return insert_file_records(sync_db, [
+            {
+                "user_id": current_user.id,
+                "filename": filename,
+                "file_key": acquire_blob(sync_db, current_user.id, reader.hexdigest(), key, file_size),
+                "file_size": file_size,
+                "content_hash": reader.hexdigest(),
+                "folder_id": folder_id
+            }
+            for (_, filename, key, file_size), reader in stored
+        ])
+
+    try:
+        file_ids = await db.run_sync(save_records)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        # Remove the objects we just stored so S3 doesn't keep orphans, but
+        # never one that a committed file points at
+        try:
+            keys = [key for (_, _, key, _), _ in stored]
+            in_use = await db.run_sync(referenced_keys, keys)
+            await run_in_threadpool(delete_files_from_s3, [key for key in keys if key not in in_use])
+        except Exception:
+            pass
+        if isinstance(e, IntegrityError):
+            # Another request stored a file with one of these names first
+            raise HTTPException(
+                status_code=400,
+                detail="A file with one of these names already exists in this location. Please rename the file or delete the existing one first."
+            )
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    ids_by_name = {item[1]: file_id for (item, _), file_id in zip(stored, file_ids)}
+    for (_, filename, _, _), error in zip(pending, errors):
+        if error is None:
+            uploaded.append({
+                "file_id": ids_by_name[filename],
+                "filename": filename,
+                "status": "uploaded"
+            })
+        else:
+            uploaded.append({
+                "file_id": None,
+                "filename": filename,
+                "status": "failed",
+                "error": f"S3 upload failed: {str(error)}"
+            })
+
+    failed = [item for item in uploaded if item["status"] == "failed"]
+    if len(failed) == len(uploaded):
+        raise HTTPException(status_code=500, detail=failed[0]["error"])
+    if failed:
+        return {"message": f"{len(failed)} of {len(uploaded)} files failed to upload", "uploaded": uploaded}
 
     return {"message": "Files uploaded successfully", "uploaded": uploaded}
 
-@router.get("/billing")
-async def get_billing(
+@router.post("/presign", response_model=PresignUploadResponse)
+def presign_upload(
+    payload: PresignUploadRequest,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    MONTHLY_RATE = 0.023  # cost per GB per month
-    now = datetime.utcnow()
+    """
+    Start a direct-to-S3 upload. Small files get a single presigned PUT URL,
+    large files get a multipart upload with one presigned URL per part.
+    The client then calls /files/complete to register the file.
+    """
+    filename = os.path.basename(payload.filename)
+    if not filename:
+        raise HTTPException(status_code=400, detail="Filename cannot be empty")
+    if payload.file_size <= 0:
+        raise HTTPException(status_code=400, detail=f"File {filename} is empty")
 
-    def safe_date(value):
-        if value is None:
-            return None
-        if isinstance(value, datetime):
-            return value.date()
-        if isinstance(value, str):
-            try:
-                return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").date()
-            except:
-                try:
-                    return datetime.fromisoformat(value).date()
-                except:
-                    return None
-        return None
+    if payload.folder_id is not None:
+        folder = db.query(Folder).filter(
+            Folder.id == payload.folder_id,
+            Folder.user_id == current_user.id
+        ).first()
+        if not folder:
+            raise HTTPException(status_code=404, detail="Folder not found")
 
-    billing_start = datetime(now.year, now.month, 1).date()
+    if find_existing_filenames(db, current_user.id, payload.folder_id, [filename]):
+        raise HTTPException(
+            status_code=400,
+            detail=f"File '{filename}' already exists in this location. Please rename the file or delete the existing one first."
+        )
 
-    if now.month == 12:
-        next_month = datetime(now.year + 1, 1, 1)
-    else:
-        next_month = datetime(now.year, now.month + 1, 1)
+    key = new_file_key(current_user.id)
 
-    billing_end = (next_month - timedelta(seconds=1)).date()
-    month_days = (billing_end - billing_start).days + 1
-    DAILY_RATE = MONTHLY_RATE / month_days
+    if payload.file_size <= PRESIGNED_MULTIPART_THRESHOLD:
+        return {
+            "method": "put",
+            "key": key,
+            "expires_in": PRESIGNED_UPLOAD_EXPIRES,
+            "upload_url": generate_upload_url(key, payload.content_type)
+        }
 
-    # Get active files
-    active_files = db.query(UserFile).filter(
-        UserFile.user_id == current_user.id
-    ).all()
+    part_size = get_multipart_part_size(payload.file_size)
+    part_count = (payload.file_size + part_size - 1) // part_size
+    upload_id = create_multipart_upload(key, payload.content_type)
 
-    # Get historical files (deleted this month)
-    historical_files = db.query(FileStorageHistory).filter(
-        FileStorageHistory.user_id == current_user.id
-    ).all()
+    return {
+        "method": "multipart",
+        "key": key,
+        "expires_in": PRESIGNED_UPLOAD_EXPIRES,
+        "upload_id": upload_id,
+        "part_size": part_size,
+        "parts": [
+            {"part_number": n, "upload_url": generate_upload_part_url(key, upload_id, n)}
+            for n in range(1, part_count + 1)
+        ]
+    }
 
-    actual_cost = 0
-    estimated_cost = 0
+@router.post("/complete")
+def complete_upload(
+    payload: CompleteUploadRequest,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Finish a direct-to-S3 upload: complete the multipart upload if there is one,
+    verify the stored object with a HEAD request, then create the file record.
+    """
+    filename = os.path.basename(payload.filename)
+    if not filename:
+        raise HTTPException(status_code=400, detail="Filename cannot be empty")
 
-    # Calculate for active files
-    for f in active_files:
-        file_upload_day = safe_date(f.uploaded_at)
+    if payload.folder_id is not None:
+        folder = db.query(Folder).filter(
+            Folder.id == payload.folder_id,
+            Folder.user_id == current_user.id
+        ).first()
+        if not folder:
+            raise HTTPException(status_code=404, detail="Folder not found")
+
+    # The key must be one /files/presign issues for this user, and not already in use
+    key = payload.key
+    if not is_file_key_of_user(key, current_user.id) or db.query(UserFile.id).filter(UserFile.file_key == key).first():
+        raise HTTPException(status_code=400, detail="Upload key does not match this file")
+
+    expected_etag = payload.etag
+    if payload.upload_id:
+        if not payload.parts:
+            raise HTTPException(status_code=400, detail="Multipart upload has no parts")
+        try:
+            expected_etag = complete_multipart_upload(
+                key,
+                payload.upload_id,
+                [{"PartNumber": p.part_number, "ETag": p.etag} for p in payload.parts]
+            )
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to complete multipart upload: {str(e)}")
+
+    head = head_file_in_s3(key)
+    if head is None:
+        raise HTTPException(status_code=400, detail="Uploaded object not found in S3")
+
+    if head["ContentLength"] != payload.file_size or (
+        expected_etag and head["ETag"].strip('"') != expected_etag.strip('"')
+    ):
+        # Don't keep objects that don't match what the client declared
+        delete_file_from_s3(key)
+        raise HTTPException(status_code=400, detail="Uploaded object does not match the declared size or ETag")
+
+    # From here on the object exists; a rejected upload queues it for deletion
+    if find_existing_filenames(db, current_user.id, payload.folder_id, [filename]):
+        enqueue_s3_deletes(db, [key])
+        db.commit()
+        raise HTTPException(
+            status_code=400,
+            detail=f"File '{filename}' already exists in this location. Please rename the file or delete the existing one first."
+        )
 
-        if not file_upload_day:
-            continue  # skip any corrupted rows
+    try:
+        file_id = insert_file_records(db, [{
+            "user_id": current_user.id,
+            "filename": filename,
+            "file_key": key,
+            "file_size": head["ContentLength"],
+            "folder_id": payload.folder_id
+        }])[0]
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        enqueue_s3_deletes(db, [key])
+        db.commit()
+        raise HTTPException(
+            status_code=400,
+            detail=f"File '{filename}' already exists in this location. Please rename the file or delete the existing one first."
+        )
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-        # Actual cost this month (from upload or billing start, whichever is later, until now)
-        actual_start = max(file_upload_day, billing_start)
-        actual_end = now.date()
-        chargeable_days_actual = (actual_end - actual_start).days + 1
-        if chargeable_days_actual < 1:
-            chargeable_days_actual = 0
+    return {"message": "File uploaded successfully", "file_id": file_id, "filename": filename}
 
-        gb_size = f.file_size / (1024**3)
-        actual_cost += gb_size * DAILY_RATE * chargeable_days_actual
+@router.post("/abort")
+def abort_upload(
+    payload: AbortUploadRequest,
+    current_user = Depends(get_current_user)
+):
+    """Abort a presigned multipart upload so S3 discards its parts."""
+    if not payload.key.startswith(f"users/{current_user.id}/"):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    abort_multipart_upload(payload.key, payload.upload_id)
+    return {"message": "Upload aborted"}
+
+def get_active_upload_session(db: Session, user_id: int, upload_id: str) -> UploadSession:
+    session = db.get(UploadSession, upload_id)
+    if not session or session.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if session.expires_at <= datetime.utcnow():
+        raise HTTPException(status_code=410, detail="Upload session has expired")
+    return session
+
+@router.post("/uploads", response_model=UploadSessionStatus)
+def start_upload_session(
+    payload: UploadSessionRequest,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Start a resumable upload. The client then PUTs the file in chunks of
+    `part_size` bytes to /files/uploads/{upload_id}?offset=..., and can
+    resume from `next_offset` after an interruption.
+    """
+    filename = os.path.basename(payload.filename)
+    if not filename:
+        raise HTTPException(status_code=400, detail="Filename cannot be empty")
+    if payload.file_size <= 0:
+        raise HTTPException(status_code=400, detail=f"File {filename} is empty")
 
-        # Estimated total cost (assumes file stays until end of month)
-        est_end = billing_end
-        chargeable_days_est = (est_end - actual_start).days + 1
-        if chargeable_days_est < 1:
-            chargeable_days_est = 0
+    if payload.folder_id is not None:
+        folder = db.query(Folder).filter(
+            Folder.id == payload.folder_id,
+            Folder.user_id == current_user.id
+        ).first()
+        if not folder:
+            raise HTTPException(status_code=404, detail="Folder not found")
 
-        estimated_cost += gb_size * DAILY_RATE * chargeable_days_est
+    if find_existing_filenames(db, current_user.id, payload.folder_id, [filename]):
+        raise HTTPException(
+            status_code=400,
+            detail=f"File '{filename}' already exists in this location. Please rename the file or delete the existing one first."
+        )
 
-    # Calculate for historical (deleted) files this month
-    for f in historical_files:
-        file_upload_day = safe_date(f.uploaded_at)
-        deletion_day = safe_date(f.deleted_at)
+    session = create_upload_session(
+        db, current_user.id, payload.folder_id, filename, payload.file_size, payload.content_type
+    )
+    db.commit()
+    return upload_session_status(db, session)
+
+@router.put("/uploads/{upload_id}", response_model=UploadSessionStatus)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Store one chunk of a resumable upload, sent as the raw request body.
+    Sending a chunk again replaces it, so a failed or cut-off chunk is
+    simply retried.
+    """
+    session = await db.run_sync(get_active_upload_session, current_user.id, upload_id)
 
-        if not file_upload_day or not deletion_day:
-            continue
+    try:
+        # Reject a wrong size before reading the body when the client declares it
+        declared = request.headers.get("content-length")
+        if declared is not None:
+            part_for_chunk(session, offset, int(declared))
+        # Parts of very large files are hundreds of MB; spool instead of buffering
+        body, length = await spool_chunk(request.stream(), chunk_size_at(session, offset))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    loop = asyncio.get_running_loop()
+    with body:
+        try:
+            part_number = part_for_chunk(session, offset, length)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            etag = await loop.run_in_executor(
+                upload_executor, upload_part, session.file_key, session.s3_upload_id, part_number, body
+            )
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"S3 upload failed: {str(e)}")
 
-        # Only include if file was active during this billing period
-        if deletion_day < billing_start:
-            continue  # File was deleted before this month
+    await db.run_sync(record_part, session, part_number, etag, length)
+    await db.commit()
+    return await db.run_sync(upload_session_status, session)
 
-        # Calculate cost for the period file was stored
-        actual_start = max(file_upload_day, billing_start)
-        actual_end = min(deletion_day, billing_end)
-        chargeable_days = (actual_end - actual_start).days + 1
-        if chargeable_days < 1:
-            chargeable_days = 0
+@router.get("/uploads/{upload_id}", response_model=UploadSessionStatus)
+def get_upload_session_status(
+    upload_id: str,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Which chunks have arrived, and the offset to resume from."""
+    session = get_active_upload_session(db, current_user.id, upload_id)
+    return upload_session_status(db, session)
+
+@router.post("/uploads/{upload_id}/complete")
+def complete_upload_session(
+    upload_id: str,
+    payload: CompleteUploadSessionRequest | None = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Assemble the chunks into the stored object and create the file record.
+    On a name conflict the session is kept, so the client can finalize
+    again with another filename.
+    """
+    session = get_active_upload_session(db, current_user.id, upload_id)
+    filename = os.path.basename(payload.filename) if payload and payload.filename else session.filename
+    if not filename:
+        raise HTTPException(status_code=400, detail="Filename cannot be empty")
+    # The target folder may have been deleted since the upload started
+    if session.folder_id is not None and not db.query(Folder.id).filter(
+        Folder.id == session.folder_id,
+        Folder.user_id == current_user.id
+    ).first():
+        raise HTTPException(status_code=404, detail="Folder not found")
+
+    parts = get_parts(db, session.id)
+    missing = part_count(session) - len(parts)
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Upload is missing {missing} of {part_count(session)} chunks")
+
+    if find_existing_filenames(db, current_user.id, session.folder_id, [filename]):
+        raise HTTPException(
+            status_code=400,
+            detail=f"File '{filename}' already exists in this location. Please rename the file or delete the existing one first."
+        )
+
+    try:
+        complete_multipart_upload(
+            session.file_key,
+            session.s3_upload_id,
+            [{"PartNumber": part.part_number, "ETag": part.etag} for part in parts]
+        )
+    except Exception as e:
+        # A retry after S3 assembled the object but before the record was saved
+        if head_file_in_s3(session.file_key) is None:
+            raise HTTPException(status_code=502, detail=f"Failed to complete upload: {str(e)}")
+
+    head = head_file_in_s3(session.file_key)
+    if head is None or head["ContentLength"] != session.file_size:
+        enqueue_s3_deletes(db, [session.file_key])
+        delete_upload_session(db, session.id)
+        db.commit()
+        raise HTTPException(status_code=400, detail="Uploaded object does not match the declared size")
+
+    try:
+        file_id = insert_file_records(db, [{
+            "user_id": current_user.id,
+            "filename": filename,
+            "file_key": session.file_key,
+            "file_size": session.file_size,
+            "folder_id": session.folder_id
+        }])[0]
+        delete_upload_session(db, session.id)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # The parts are assembled now, so the session can't be finalized again
+        enqueue_s3_deletes(db, [session.file_key])
+        delete_upload_session(db, upload_id)
+        db.commit()
+        raise HTTPException(
+            status_code=400,
+            detail=f"File '{filename}' already exists in this location. Please rename the file or delete the existing one first."
+        )
+
+    return {"message": "File uploaded successfully", "file_id": file_id, "filename": filename}
+
+@router.delete("/uploads/{upload_id}")
+def cancel_upload_session(
+    upload_id: str,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Abandon a resumable upload; S3 discards the chunks stored so far."""
+    session = db.get(UploadSession, upload_id)
+    if not session or session.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    abort_multipart_upload(session.file_key, session.s3_upload_id, missing_ok=True)
+    delete_upload_session(db, session.id)
+    db.commit()
+    return {"message": "Upload cancelled"}
+
+@router.get("/billing")
+async def get_billing(
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Cost of this month's storage so far, and the projected cost if the
+    files stored now stay until the end of the month. Read from the
+    storage ledger, so it doesn't scan the user's files.
+    """
+    MONTHLY_RATE = 0.023  # cost per GB per month
+    now = datetime.utcnow()
 
-        gb_size = f.file_size / (1024**3)
-        cost = gb_size * DAILY_RATE * chargeable_days
-        actual_cost += cost
-        estimated_cost += cost  # For deleted files, actual = estimated
+    month_start, next_month = month_bounds(now.year, now.month)
+    month_days = (next_month - month_start).days
+    DAILY_RATE = MONTHLY_RATE / month_days
+
+    byte_seconds, active_bytes = await db.run_sync(get_month_usage, current_user.id, now.year, now.month, now)
+    actual_cost = to_gb_days(byte_seconds) * DAILY_RATE
+    # Files stored now are charged until the end of the month
+    remaining_days = (next_month - now).total_seconds() / 86400
+    estimated_cost = actual_cost + active_bytes / (1024**3) * DAILY_RATE * remaining_days
 
     return {
         "daily_rate_per_gb": DAILY_RATE,
@@ -224,45 +652,95 @@ async def get_billing(
 @router.delete("/{file_id}")
 async def delete_file(
     file_id: int,
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_async_db), 
     current_user = Depends(get_current_user)
 ):
-    file_record = db.query(UserFile).filter(UserFile.user_id == current_user.id, UserFile.id == file_id).first()
+    file_record = await db.scalar(select(UserFile).where(
+        UserFile.user_id == current_user.id,
+        UserFile.id == file_id,
+        UserFile.deleted_at.is_(None)
+    ))
 
     if not file_record: 
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Delete from S3
-    delete_file_from_s3(file_record.file_key)
-
-    # Move to storage history for billing
-    history_record = FileStorageHistory(
-        user_id=file_record.user_id,
-        filename=file_record.filename,
-        file_key=file_record.file_key,
-        file_size=file_record.file_size,
-        uploaded_at=file_record.uploaded_at,
-        deleted_at=datetime.utcnow()
-    )
-    db.add(history_record)
-    
-    # Actually delete the file record from main table
-    db.delete(file_record)
-    db.commit()
+    # The row stays, marked deleted, for billing; the purge worker deletes
+    # the object from S3 once no file uses it
+    await db.run_sync(soft_delete_files, [file_record])
+    await db.commit()
 
     return {"message": "File deleted successfully"}
 
-@router.get("/{file_id}/download")
-async def download_file(
+@router.get("/{file_id}/stream")
+def stream_file(
     file_id: int,
+    request: Request,
+    download: bool = False,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
+    """
+    Serve the file's content through the API, for deployments where clients
+    can't reach S3. Supports a single byte range (Range, If-Range) and
+    If-None-Match; hot files are read from the node-local cache.
+    """
     file_record = db.query(UserFile).filter(
         UserFile.user_id == current_user.id,
-        UserFile.id == file_id
+        UserFile.id == file_id,
+        UserFile.deleted_at.is_(None)
     ).first()
 
+    if not file_record:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    etag = file_etag(file_record)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    size = file_record.file_size
+    start, end, status_code = 0, size - 1, 200
+    range_header = request.headers.get("range")
+    # If-Range: only send part of the file if the client's copy is still current
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            raise HTTPException(
+                status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"}
+            )
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    try:
+        chunks = read_object_range(file_record.file_key, size, start, end)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+            raise HTTPException(status_code=404, detail="File content not found")
+        raise HTTPException(status_code=502, detail=f"S3 read failed: {str(e)}")
+
+    disposition = "attachment" if download else "inline"
+    headers["Content-Length"] = str(end - start + 1)
+    # RFC 6266 form, so names outside latin-1 survive the header encoding
+    headers["Content-Disposition"] = f"{disposition}; filename*=UTF-8''{quote(file_record.filename)}"
+    return StreamingResponse(
+        chunks, status_code=status_code, media_type=guess_content_type(file_record.filename), headers=headers
+    )
+
+@router.get("/{file_id}/download")
+async def download_file(
+    file_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    file_record = await db.scalar(select(UserFile).where(
+        UserFile.user_id == current_user.id,
+        UserFile.id == file_id,
+        UserFile.deleted_at.is_(None)
+    ))
+
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found")
 
@@ -273,57 +751,118 @@ async def download_file(
 
 @router.get("/list", response_model=List[FileListItem])
 async def list_files(
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    include_urls: bool = True,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    List the user's files, newest first.
+    Pass `limit` to page through the results; the cursor for the next page
+    is returned in the X-Next-Cursor header. With include_urls=false no URLs
+    are signed; fetch them later for the visible files with POST /files/urls.
+    """
+    # Live files only, so the partial ix_user_files_user_uploaded index serves the page
+    filters = [UserFile.user_id == current_user.id, UserFile.deleted_at.is_(None)]
+    files = await get_files_page(db, filters, limit, cursor, response)
+
+    return [file_list_item(file, include_urls) for file in files]
+
+@router.post("/urls", response_model=List[FileUrls])
+async def get_file_urls(
+    payload: FileUrlsRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """Preview and download URLs for a batch of the user's files, in one request."""
+    if len(payload.file_ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} files per request")
+    if not payload.file_ids:
+        return []
+
+    files = (await db.execute(select(UserFile.id, UserFile.file_key, UserFile.filename).where(
+        UserFile.user_id == current_user.id,
+        UserFile.id.in_(payload.file_ids),
+        UserFile.deleted_at.is_(None)
+    ))).all()
+
+    return [
+        {
+            "id": f.id,
+            "preview_url": generate_presigned_url(f.file_key, filename=f.filename),
+            "download_url": generate_download_url(f.file_key, f.filename)
+        }
+        for f in files
+    ]
+
+def commit_bulk_results(db: Session, results: list[dict]) -> list[dict]:
+    """Commit a bulk operation; a concurrent change to the same names fails the whole batch."""
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="Files changed while the request was running. Please reload and try again."
+        )
+    return results
+
+@router.post("/bulk/move", response_model=List[BulkItemResult])
+def bulk_move(
+    payload: BulkMoveRequest,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    from datetime import timezone
-    
-    # Get all files for this user (deleted files are removed from this table)
-    files = (
-        db.query(UserFile)
-        .filter(UserFile.user_id == current_user.id)
-        .order_by(UserFile.uploaded_at.desc())
-        .all()
-    )
+    """Move many files into one folder (or the root) in a single transaction."""
+    if len(payload.file_ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} files per request")
+    if payload.folder_id is not None and not db.query(Folder.id).filter(
+        Folder.id == payload.folder_id,
+        Folder.user_id == current_user.id
+    ).first():
+        raise HTTPException(status_code=404, detail="Folder not found")
+
+    results = bulk_move_files(db, current_user.id, payload.file_ids, payload.folder_id)
+    return commit_bulk_results(db, results)
+
+@router.post("/bulk/delete", response_model=List[BulkItemResult])
+def bulk_delete(
+    payload: BulkDeleteRequest,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Delete many files in a single transaction; the S3 objects are purged in batches afterwards."""
+    if len(payload.file_ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} files per request")
 
-    # Convert uploaded_at to UTC ISO format for each file
-    result = []
-    for file in files:
-        uploaded_at = file.uploaded_at
-        if isinstance(uploaded_at, str):
-            try:
-                dt = datetime.strptime(uploaded_at, "%Y-%m-%d %H:%M:%S")
-                dt_utc = dt.replace(tzinfo=timezone.utc)
-                uploaded_at = dt_utc.isoformat()
-            except ValueError:
-                pass
-        elif isinstance(uploaded_at, datetime):
-            if uploaded_at.tzinfo is None:
-                uploaded_at = uploaded_at.replace(tzinfo=timezone.utc)
-            uploaded_at = uploaded_at.isoformat()
-        
-        result.append({
-            "id": file.id,
-            "filename": file.filename,
-            "file_size": file.file_size,
-            "uploaded_at": uploaded_at,
-            "preview_url": generate_presigned_url(file.file_key),
-            "download_url": generate_download_url(file.file_key, file.filename),
-            "folder_id": file.folder_id
-        })
-    
-    return result
+    results = bulk_delete_files(db, current_user.id, payload.file_ids)
+    return commit_bulk_results(db, results)
+
+@router.post("/bulk/rename", response_model=List[BulkItemResult])
+def bulk_rename(
+    payload: BulkRenameRequest,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Rename many files in a single transaction."""
+    if len(payload.items) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} files per request")
+
+    results = bulk_rename_files(db, current_user.id, [(item.file_id, item.new_filename) for item in payload.items])
+    return commit_bulk_results(db, results)
 
 @router.patch("/{file_id}/rename")
 async def rename_file(
     file_id: int,
     new_filename: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """
     Rename a file without re-uploading.
-    Updates the filename in the database and the S3 key.
+    Only the filename in the database changes; the S3 object stays where it is.
     """
     if not new_filename or not new_filename.strip():
         raise HTTPException(status_code=400, detail="Filename cannot be empty")
@@ -331,10 +870,9 @@ async def rename_file(
     new_filename = new_filename.strip()
     
     # Get the file record
-    file_record = (
-        db.query(UserFile)
-        .filter(UserFile.user_id == current_user.id, UserFile.id == file_id)
-        .first()
+    file_record = await db.scalar(
+        select(UserFile)
+        .where(UserFile.user_id == current_user.id, UserFile.id == file_id, UserFile.deleted_at.is_(None))
     )
     
     if not file_record:
@@ -342,16 +880,15 @@ async def rename_file(
     
     # Check if a file with the new name already exists in the same location
     # (excluding the current file being renamed)
-    existing_file = (
-        db.query(UserFile)
-        .filter(
+    existing_file = await db.scalar(
+        select(UserFile)
+        .where(
             UserFile.user_id == current_user.id,
             UserFile.filename == new_filename,
             UserFile.folder_id == file_record.folder_id,
             UserFile.deleted_at.is_(None),
             UserFile.id != file_id  # Exclude the current file
         )
-        .first()
     )
     
     if existing_file:
@@ -360,27 +897,11 @@ async def rename_file(
             detail=f"File '{new_filename}' already exists in this location. Please choose a different name."
         )
     
-    old_key = file_record.file_key
-    
-    # Generate new S3 key with the new filename
-    if file_record.folder_id:
-        new_key = f"users/{current_user.id}/folders/{file_record.folder_id}/{new_filename}"
-    else:
-        new_key = f"users/{current_user.id}/{new_filename}"
-    
-    try:
-        # Copy object to new key and delete old one
-        copy_file_in_s3(old_key, new_key)
-        delete_file_from_s3(old_key)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to rename file in S3: {str(e)}")
-    
-    # Update database record
+    # The S3 key doesn't contain the name, so renaming only touches the database
     file_record.filename = new_filename
-    file_record.file_key = new_key
     
-    db.commit()
-    db.refresh(file_record)
+    await db.commit()
+    await db.refresh(file_record)
     
     return {
         "id": file_record.id,
@@ -396,20 +917,19 @@ async def favicon():
 @router.get("/{file_id}", response_model=FileDetailResponse)
 async def get_file_details(
     file_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
-    file_record = (
-        db.query(UserFile)
-        .filter(UserFile.user_id == current_user.id, UserFile.id == file_id)
-        .first()
+    file_record = await db.scalar(
+        select(UserFile)
+        .where(UserFile.user_id == current_user.id, UserFile.id == file_id, UserFile.deleted_at.is_(None))
     )
 
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found")
 
     # Generate preview URL
-    preview_url = generate_presigned_url(file_record.file_key)
+    preview_url = generate_presigned_url(file_record.file_key, filename=file_record.filename)
 
     # Handle uploaded_at - ensure UTC timezone
     raw_time = file_record.uploaded_at
@@ -445,46 +965,21 @@ async def get_file_details(
         "uploaded_at": uploaded_at,
     }
 
-@router.get("/in-folder/{folder_id}")
-def get_files_in_folder(
+@router.get("/in-folder/{folder_id}", response_model=List[FileListItem])
+async def get_files_in_folder(
     folder_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    include_urls: bool = True,
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
-    from datetime import datetime, timezone
-
-    files = db.query(UserFile).filter(
+    filters = [
         UserFile.user_id == current_user.id,
-        UserFile.folder_id == folder_id
-    ).all()
-
-    result = []
-    for f in files:
-
-        print("DEBUG FILE KEY:", f.file_key)
-
-        # --- Ensure uploaded_at is ISO formatted like /files/list ---
-        uploaded_at = f.uploaded_at
-        if isinstance(uploaded_at, str):
-            try:
-                dt = datetime.strptime(uploaded_at, "%Y-%m-%d %H:%M:%S")
-                uploaded_at = dt.replace(tzinfo=timezone.utc).isoformat()
-            except:
-                pass
-        elif isinstance(uploaded_at, datetime):
-            if uploaded_at.tzinfo is None:
-                uploaded_at = uploaded_at.replace(tzinfo=timezone.utc)
-            uploaded_at = uploaded_at.isoformat()
-        # ----------------------------------------------------------------
-
-        result.append({
-            "id": f.id,
-            "filename": f.filename,
-            "file_size": f.file_size,
-            "uploaded_at": uploaded_at,
-            "preview_url": generate_presigned_url(f.file_key),
-            "download_url": generate_download_url(f.file_key, f.filename),
-            "folder_id": f.folder_id
-        })
-
-    return result
\ No newline at end of file
+        UserFile.folder_id == folder_id,
+        UserFile.deleted_at.is_(None)
+    ]
+    files = await get_files_page(db, filters, limit, cursor, response)
+
+    return [file_list_item(f, include_urls) for f in files]
@@ -1,40 +1,43 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from core.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.database import get_async_db
 from core.security import get_current_user
 from models.folder import Folder
 from models.file import UserFile
 from pydantic import BaseModel
-from services.s3_client import generate_presigned_url, generate_download_url, delete_file_from_s3, s3, BUCKET_NAME
+from services.s3_client import generate_presigned_url, generate_download_url, open_file_stream
+from services.folder_tree import delete_subtree, get_subtree_files
+from services.storage_usage import add_storage_usage
+from services.zip_stream import ZipEntry, stream_zip, unique_arcnames
 from datetime import datetime, timedelta
 from fastapi.responses import StreamingResponse
-import io, zipfile
 
 router = APIRouter(prefix="/folders", tags=["Folders"])
 
 @router.post("/create")
-def create_folder(
+async def create_folder(
     name: str,
     parent_id: int | None = None,
     color: str | None = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     # If parent_id is provided, make sure the parent exists and belongs to current user
     if parent_id is not None:
-        parent = db.query(Folder).filter(
+        parent = await db.scalar(select(Folder).where(
             Folder.id == parent_id,
             Folder.user_id == current_user.id
-        ).first()
+        ))
         if not parent:
             raise HTTPException(400, "Parent folder does not exist")
 
     # Check duplicate under the same parent
-    existing = db.query(Folder).filter(
+    existing = await db.scalar(select(Folder).where(
         Folder.user_id == current_user.id,
         Folder.parent_id == parent_id,
         Folder.name == name
-    ).first()
+    ))
 
     if existing:
         raise HTTPException(400, "Folder already exists under this parent")
@@ -48,17 +51,17 @@ def create_folder(
     )
 
     db.add(folder)
-    db.commit()
-    db.refresh(folder)
+    await db.commit()
+    await db.refresh(folder)
 
     return folder
 
 @router.get("/list")
-def list_folders(
-    db: Session = Depends(get_db),
+async def list_folders(
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
-    folders = db.query(Folder).filter(Folder.user_id == current_user.id).all()
+    folders = (await db.scalars(select(Folder).where(Folder.user_id == current_user.id))).all()
     return folders
 
 
@@ -67,30 +70,31 @@ class MoveRequest(BaseModel):
     folder_id: int | None = None
 
 @router.post("/move")
-def move_file(
+async def move_file(
     data: MoveRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     file_id = data.file_id
     folder_id = data.folder_id
 
-    file_record = db.query(UserFile).filter(
+    file_record = await db.scalar(select(UserFile).where(
         UserFile.id == file_id,
-        UserFile.user_id == current_user.id
-    ).first()
+        UserFile.user_id == current_user.id,
+        UserFile.deleted_at.is_(None)
+    ))
 
     if not file_record:
         raise HTTPException(404, "File not found")
 
     # Check if a file with the same name already exists in the target location
-    existing_file = db.query(UserFile).filter(
+    existing_file = await db.scalar(select(UserFile).where(
         UserFile.user_id == current_user.id,
         UserFile.filename == file_record.filename,
         UserFile.folder_id == folder_id,
         UserFile.id != file_id,
         UserFile.deleted_at.is_(None)
-    ).first()
+    ))
 
     if existing_file:
         raise HTTPException(
@@ -98,32 +102,36 @@ def move_file(
             detail=f"File '{file_record.filename}' already exists in the target location. Please rename the file first."
         )
 
+    if file_record.folder_id != folder_id:
+        await db.run_sync(add_storage_usage, [(file_record.user_id, file_record.folder_id, file_record.file_size)], sign=-1)
+        await db.run_sync(add_storage_usage, [(file_record.user_id, folder_id, file_record.file_size)])
     file_record.folder_id = folder_id
-    db.commit()
-    db.refresh(file_record)
+    await db.commit()
+    await db.refresh(file_record)
 
     return {"message": "File moved successfully"}
 
 @router.get("/in_folder/{folder_id}")
-def get_folder_contents(
+async def get_folder_contents(
     folder_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     # Get folder info
-    folder = db.query(Folder).filter(
+    folder = await db.scalar(select(Folder).where(
         Folder.id == folder_id,
         Folder.user_id == current_user.id
-    ).first()
+    ))
 
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found")
 
     # Get files in folder
-    files = db.query(UserFile).filter(
+    files = (await db.scalars(select(UserFile).where(
         UserFile.folder_id == folder_id,
-        UserFile.user_id == current_user.id
-    ).all()
+        UserFile.user_id == current_user.id,
+        UserFile.deleted_at.is_(None)
+    ))).all()
 
     # Prepare files data
     file_list = []
@@ -134,7 +142,7 @@ def get_folder_contents(
             "filename": f.filename,
             "file_size": f.file_size,
             "uploaded_at": uploaded_at,
-            "preview_url": generate_presigned_url(f.file_key),
+            "preview_url": generate_presigned_url(f.file_key, filename=f.filename),
             "download_url": generate_download_url(f.file_key, f.filename),
             "folder_id": f.folder_id
         })
@@ -150,96 +158,84 @@ def get_folder_contents(
 
 
 @router.patch("/{folder_id}/rename")
-def rename_folder(
+async def rename_folder(
     folder_id: int,
     new_name: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
-    folder = db.query(Folder).filter(
+    folder = await db.scalar(select(Folder).where(
         Folder.id == folder_id,
         Folder.user_id == current_user.id
-    ).first()
+    ))
 
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found")
 
     # Check duplicate under same parent
-    existing = db.query(Folder).filter(
+    existing = await db.scalar(select(Folder).where(
         Folder.user_id == current_user.id,
         Folder.parent_id == folder.parent_id,
         Folder.name == new_name
-    ).first()
+    ))
     if existing and existing.id != folder.id:
         raise HTTPException(status_code=400, detail="Folder with this name already exists in the same parent")
 
     folder.name = new_name
-    db.commit()
-    db.refresh(folder)
+    await db.commit()
+    await db.refresh(folder)
     return folder
 
 
 @router.delete("/{folder_id}")
-def delete_folder(
+async def delete_folder(
     folder_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
-    folder = db.query(Folder).filter(
+    folder = await db.scalar(select(Folder).where(
         Folder.id == folder_id,
         Folder.user_id == current_user.id
-    ).first()
+    ))
 
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found")
 
-    # Delete all files in the folder from S3 and DB
-    files = db.query(UserFile).filter(UserFile.folder_id == folder_id, UserFile.user_id == current_user.id).all()
-    for f in files:
-        try:
-            delete_file_from_s3(f.file_key)
-        except Exception:
-            pass
-        db.delete(f)
-
-    # Delete the folder itself
-    db.delete(folder)
-    db.commit()
+    # Delete the folder, its subfolders and all their files in a few set-based
+    # statements; the purge worker removes the objects from S3 afterwards
+    await db.run_sync(delete_subtree, current_user.id, folder_id)
+    await db.commit()
 
     return {"message": "Folder deleted"}
 
 
 @router.get("/{folder_id}/download")
-def download_folder(
+async def download_folder(
     folder_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
-    folder = db.query(Folder).filter(
+    folder = await db.scalar(select(Folder).where(
         Folder.id == folder_id,
         Folder.user_id == current_user.id
-    ).first()
+    ))
 
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found")
 
-    files = db.query(UserFile).filter(UserFile.folder_id == folder_id, UserFile.user_id == current_user.id).all()
-
-    # Create in-memory zip
-    mem = io.BytesIO()
-    with zipfile.ZipFile(mem, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
-        for f in files:
-            try:
-                obj = s3.get_object(Bucket=BUCKET_NAME, Key=f.file_key)
-                content = obj['Body'].read()
-                # Extract just the filename from the S3 key (the last part after the last /)
-                import os
-                just_filename = os.path.basename(f.file_key)
-                zf.writestr(just_filename, content)
-            except Exception:
-                # Skip files we can't read
-                continue
-
-    mem.seek(0)
+    # Every file in the subtree, with its path relative to this folder
+    files = await db.run_sync(get_subtree_files, current_user.id, folder_id)
+
+    names = unique_arcnames([path for _, path in files])
+    entries = [
+        ZipEntry(arcname=name, key=f.file_key, size=f.file_size or 0, modified_at=f.uploaded_at)
+        for name, (f, _) in zip(names, files)
+    ]
+
+    # The archive is built while it is being sent, one S3 chunk at a time
     filename = f"{folder.name or 'folder'}_{folder.id}.zip"
-    return StreamingResponse(mem, media_type='application/zip', headers={"Content-Disposition": f"attachment; filename=\"{filename}\""})
\ No newline at end of file
+    return StreamingResponse(
+        stream_zip(entries, open_file_stream),
+        media_type='application/zip',
+        headers={"Content-Disposition": f"attachment; filename=\"{filename}\""}
+    )
\ No newline at end of file
@@ -1,32 +1,64 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from core.security import get_current_user
-from core.database import get_db
-from models import User, UserFile
-from sqlalchemy import func
+from core.database import get_async_db
+from models import User, UserFile, FolderStorageUsage
+from services.storage_usage import get_storage_usage
+from services.blob_store import dedup_report
 
 router = APIRouter()
 
 @router.get("/storage")
-def get_storage(
-    db: Session = Depends(get_db),
+async def get_storage(
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """
     Returns total number of files and total storage in bytes
     for the currently logged-in user.
+    Reads the maintained counters instead of scanning the user's files.
     """
-    # Count how many files the user uploaded
-    total_files = db.query(UserFile).filter(
-        UserFile.user_id == current_user.id
-    ).count()
-
-    # Sum the file sizes for total storage
-    total_bytes = db.query(func.sum(UserFile.file_size)).filter(
-        UserFile.user_id == current_user.id
-    ).scalar() or 0
+    total_files, total_bytes = await db.run_sync(get_storage_usage, current_user.id)
 
     return {
         "total_files": total_files,
         "total_bytes": total_bytes
     }
+
+
+@router.get("/storage/folders")
+async def get_folder_storage(
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Returns file count and bytes for each folder (folder_id null for the root),
+    counting only the files directly inside it.
+    """
+    rows = (await db.scalars(select(FolderStorageUsage).where(
+        FolderStorageUsage.user_id == current_user.id,
+        FolderStorageUsage.file_count > 0
+    ))).all()
+
+    return [
+        {
+            "folder_id": row.folder_id or None,
+            "total_files": row.file_count,
+            "total_bytes": row.total_bytes
+        }
+        for row in rows
+    ]
+
+
+@router.get("/storage/dedup")
+async def get_dedup_report(
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Returns how much of the user's storage is shared between files with
+    identical content: logical bytes (every file at full size) against
+    bytes actually stored, and their ratio.
+    """
+    return await db.run_sync(dedup_report, current_user.id)
@@ -27,6 +27,90 @@ class FileListItem(BaseModel):
     file_size: int
     uploaded_at: str | datetime | None = None
     folder_id: int | None = None
+    preview_url: str | None = None
+    download_url: str | None = None
 
     class Config:
         from_attributes = True
+
+class PresignUploadRequest(BaseModel):
+    filename: str
+    file_size: int
+    content_type: str | None = None
+    folder_id: int | None = None
+
+class PresignedPart(BaseModel):
+    part_number: int
+    upload_url: str
+
+class PresignUploadResponse(BaseModel):
+    method: str  # "put" or "multipart"
+    key: str
+    expires_in: int
+    upload_url: str | None = None
+    upload_id: str | None = None
+    part_size: int | None = None
+    parts: list[PresignedPart] = []
+
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+
+class CompleteUploadRequest(BaseModel):
+    key: str
+    filename: str
+    file_size: int
+    folder_id: int | None = None
+    etag: str | None = None
+    upload_id: str | None = None
+    parts: list[UploadedPart] = []
+
+class AbortUploadRequest(BaseModel):
+    key: str
+    upload_id: str
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    file_size: int
+    content_type: str | None = None
+    folder_id: int | None = None
+
+class UploadSessionStatus(BaseModel):
+    upload_id: str
+    filename: str
+    file_size: int
+    part_size: int
+    received_bytes: int
+    received_parts: list[int]
+    next_offset: int | None = None  # None once every chunk is in
+    expires_at: datetime
+
+class CompleteUploadSessionRequest(BaseModel):
+    filename: str | None = None  # Finalize under another name, e.g. after a name conflict
+
+class FileUrlsRequest(BaseModel):
+    file_ids: list[int]
+
+class FileUrls(BaseModel):
+    id: int
+    preview_url: str
+    download_url: str
+
+class BulkMoveRequest(BaseModel):
+    file_ids: list[int]
+    folder_id: int | None = None
+
+class BulkDeleteRequest(BaseModel):
+    file_ids: list[int]
+
+class BulkRenameItem(BaseModel):
+    file_id: int
+    new_filename: str
+
+class BulkRenameRequest(BaseModel):
+    items: list[BulkRenameItem]
+
+class BulkItemResult(BaseModel):
+    id: int
+    status: str  # "moved", "deleted", "renamed" or "failed"
+    error: str | None = None
@@ -0,0 +1,169 @@
+"""
+Content-addressed storage: every distinct content a user uploads is kept as
+one S3 object, shared by all of the user's files with the same SHA-256.
+
+storage_blobs holds (user_id, content_hash) -> file_key with a count of the
+user_files rows pointing at it. Uploads go to a fresh key first (the hash is
+only known once the transfer is done); acquire_blob then either registers
+that key or hands back the existing one and queues the fresh copy for
+deletion. Deleting files releases their references, and an object is purged
+only once nothing points at it. Files uploaded straight to S3 with a
+presigned URL have no hash and keep an object of their own.
+
+Print the dedup report with:
+python -m services.blob_store
+"""
+import hashlib
+from collections import Counter
+
+from sqlalchemy import bindparam, case, delete, func, select, update
+from sqlalchemy.orm import Session
+
+from core.database import dialect_insert
+from models import StorageBlob, UserFile
+from services.purge_queue import enqueue_s3_deletes
+
+
+class HashingReader:
+    """Wraps a file object and computes the SHA-256 and size of everything read through it."""
+
+    def __init__(self, file):
+        self.file = file
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self._sha256.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
+
+
+def acquire_blob(db: Session, user_id: int, content_hash: str, file_key: str, size: int) -> str:
+    """
+    Add a reference to the user's blob with this hash, registering `file_key`
+    as its object if it is the first. Returns the key the file row should use;
+    when that is not `file_key`, the just-uploaded object is queued for
+    deletion. Does not commit.
+    """
+    stmt = dialect_insert(db, StorageBlob.__table__).values(
+        user_id=user_id, content_hash=content_hash, file_key=file_key, size=size, ref_count=1
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "content_hash"],
+        set_={"ref_count": StorageBlob.__table__.c.ref_count + 1},
+    ).returning(StorageBlob.__table__.c.file_key)
+    stored_key = db.execute(stmt).scalar_one()
+    if stored_key != file_key:
+        enqueue_s3_deletes(db, [file_key])
+    return stored_key
+
+
+def release_file_objects(db: Session, files) -> list[str]:
+    """
+    Drop the references held by deleted file rows, given as (user_id,
+    content_hash, file_key) tuples. Unhashed files own their object; blobs
+    whose count reaches zero are removed. Every object no longer referenced
+    goes on the purge queue. Does not commit. Returns the queued keys.
+    """
+    keys = set()
+    released = Counter()
+    for user_id, content_hash, file_key in files:
+        if content_hash is None:
+            keys.add(file_key)
+        else:
+            released[(user_id, content_hash)] += 1
+
+    if released:
+        table = StorageBlob.__table__
+        db.execute(
+            update(table)
+            .where(table.c.user_id == bindparam("b_user_id"), table.c.content_hash == bindparam("b_hash"))
+            .values(ref_count=table.c.ref_count - bindparam("b_count")),
+            [
+                {"b_user_id": user_id, "b_hash": content_hash, "b_count": count}
+                for (user_id, content_hash), count in released.items()
+            ]
+        )
+        user_ids = {user_id for user_id, _ in released}
+        hashes = {content_hash for _, content_hash in released}
+        emptied = db.execute(
+            delete(StorageBlob)
+            .where(
+                StorageBlob.user_id.in_(user_ids),
+                StorageBlob.content_hash.in_(hashes),
+                StorageBlob.ref_count <= 0,
+            )
+            .returning(StorageBlob.file_key)
+        ).scalars().all()
+        keys.update(emptied)
+
+    keys = sorted(keys)
+    enqueue_s3_deletes(db, keys)
+    return keys
+
+
+def dedup_report(db: Session, user_id: int | None = None) -> list[dict]:
+    """
+    Per user: bytes of all live file rows (logical_bytes) against bytes actually
+    kept in S3 (stored_bytes), and their ratio. Unhashed files count as
+    stored once each.
+    """
+    hashed = UserFile.content_hash.is_not(None)
+    files = (
+        select(
+            UserFile.user_id,
+            func.count().label("files"),
+            func.count(UserFile.content_hash).label("hashed_files"),
+            func.sum(UserFile.file_size).label("logical_bytes"),
+            func.sum(case((hashed, 0), else_=UserFile.file_size)).label("unhashed_bytes"),
+        )
+        .where(UserFile.deleted_at.is_(None))
+        .group_by(UserFile.user_id)
+    )
+    blobs = (
+        select(
+            StorageBlob.user_id,
+            func.count().label("blobs"),
+            func.sum(StorageBlob.size).label("blob_bytes"),
+        )
+        .group_by(StorageBlob.user_id)
+    )
+    if user_id is not None:
+        files = files.where(UserFile.user_id == user_id)
+        blobs = blobs.where(StorageBlob.user_id == user_id)
+
+    blob_totals = {row.user_id: row for row in db.execute(blobs)}
+    report = []
+    for row in db.execute(files.order_by(UserFile.user_id)):
+        blob = blob_totals.get(row.user_id)
+        stored = row.unhashed_bytes + (blob.blob_bytes if blob else 0)
+        report.append({
+            "user_id": row.user_id,
+            "files": row.files,
+            "stored_objects": (blob.blobs if blob else 0) + row.files - row.hashed_files,
+            "logical_bytes": row.logical_bytes,
+            "stored_bytes": stored,
+            "saved_bytes": row.logical_bytes - stored,
+            "dedup_ratio": round(row.logical_bytes / stored, 4) if stored else 1.0,
+        })
+    return report
+
+
+if __name__ == "__main__":
+    from core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        report = dedup_report(db)
+    finally:
+        db.close()
+
+    for row in report:
+        print(
+            f"user {row['user_id']}: {row['files']} files in {row['stored_objects']} objects, "
+            f"{row['logical_bytes']} bytes stored as {row['stored_bytes']} (ratio {row['dedup_ratio']})"
+        )
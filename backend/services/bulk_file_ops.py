@@ -0,0 +1,151 @@
+"""
+Move, delete and rename many files in one transaction.
+
+Each operation loads the requested files with one query, decides per item
+whether it can go ahead, and applies the accepted items with set-based
+statements. Results come back in request order as
+{"id", "status", "error"} dicts; nothing is committed here.
+"""
+from collections import defaultdict
+
+from sqlalchemy import bindparam, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import UserFile
+from services.file_records import find_existing_filenames, soft_delete_files
+from services.storage_usage import add_storage_usage
+
+
+def _result(file_id: int, status: str, error: str | None = None) -> dict:
+    return {"id": file_id, "status": status, "error": error}
+
+
+def _load_files(db: Session, user_id: int, file_ids: list[int]) -> dict[int, object]:
+    """The user's live files among `file_ids`; deleted ones count as not found."""
+    rows = db.execute(
+        select(
+            UserFile.id, UserFile.user_id, UserFile.filename, UserFile.file_key, UserFile.folder_id,
+            UserFile.file_size, UserFile.content_hash,
+        ).where(UserFile.user_id == user_id, UserFile.id.in_(set(file_ids)), UserFile.deleted_at.is_(None))
+    )
+    return {row.id: row for row in rows}
+
+
+def bulk_move_files(db: Session, user_id: int, file_ids: list[int], folder_id: int | None) -> list[dict]:
+    """
+    Move the files into `folder_id` (None for the root). S3 is untouched:
+    new objects get keys from new_file_key, which don't contain the folder,
+    so a file uploaded later under the old folder and name can't reuse the
+    moved file's key. Files still on name-based keys keep them until
+    services.rekey_objects moves them.
+    """
+    files = _load_files(db, user_id, file_ids)
+    taken = find_existing_filenames(
+        db, user_id, folder_id, list({f.filename for f in files.values() if f.folder_id != folder_id})
+    )
+
+    results = []
+    moving = []
+    seen = set()
+    for file_id in file_ids:
+        f = files.get(file_id)
+        if f is None:
+            results.append(_result(file_id, "failed", "File not found"))
+        elif file_id in seen:
+            results.append(_result(file_id, "failed", "Duplicate file id in request"))
+        elif f.folder_id == folder_id:
+            results.append(_result(file_id, "moved"))
+        elif f.filename in taken:
+            results.append(_result(file_id, "failed", f"File '{f.filename}' already exists in the target location"))
+        else:
+            # Two files with the same name can't both land in the target
+            taken.add(f.filename)
+            moving.append(f)
+            results.append(_result(file_id, "moved"))
+        seen.add(file_id)
+
+    if moving:
+        db.execute(
+            update(UserFile)
+            .where(UserFile.user_id == user_id, UserFile.id.in_([f.id for f in moving]))
+            .values(folder_id=folder_id)
+        )
+        add_storage_usage(db, [(user_id, f.folder_id, f.file_size) for f in moving], sign=-1)
+        add_storage_usage(db, [(user_id, folder_id, f.file_size) for f in moving])
+    return results
+
+
+def bulk_delete_files(db: Session, user_id: int, file_ids: list[int]) -> list[dict]:
+    """
+    Soft-delete the files: they leave the listings and storage counters,
+    the deletion goes into the billing ledger, and objects nothing else
+    points at go on the purge queue.
+    """
+    files = _load_files(db, user_id, file_ids)
+
+    results = []
+    deleting = {}
+    for file_id in file_ids:
+        if file_id in deleting:
+            results.append(_result(file_id, "failed", "Duplicate file id in request"))
+        elif file_id not in files:
+            results.append(_result(file_id, "failed", "File not found"))
+        else:
+            deleting[file_id] = files[file_id]
+            results.append(_result(file_id, "deleted"))
+
+    soft_delete_files(db, deleting.values())
+    return results
+
+
+def bulk_rename_files(db: Session, user_id: int, renames: list[tuple[int, str]]) -> list[dict]:
+    """
+    Rename files given as (file_id, new_filename) pairs. Keys don't contain
+    the name, so this is a metadata update and S3 is untouched.
+    """
+    files = _load_files(db, user_id, [file_id for file_id, _ in renames])
+    targets = defaultdict(set)
+    for file_id, name in renames:
+        if file_id in files and name and name.strip():
+            targets[files[file_id].folder_id].add(name.strip())
+    # Live files already holding one of the target names, in one query
+    holders = {}
+    if targets:
+        rows = db.execute(
+            select(UserFile.id, UserFile.folder_id, UserFile.filename).where(
+                UserFile.user_id == user_id,
+                UserFile.deleted_at.is_(None),
+                or_(*(
+                    (UserFile.folder_id == folder_id) & UserFile.filename.in_(names)
+                    for folder_id, names in targets.items()
+                )),
+            )
+        )
+        holders = {(row.folder_id, row.filename): row.id for row in rows}
+
+    results = []
+    renamed = {}
+    for file_id, name in renames:
+        f = files.get(file_id)
+        new_filename = (name or "").strip()
+        if f is None:
+            results.append(_result(file_id, "failed", "File not found"))
+        elif file_id in renamed:
+            results.append(_result(file_id, "failed", "Duplicate file id in request"))
+        elif not new_filename:
+            results.append(_result(file_id, "failed", "Filename cannot be empty"))
+        elif holders.get((f.folder_id, new_filename), file_id) != file_id:
+            results.append(_result(file_id, "failed", f"File '{new_filename}' already exists in this location"))
+        else:
+            holders[(f.folder_id, new_filename)] = file_id
+            renamed[file_id] = new_filename
+            results.append(_result(file_id, "renamed"))
+
+    if renamed:
+        db.execute(
+            update(UserFile.__table__)
+            .where(UserFile.__table__.c.id == bindparam("b_id"))
+            .values(filename=bindparam("b_filename")),
+            [{"b_id": file_id, "b_filename": name} for file_id, name in renamed.items()]
+        )
+    return results
@@ -0,0 +1,105 @@
+"""
+Compaction of deleted files.
+
+Deleting a file only sets user_files.deleted_at: the row drops out of every
+listing (the listing indexes are partial on live rows), and its usage is
+already in the storage ledger. The row is kept while invoices can still
+list it per file, that is until the month after its deletion has been
+billed, and then deleted here. Billing totals keep counting the compacted
+files through storage_usage_months.
+
+Compact once with:
+python -m services.deleted_files [--before YYYY-MM-DD]
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from models import UserFile
+
+logger = logging.getLogger(__name__)
+
+DELETED_FILE_COMPACTION_INTERVAL = float(os.getenv("DELETED_FILE_COMPACTION_INTERVAL", "3600"))
+DELETED_FILE_BATCH_SIZE = int(os.getenv("DELETED_FILE_BATCH_SIZE", "1000"))
+
+
+def compaction_cutoff(now: datetime | None = None) -> datetime:
+    """Start of the previous month: rows deleted before it are on invoices already."""
+    now = now or datetime.utcnow()
+    if now.month == 1:
+        return datetime(now.year - 1, 12, 1)
+    return datetime(now.year, now.month - 1, 1)
+
+
+def count_deleted_files(db: Session, before: datetime | None = None) -> int:
+    """Deleted rows still in user_files, only those deleted before `before` if given."""
+    query = select(func.count()).select_from(UserFile).where(UserFile.deleted_at.is_not(None))
+    if before is not None:
+        query = query.where(UserFile.deleted_at < before)
+    return db.execute(query).scalar()
+
+
+def compact_deleted_files(
+    db: Session, before: datetime | None = None, batch_size: int = DELETED_FILE_BATCH_SIZE
+) -> int:
+    """
+    Delete the user_files rows of files deleted before `before` (default
+    compaction_cutoff()), committing after each batch. Returns the number
+    of rows removed.
+    """
+    before = before or compaction_cutoff()
+    removed = 0
+    while True:
+        ids = db.execute(
+            select(UserFile.id)
+            .where(UserFile.deleted_at.is_not(None), UserFile.deleted_at < before)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return removed
+        db.execute(delete(UserFile).where(UserFile.id.in_(ids)))
+        db.commit()
+        removed += len(ids)
+
+
+async def run_deleted_file_compaction(session_factory, interval: float = DELETED_FILE_COMPACTION_INTERVAL):
+    """Compact deleted files every `interval` seconds until cancelled. The blocking work runs on a thread."""
+
+    def compact():
+        db = session_factory()
+        try:
+            return compact_deleted_files(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            removed = await asyncio.to_thread(compact)
+            if removed:
+                logger.info("Compacted %d deleted files", removed)
+        except Exception:
+            logger.exception("Deleted file compaction failed")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from core.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Remove the rows of files deleted before a date.")
+    parser.add_argument("--before", type=datetime.fromisoformat, default=None)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        removed = compact_deleted_files(db, args.before)
+        remaining = count_deleted_files(db)
+    finally:
+        db.close()
+
+    print(f"{removed} deleted files compacted; {remaining} deleted files kept for billing.")
@@ -1,19 +1,52 @@
+"""
+Outgoing email through an outbox table.
+
+Routes only insert email_outbox rows, in the same transaction as the change
+that triggers the email, so a request never waits on SMTP and no email is
+lost if the server is down. A background sender drains the outbox in
+batches over one SMTP connection that it keeps open between batches
+(STARTTLS and login happen once per connection, not per message). Every
+worker runs a sender, so each batch is claimed with an UPDATE before it is
+sent. Messages that fail are retried with exponential backoff and marked
+"failed" after EMAIL_MAX_ATTEMPTS.
+
+Send what is due by hand with:
+python -m services.email_service [--stats] [--retry-failed]
+"""
+import asyncio
+import logging
+import os
 import smtplib
-from email.mime.text import MIMEText
+from datetime import datetime, timedelta
 from email.mime.multipart import MIMEMultipart
-import os
+from email.mime.text import MIMEText
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import EmailOutbox
+
+logger = logging.getLogger(__name__)
 
 EMAIL_FROM = os.getenv("EMAIL_FROM")
 EMAIL_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
 
-def send_verification_email(to: str, name: str, link: str):
-    message = MIMEMultipart("alternative")
-    message["Subject"] = "Verify your Baketsu account"
-    message["From"] = EMAIL_FROM
-    message["To"] = to
+EMAIL_SEND_INTERVAL = float(os.getenv("EMAIL_SEND_INTERVAL", "2"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+EMAIL_BACKOFF_BASE = float(os.getenv("EMAIL_BACKOFF_BASE", "30"))
+EMAIL_BACKOFF_MAX = float(os.getenv("EMAIL_BACKOFF_MAX", "3600"))
+# How long a claimed batch stays hidden from other senders; the rows of a
+# sender that dies mid-batch come due again after it
+EMAIL_CLAIM_LEASE = float(os.getenv("EMAIL_CLAIM_LEASE", "600"))
 
+
+def verification_email(name: str, link: str) -> tuple[str, str]:
+    """(subject, html body) of the account verification email."""
     html = f"""
     <html>
         <body>
@@ -24,10 +57,236 @@ def send_verification_email(to: str, name: str, link: str):
         </body>
     </html>
     """
+    return "Verify your Baketsu account", html
+
+
+def enqueue_email(db: Session, to: str, subject: str, html: str):
+    """Queue an email. Does not commit; it goes out only if the caller's transaction commits."""
+    db.execute(insert(EmailOutbox), [
+        {"recipient": to, "subject": subject, "html_body": html, "next_attempt_at": datetime.utcnow()}
+    ])
+
+
+def enqueue_verification_email(db: Session, to: str, name: str, link: str):
+    subject, html = verification_email(name, link)
+    enqueue_email(db, to, subject, html)
+
+
+class SmtpSender:
+    """
+    One SMTP connection, opened on first use and reused for every message
+    after that. A connection the server dropped is replaced before the next
+    batch.
+    """
+
+    def __init__(
+        self,
+        host: str = SMTP_SERVER,
+        port: int = SMTP_PORT,
+        username: str | None = EMAIL_FROM,
+        password: str | None = EMAIL_PASSWORD,
+        from_address: str | None = EMAIL_FROM,
+        starttls: bool = SMTP_STARTTLS,
+        timeout: float = SMTP_TIMEOUT,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.from_address = from_address
+        self.starttls = starttls
+        self.timeout = timeout
+        self._smtp: smtplib.SMTP | None = None
+        self.connections = 0
+
+    def connect(self):
+        """Make sure the connection is open, reconnecting if the server closed it."""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return
+            except smtplib.SMTPException:
+                pass
+            self.close()
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.connections += 1
+
+    def send(self, to: str, subject: str, html: str):
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = self.from_address
+        message["To"] = to
+        message.attach(MIMEText(html, "html"))
+        try:
+            self._smtp.sendmail(self.from_address, to, message.as_string())
+        except smtplib.SMTPServerDisconnected:
+            self._smtp = None
+            raise
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff before the next try after `attempts` failures: base * 2^(attempts-1), capped."""
+    return timedelta(seconds=min(EMAIL_BACKOFF_BASE * 2 ** (attempts - 1), EMAIL_BACKOFF_MAX))
+
+
+def send_email_batch(db: Session, sender: SmtpSender, batch_size: int = EMAIL_BATCH_SIZE, now: datetime | None = None) -> int:
+    """
+    Claim one batch of due emails, send it over the sender's connection and
+    commit the outcome. Returns how many outbox entries were processed (0
+    when nothing is due).
+    """
+    now = now or datetime.utcnow()
+    due = (
+        select(EmailOutbox.id)
+        .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    # Moving next_attempt_at past the lease hides the batch from other
+    # senders; of two claims racing for a row only one still sees it due.
+    # Committed before sending, so no lock is held while SMTP is slow.
+    rows = db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(due), EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .values(next_attempt_at=now + timedelta(seconds=EMAIL_CLAIM_LEASE))
+        .returning(EmailOutbox.id, EmailOutbox.recipient, EmailOutbox.subject, EmailOutbox.html_body, EmailOutbox.attempts)
+    ).all()
+    db.commit()
+    if not rows:
+        return 0
+    rows.sort(key=lambda row: row.id)
+
+    errors = {}
+    try:
+        sender.connect()
+    except Exception as e:
+        logger.warning("SMTP connection failed, %d emails postponed: %s", len(rows), e)
+        errors = {row.id: str(e) for row in rows}
+    else:
+        for row in rows:
+            try:
+                sender.send(row.recipient, row.subject, row.html_body)
+            except Exception as e:
+                # A message that can't be built fails on its own; the connection is fine
+                errors[row.id] = str(e) or type(e).__name__
+                if isinstance(e, (smtplib.SMTPException, OSError)) and not isinstance(e, smtplib.SMTPRecipientsRefused):
+                    # The connection may be unusable; leave the rest for the next batch
+                    sender.close()
+                    errors.update({other.id: str(e) for other in rows[rows.index(row) + 1:]})
+                    break
+
+    sent = [row.id for row in rows if row.id not in errors]
+    if sent:
+        db.execute(delete(EmailOutbox).where(EmailOutbox.id.in_(sent)))
+    for row in rows:
+        if row.id not in errors:
+            continue
+        attempts = row.attempts + 1
+        db.execute(
+            update(EmailOutbox).where(EmailOutbox.id == row.id).values(
+                attempts=attempts,
+                last_error=errors[row.id][:1000],
+                status="failed" if attempts >= EMAIL_MAX_ATTEMPTS else "pending",
+                next_attempt_at=now + retry_delay(attempts),
+            )
+        )
+    db.commit()
+    return len(rows)
+
+
+def drain_email_outbox(db: Session, sender: SmtpSender, batch_size: int = EMAIL_BATCH_SIZE, now: datetime | None = None) -> int:
+    """Send batches until nothing is due. Returns the number of entries processed."""
+    total = 0
+    while True:
+        processed = send_email_batch(db, sender, batch_size, now)
+        if not processed:
+            return total
+        total += processed
+
+
+def email_outbox_stats(db: Session) -> dict:
+    """Pending and failed counts plus the age of the oldest pending email, for monitoring."""
+    counts = dict(db.execute(
+        select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status)
+    ).all())
+    oldest = db.execute(
+        select(func.min(EmailOutbox.created_at)).where(EmailOutbox.status == "pending")
+    ).scalar()
+    return {
+        "pending": counts.get("pending", 0),
+        "failed": counts.get("failed", 0),
+        "oldest_pending_at": oldest,
+    }
+
+
+def retry_failed_emails(db: Session) -> int:
+    """Put every failed email back in the outbox with a fresh attempt count. Commits."""
+    result = db.execute(
+        update(EmailOutbox).where(EmailOutbox.status == "failed").values(
+            status="pending", attempts=0, next_attempt_at=datetime.utcnow()
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+async def run_email_sender(session_factory, interval: float = EMAIL_SEND_INTERVAL, sender: SmtpSender | None = None):
+    """Drain the outbox every `interval` seconds until cancelled, over one kept-open connection. The blocking work runs on a thread."""
+    sender = sender or SmtpSender()
+
+    def drain():
+        db = session_factory()
+        try:
+            return drain_email_outbox(db, sender)
+        finally:
+            db.close()
+
+    try:
+        while True:
+            try:
+                processed = await asyncio.to_thread(drain)
+                if processed:
+                    logger.info("Processed %d outbox emails", processed)
+            except Exception:
+                logger.exception("Email sender iteration failed")
+            await asyncio.sleep(interval)
+    finally:
+        sender.close()
+
+
+if __name__ == "__main__":
+    import sys
 
-    message.attach(MIMEText(html, "html"))
+    from core.database import SessionLocal
 
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-        server.starttls()
-        server.login(EMAIL_FROM, EMAIL_PASSWORD)
-        server.sendmail(EMAIL_FROM, to, message.as_string())
+    db = SessionLocal()
+    sender = SmtpSender()
+    try:
+        if "--retry-failed" in sys.argv:
+            print(f"{retry_failed_emails(db)} failed emails re-queued.")
+        if "--stats" not in sys.argv:
+            print(f"{drain_email_outbox(db, sender)} emails processed.")
+        stats = email_outbox_stats(db)
+    finally:
+        sender.close()
+        db.close()
+    print(f"pending {stats['pending']}, failed {stats['failed']}, oldest pending {stats['oldest_pending_at']}")
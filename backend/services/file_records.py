@@ -0,0 +1,165 @@
+import base64
+import json
+import re
+import uuid
+from datetime import datetime
+
+from sqlalchemy import String, and_, insert, or_, select, type_coerce, update
+from sqlalchemy.orm import Query, Session
+
+from models import UserFile
+from services.blob_store import release_file_objects
+from services.storage_usage import add_storage_usage
+from services.storage_ledger import record_storage_events
+
+FILE_KEY_PATTERN = re.compile(r"users/\d+/objects/[0-9a-f]{32}")
+
+
+def new_file_key(user_id: int) -> str:
+    """
+    Fresh S3 key for a new object owned by `user_id`. Keys never change and
+    don't contain the file name or folder, which live only in UserFile, so
+    renames and moves are metadata updates.
+    """
+    return f"users/{user_id}/objects/{uuid.uuid4().hex}"
+
+
+def is_file_key_of_user(key: str, user_id: int) -> bool:
+    """Whether `key` has the shape new_file_key produces for this user."""
+    return FILE_KEY_PATTERN.fullmatch(key) is not None and key.startswith(f"users/{user_id}/")
+
+
+def find_existing_filenames(db: Session, user_id: int, folder_id: int | None, filenames: list[str]) -> set[str]:
+    """Return which of `filenames` already exist (not deleted) in the folder, using a single IN query."""
+    if not filenames:
+        return set()
+    rows = db.execute(
+        select(UserFile.filename).where(
+            UserFile.user_id == user_id,
+            UserFile.folder_id == folder_id,
+            UserFile.filename.in_(filenames),
+            UserFile.deleted_at.is_(None)
+        )
+    )
+    return {row.filename for row in rows}
+
+
+def insert_file_records(db: Session, rows: list[dict]) -> list[int]:
+    """
+    Insert many UserFile rows with one bulk INSERT ... RETURNING statement,
+    add them to the storage counters and record their upload in the
+    billing ledger. Does not commit.
+    Returns the new ids in the same order as `rows`.
+    """
+    if not rows:
+        return []
+    result = db.execute(
+        insert(UserFile).returning(UserFile.id, sort_by_parameter_order=True),
+        rows
+    )
+    file_ids = [row.id for row in result]
+    add_storage_usage(db, [(row["user_id"], row["folder_id"], row["file_size"]) for row in rows])
+    record_storage_events(db, [
+        (row["user_id"], file_id, "upload", row["file_size"]) for row, file_id in zip(rows, file_ids)
+    ])
+    return file_ids
+
+
+def release_deleted_files(db: Session, files, at: datetime):
+    """
+    Bookkeeping for live files that were just marked deleted at `at`: take
+    them off the storage counters, record the deletion in the billing ledger
+    and release their objects. `files` are rows with id, user_id, folder_id,
+    file_size, content_hash and file_key. Does not commit.
+    """
+    files = list(files)
+    if not files:
+        return
+    add_storage_usage(db, [(f.user_id, f.folder_id, f.file_size) for f in files], sign=-1)
+    record_storage_events(db, [(f.user_id, f.id, "delete", -f.file_size) for f in files], at=at)
+    # The objects are deleted from S3 by the purge worker once no file uses them
+    release_file_objects(db, [(f.user_id, f.content_hash, f.file_key) for f in files])
+
+
+def soft_delete_files(db: Session, files):
+    """
+    Delete live files: set deleted_at, which drops them from every listing,
+    and release them (release_deleted_files). The rows stay for per-file
+    billing until services.deleted_files compacts them. Does not commit.
+    """
+    files = list(files)
+    if not files:
+        return
+    now = datetime.utcnow()
+    db.execute(
+        update(UserFile)
+        .where(UserFile.id.in_([f.id for f in files]), UserFile.deleted_at.is_(None))
+        .values(deleted_at=now)
+    )
+    release_deleted_files(db, files, now)
+
+
+def encode_cursor(uploaded_at, file_id: int) -> str:
+    """Opaque pagination cursor pointing just after the given (uploaded_at, id) position."""
+    raw = json.dumps([str(uploaded_at), file_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        uploaded_at, file_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(uploaded_at), int(file_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def cursor_position(dialect_name: str, cursor: str) -> tuple:
+    """
+    The (uploaded_at column, uploaded_at value, id) a cursor compares on.
+    SQLite compares the stored text, so the cursor matches the ORDER BY
+    exactly even when rows were written with different timestamp formats;
+    other databases compare typed timestamps. Raises ValueError for
+    malformed cursors.
+    """
+    uploaded_at, file_id = decode_cursor(cursor)
+    if dialect_name == "sqlite":
+        return type_coerce(UserFile.uploaded_at, String), uploaded_at, file_id
+    try:
+        return UserFile.uploaded_at, datetime.fromisoformat(uploaded_at), file_id
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def cursor_filter(dialect_name: str, cursor: str):
+    """WHERE clause selecting the rows after the cursor, newest first."""
+    column, uploaded_at, file_id = cursor_position(dialect_name, cursor)
+    return or_(column < uploaded_at, and_(column == uploaded_at, UserFile.id < file_id))
+
+
+def paginate_files(query: Query, limit: int | None, cursor: str | None = None) -> tuple[list[UserFile], str | None]:
+    """
+    Keyset pagination over a UserFile query, newest first (uploaded_at, then id).
+    Only `limit` rows are read per page no matter how deep the cursor is.
+    Returns the page and the cursor for the next page (None on the last page).
+    With no limit, returns every remaining row.
+    """
+    dialect_name = query.session.get_bind().dialect.name
+    query = query.order_by(UserFile.uploaded_at.desc(), UserFile.id.desc())
+
+    if cursor:
+        query = query.filter(cursor_filter(dialect_name, cursor))
+
+    if limit is None:
+        return query.all(), None
+
+    # The next cursor carries the value the comparison uses: stored text on SQLite
+    uploaded_at = type_coerce(UserFile.uploaded_at, String) if dialect_name == "sqlite" else UserFile.uploaded_at
+    rows = query.add_columns(uploaded_at).limit(limit + 1).all()
+    files = [row[0] for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last_file, last_uploaded_at = rows[limit - 1]
+        next_cursor = encode_cursor(last_uploaded_at, last_file.id)
+    return files, next_cursor
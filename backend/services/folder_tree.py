@@ -0,0 +1,105 @@
+"""
+Folder subtree queries.
+
+folder_subtree resolves a folder and all of its descendants with one
+recursive CTE, carrying each folder's path relative to the subtree root.
+Recursive download and delete build on it instead of walking
+Folder.children one query per level.
+"""
+from datetime import datetime
+
+from sqlalchemy import case, delete, func, literal, select, update
+from sqlalchemy.orm import Session
+
+from models import Folder, FolderStorageUsage, UploadSession, UserFile
+from services.file_records import release_deleted_files
+
+# Guards the recursion against a parent_id cycle in bad data
+MAX_FOLDER_DEPTH = 1000
+
+
+def folder_subtree(user_id: int, folder_id: int):
+    """
+    Recursive CTE with one row (id, path, depth) per folder in the subtree
+    rooted at `folder_id`, the root included with path "" and depth 0.
+    Only the user's own folders are followed.
+    """
+    tree = (
+        select(Folder.id, literal("").label("path"), literal(0).label("depth"))
+        .where(Folder.id == folder_id, Folder.user_id == user_id)
+        .cte("folder_tree", recursive=True)
+    )
+    child = select(
+        Folder.id,
+        case((tree.c.path == "", Folder.name), else_=tree.c.path + "/" + Folder.name),
+        tree.c.depth + 1,
+    ).join(tree, Folder.parent_id == tree.c.id).where(
+        Folder.user_id == user_id,
+        tree.c.depth < MAX_FOLDER_DEPTH,
+    )
+    return tree.union_all(child)
+
+
+def get_subtree_folders(db: Session, user_id: int, folder_id: int) -> list[tuple[int, str]]:
+    """(folder_id, relative path) for every folder in the subtree, parents before children."""
+    tree = folder_subtree(user_id, folder_id)
+    rows = db.execute(select(tree.c.id, tree.c.path).order_by(tree.c.depth, tree.c.id))
+    return [(row.id, row.path) for row in rows]
+
+
+def get_subtree_files(db: Session, user_id: int, folder_id: int) -> list[tuple[UserFile, str]]:
+    """
+    Every live file under the folder, at any depth, with the file's path
+    relative to the folder ("sub/dir/name.ext"). One query for the whole tree.
+    """
+    tree = folder_subtree(user_id, folder_id)
+    rows = db.execute(
+        select(UserFile, tree.c.path)
+        .join(tree, UserFile.folder_id == tree.c.id)
+        .where(UserFile.user_id == user_id, UserFile.deleted_at.is_(None))
+        .order_by(tree.c.path, UserFile.filename)
+    )
+    return [
+        (file, f"{path}/{file.filename}" if path else file.filename)
+        for file, path in rows
+    ]
+
+
+def delete_subtree(db: Session, user_id: int, folder_id: int) -> int:
+    """
+    Delete the folder and its subfolders with set-based statements and
+    soft-delete their live files (see file_records.soft_delete_files). File
+    rows left in the subtree are detached from the removed folders, and
+    resumable uploads into them are expired, so the cleanup job aborts
+    their multipart uploads. Does not commit. Returns the number of files
+    deleted.
+    """
+    folder_ids = select(folder_subtree(user_id, folder_id).c.id).scalar_subquery()
+
+    in_subtree = (UserFile.user_id == user_id) & UserFile.folder_id.in_(folder_ids)
+    live = db.execute(
+        select(UserFile.id, UserFile.user_id, UserFile.folder_id, UserFile.file_size, UserFile.file_key, UserFile.content_hash)
+        .where(in_subtree, UserFile.deleted_at.is_(None))
+    ).all()
+
+    now = datetime.utcnow()
+    db.execute(
+        update(UserFile)
+        .where(in_subtree)
+        .values(deleted_at=func.coalesce(UserFile.deleted_at, now), folder_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    release_deleted_files(db, live, now)
+    db.execute(
+        update(UploadSession)
+        .where(UploadSession.user_id == user_id, UploadSession.folder_id.in_(folder_ids))
+        .values(folder_id=None, expires_at=now)
+        .execution_options(synchronize_session=False)
+    )
+
+    db.execute(delete(FolderStorageUsage).where(
+        FolderStorageUsage.user_id == user_id,
+        FolderStorageUsage.folder_id.in_(folder_ids)
+    ))
+    db.execute(delete(Folder).where(Folder.user_id == user_id, Folder.id.in_(folder_ids)))
+    return len(live)
@@ -0,0 +1,157 @@
+"""
+Month-end invoicing for every user.
+
+generate_invoices bills one period for the users in an id range. Totals
+come from the storage ledger: one windowed query picks each user's latest
+storage_usage_months row up to the period, which holds the month's
+byte-seconds (or, for a month without events, the balance carried into
+it), and the GB-days are priced like the invoice route does. Deleted files
+compacted out of user_files are still billed this way. The invoices are
+inserted in chunks with ON CONFLICT DO NOTHING on (user_id, billing_year,
+billing_month), so running a period again only adds the invoices still
+missing. Users with nothing stored in the period get no invoice.
+
+run_invoice_batch splits the user ids into ranges and bills each range in
+its own worker process.
+
+Run for the previous month with:
+python -m services.invoice_batch [--year YYYY --month MM] [--workers N]
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from core.database import create_database_engine, dialect_insert
+from models import Invoice, StorageUsageMonth, User
+from services.billing_engine import PRICE_PER_GB_CENTS, PRICE_PER_GB_DAY_CENTS
+from services.storage_ledger import month_bounds, to_gb_days, up_to_month, usage_from_row
+
+INVOICE_CHUNK_SIZE = int(os.getenv("INVOICE_CHUNK_SIZE", "1000"))
+INVOICE_DUE_DAYS = 7
+
+
+def usage_by_user(
+    db: Session, year: int, month: int, first_user_id: int | None = None, last_user_id: int | None = None
+) -> list[tuple[int, float]]:
+    """
+    (user_id, gb_days) of every user with storage in the month, for user ids
+    in [first_user_id, last_user_id], in user id order.
+    """
+    start, end = month_bounds(year, month)
+    month_seconds = (end - start).total_seconds()
+    table = StorageUsageMonth.__table__
+    ranked = select(
+        table.c.user_id, table.c.year, table.c.month,
+        table.c.active_bytes, table.c.byte_seconds, table.c.accounted_seconds,
+        func.row_number().over(
+            partition_by=table.c.user_id, order_by=(table.c.year.desc(), table.c.month.desc())
+        ).label("position"),
+    ).where(up_to_month(table, year, month))
+    if first_user_id is not None:
+        ranked = ranked.where(table.c.user_id >= first_user_id)
+    if last_user_id is not None:
+        ranked = ranked.where(table.c.user_id <= last_user_id)
+    ranked = ranked.subquery()
+
+    usage = []
+    for row in db.execute(select(ranked).where(ranked.c.position == 1).order_by(ranked.c.user_id)):
+        byte_seconds, _ = usage_from_row(row, year, month, month_seconds)
+        if byte_seconds > 0:
+            usage.append((row.user_id, to_gb_days(byte_seconds)))
+    return usage
+
+
+def generate_invoices(
+    db: Session, year: int, month: int, first_user_id: int | None = None, last_user_id: int | None = None,
+    chunk_size: int = INVOICE_CHUNK_SIZE
+) -> int:
+    """
+    Create the month's invoices for users in [first_user_id, last_user_id]
+    that don't have one yet, committing after each chunk. Returns the
+    number of invoices created.
+    """
+    now = datetime.utcnow()
+    details = {"price_per_gb_month_cents": PRICE_PER_GB_CENTS, "price_per_gb_day_cents": PRICE_PER_GB_DAY_CENTS}
+    table = Invoice.__table__
+    insert_invoices = (
+        dialect_insert(db, table)
+        .on_conflict_do_nothing(index_elements=["user_id", "billing_year", "billing_month"])
+        .returning(table.c.id)
+    )
+
+    usage = usage_by_user(db, year, month, first_user_id, last_user_id)
+    created = 0
+    for offset in range(0, len(usage), chunk_size):
+        rows = [
+            {
+                "user_id": user_id,
+                "billing_month": month,
+                "billing_year": year,
+                "total_gb_hours": int(gb_days * 100),  # GB-days with 2 decimal precision, like the route
+                "cost_cents": int(gb_days * PRICE_PER_GB_DAY_CENTS),
+                "status": "pending",
+                "created_at": now,
+                "due_date": now + timedelta(days=INVOICE_DUE_DAYS),
+                "details": details,
+            }
+            for user_id, gb_days in usage[offset:offset + chunk_size]
+        ]
+        created += len(db.execute(insert_invoices, rows).all())
+        db.commit()
+    return created
+
+
+def user_id_ranges(db: Session, parts: int) -> list[tuple[int, int]]:
+    """Split the users' id span into at most `parts` contiguous (first, last) ranges."""
+    low, high = db.execute(select(func.min(User.id), func.max(User.id))).one()
+    if low is None:
+        return []
+    step = -(-(high - low + 1) // max(parts, 1))
+    return [(first, min(first + step - 1, high)) for first in range(low, high + 1, step)]
+
+
+def _generate_range(database_url: str, year: int, month: int, first_user_id: int, last_user_id: int) -> int:
+    # Each worker process opens its own connections; SQLite writers wait for each other's chunks
+    engine = create_database_engine(database_url, pool_size=1, max_overflow=0, sqlite_busy_timeout_ms=60_000)
+    db = sessionmaker(bind=engine)()
+    try:
+        return generate_invoices(db, year, month, first_user_id, last_user_id)
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def run_invoice_batch(database_url: str, year: int, month: int, workers: int = os.cpu_count() or 1) -> int:
+    """Bill the month for every user, one user-id range per worker process. Returns the invoices created."""
+    engine = create_database_engine(database_url, pool_size=1, max_overflow=0)
+    try:
+        with Session(engine) as db:
+            ranges = user_id_ranges(db, workers)
+    finally:
+        engine.dispose()
+    if workers <= 1 or len(ranges) <= 1:
+        return sum(_generate_range(database_url, year, month, first, last) for first, last in ranges)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_generate_range, database_url, year, month, first, last) for first, last in ranges]
+        return sum(future.result() for future in futures)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from core.config import DATABASE_URL
+
+    previous = datetime.utcnow().replace(day=1) - timedelta(days=1)
+    parser = argparse.ArgumentParser(description="Generate invoices for every user for one month.")
+    parser.add_argument("--year", type=int, default=previous.year)
+    parser.add_argument("--month", type=int, default=previous.month)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    started = datetime.utcnow()
+    created = run_invoice_batch(DATABASE_URL, args.year, args.month, args.workers)
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    print(f"{created} invoices created for {args.year}-{args.month:02d} in {elapsed:.1f}s.")
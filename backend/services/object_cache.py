@@ -0,0 +1,221 @@
+"""
+Node-local read-through cache of S3 objects for the streaming download
+endpoint (/files/{id}/stream), for deployments where clients can't reach S3.
+
+Whole objects are kept as files under OBJECT_CACHE_DIR, evicted least
+recently used first once OBJECT_CACHE_MAX_BYTES is exceeded. Hits are read
+through mmap, so any byte range is served without an S3 request. A miss
+for the whole object streams from S3 to the client and into the cache at
+the same time; range misses go to S3 with a Range request and aren't
+cached.
+
+Only objects under immutable keys (users/{id}/objects/...) are cached, so
+an entry can never go stale. Each process has its own LRU index, so it
+keeps its files in its own subdirectory (worker-<pid>) of OBJECT_CACHE_DIR
+and never touches another worker's; on first use it starts empty and
+removes the subdirectories of processes that are gone.
+"""
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Iterator
+
+from services.file_records import FILE_KEY_PATTERN
+from services.s3_client import open_file_stream
+
+OBJECT_CACHE_ENABLED = os.getenv("OBJECT_CACHE_ENABLED", "true").lower() == "true"
+OBJECT_CACHE_DIR = os.getenv("OBJECT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "object-cache"))
+OBJECT_CACHE_MAX_BYTES = int(os.getenv("OBJECT_CACHE_MAX_BYTES", str(1024 ** 3)))
+# Larger objects are always streamed from S3 so one file can't flush the cache
+OBJECT_CACHE_MAX_OBJECT_BYTES = int(os.getenv("OBJECT_CACHE_MAX_OBJECT_BYTES", str(64 * 1024 * 1024)))
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(1024 * 1024)))
+
+
+class ObjectCache:
+    """Thread-safe, size-capped LRU of whole S3 objects stored on local disk."""
+
+    def __init__(
+        self,
+        directory: str = OBJECT_CACHE_DIR,
+        max_bytes: int = OBJECT_CACHE_MAX_BYTES,
+        max_object_bytes: int = OBJECT_CACHE_MAX_OBJECT_BYTES,
+        enabled: bool = OBJECT_CACHE_ENABLED,
+    ):
+        self.root = directory
+        self.directory = os.path.join(directory, f"worker-{os.getpid()}")
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self.enabled = enabled
+        self._entries: OrderedDict[str, int] = OrderedDict()  # file_key -> size
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._prepared = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, file_key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(file_key.encode()).hexdigest())
+
+    def _prepare(self):
+        """
+        Create this process's directory on first use, empty, and remove the
+        directories of workers that no longer run.
+        """
+        with self._lock:
+            if self._prepared:
+                return
+            # Workers forked after the cache was created get their own directory
+            self.directory = os.path.join(self.root, f"worker-{os.getpid()}")
+            os.makedirs(self.root, exist_ok=True)
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                if path == self.directory or not _process_gone(name):
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+            shutil.rmtree(self.directory, ignore_errors=True)
+            os.makedirs(self.directory)
+            self._prepared = True
+
+    def cacheable(self, file_key: str, size: int) -> bool:
+        return (
+            self.enabled
+            and 0 < size <= min(self.max_object_bytes, self.max_bytes)
+            and FILE_KEY_PATTERN.fullmatch(file_key) is not None
+        )
+
+    def open(self, file_key: str) -> mmap.mmap | None:
+        """Map the cached object read-only, or None on a miss."""
+        with self._lock:
+            if file_key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(file_key)
+        try:
+            with open(self._path(file_key), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # Evicted between the lookup and the open
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return mapped
+
+    def fill(self, file_key: str, chunks, size: int) -> Iterator[bytes]:
+        """
+        Pass `chunks` through while writing them to a temporary file. The
+        object is added once all `size` bytes arrived; if the consumer stops
+        early, the partial file is dropped.
+        """
+        self._prepare()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        added = False
+        try:
+            written = 0
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+                    yield chunk
+            if written == size:
+                self._add(file_key, tmp_path, size)
+                added = True
+        finally:
+            if not added:
+                _remove(tmp_path)
+
+    def _add(self, file_key: str, tmp_path: str, size: int):
+        path = self._path(file_key)
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._bytes += size - self._entries.pop(file_key, 0)
+            self._entries[file_key] = size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                evicted, evicted_size = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+                # Readers that already mapped the file keep their mapping
+                _remove(self._path(evicted))
+
+    def clear(self):
+        with self._lock:
+            for file_key in self._entries:
+                _remove(self._path(file_key))
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _process_gone(name: str) -> bool:
+    """Whether `name` is a worker-<pid> directory whose process has exited."""
+    pid = name.removeprefix("worker-")
+    if not name.startswith("worker-") or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+object_cache = ObjectCache()
+
+
+def _iter_mapped(mapped: mmap.mmap, start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+    try:
+        for offset in range(start, end + 1, chunk_size):
+            yield mapped[offset:min(offset + chunk_size, end + 1)]
+    finally:
+        mapped.close()
+
+
+def _iter_body(body, chunk_size: int) -> Iterator[bytes]:
+    try:
+        yield from body.iter_chunks(chunk_size)
+    finally:
+        body.close()
+
+
+def read_object_range(
+    file_key: str, size: int, start: int, end: int, chunk_size: int = STREAM_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Bytes start..end (inclusive) of the object, from the local cache when it
+    has the object and from S3 otherwise. The S3 request is made before
+    returning, so a missing object raises here rather than mid-stream.
+    """
+    cache = object_cache
+    cacheable = cache.cacheable(file_key, size)
+    mapped = cache.open(file_key) if cacheable else None
+    if mapped is not None:
+        return _iter_mapped(mapped, start, end, chunk_size)
+
+    if start == 0 and end == size - 1:
+        chunks = _iter_body(open_file_stream(file_key), chunk_size)
+        return cache.fill(file_key, chunks, size) if cacheable else chunks
+    return _iter_body(open_file_stream(file_key, start, end), chunk_size)
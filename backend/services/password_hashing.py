@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.config import PASSWORD_HASH_MAX_QUEUED, PASSWORD_HASH_WORKERS
+
+
+class PasswordHashingBusy(Exception):
+    """Every hashing thread is busy and the wait queue is full."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on its own small thread pool, so a burst of logins can't
+    take the threads FastAPI runs sync routes and dependencies on. At most
+    `workers` hashes run at once and `max_queued` more wait for a thread;
+    anything beyond that is rejected with PasswordHashingBusy right away
+    instead of piling up.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queued: int = PASSWORD_HASH_MAX_QUEUED):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._started = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def run(self, fn, *args):
+        """Run `fn(*args)` on the pool and return its result. Raises PasswordHashingBusy when saturated."""
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queued:
+                self.rejected += 1
+                raise PasswordHashingBusy()
+            self._in_flight += 1
+        submitted = time.perf_counter()
+
+        def job():
+            waited = time.perf_counter() - submitted
+            with self._lock:
+                self._started += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            return fn(*args)
+
+        try:
+            return await asyncio.wrap_future(self._executor.submit(job))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "running": min(self._in_flight, self.workers),
+                "queued": max(self._in_flight - self.workers, 0),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": self._wait_total / self._started * 1000 if self._started else 0.0,
+                "max_wait_ms": self._wait_max * 1000,
+            }
+
+
+password_hasher = PasswordHasher()
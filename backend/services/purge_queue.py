@@ -0,0 +1,173 @@
+"""
+Durable queue of S3 objects waiting to be deleted.
+
+Deletes only remove rows and enqueue the object keys in the same
+transaction, so the request never waits on S3 and no object is forgotten
+if S3 is down. A background worker drains the queue in DeleteObjects
+batches; keys that fail are retried with exponential backoff and marked
+"failed" after PURGE_MAX_ATTEMPTS so they show up in the stats.
+
+Drain the queue or inspect it by hand with:
+python -m services.purge_queue [--stats] [--retry-failed]
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import S3PurgeQueue, UserFile
+from services import s3_client
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL = float(os.getenv("PURGE_INTERVAL", "10"))
+PURGE_MAX_ATTEMPTS = int(os.getenv("PURGE_MAX_ATTEMPTS", "8"))
+PURGE_BACKOFF_BASE = float(os.getenv("PURGE_BACKOFF_BASE", "30"))
+PURGE_BACKOFF_MAX = float(os.getenv("PURGE_BACKOFF_MAX", "3600"))
+
+
+def enqueue_s3_deletes(db: Session, keys: list[str]):
+    """Queue objects for deletion. Does not commit; the keys go in with the caller's row changes."""
+    if not keys:
+        return
+    now = datetime.utcnow()
+    db.execute(insert(S3PurgeQueue), [{"file_key": key, "next_attempt_at": now} for key in keys])
+
+
+def referenced_keys(db: Session, keys: list[str]) -> set[str]:
+    """Which of `keys` a live file still points at; those objects must not be deleted."""
+    if not keys:
+        return set()
+    return set(db.execute(
+        select(UserFile.file_key).where(UserFile.file_key.in_(keys), UserFile.deleted_at.is_(None))
+    ).scalars())
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff before the next try after `attempts` failures: base * 2^(attempts-1), capped."""
+    return timedelta(seconds=min(PURGE_BACKOFF_BASE * 2 ** (attempts - 1), PURGE_BACKOFF_MAX))
+
+
+def purge_batch(db: Session, batch_size: int = s3_client.DELETE_BATCH_SIZE, now: datetime | None = None) -> int:
+    """
+    Delete one batch of due keys with a single DeleteObjects call and commit
+    the outcome. Keys a live file points at are skipped, not deleted.
+    Returns how many queue entries were processed (0 when nothing is due).
+    """
+    now = now or datetime.utcnow()
+    rows = db.execute(
+        select(S3PurgeQueue.id, S3PurgeQueue.file_key, S3PurgeQueue.attempts)
+        .where(S3PurgeQueue.status == "pending", S3PurgeQueue.next_attempt_at <= now)
+        .order_by(S3PurgeQueue.next_attempt_at, S3PurgeQueue.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        db.rollback()
+        return 0
+
+    # A key queued earlier may have been taken by a file since; its entry is
+    # dropped without touching S3 (deleting that file queues the key again)
+    in_use = referenced_keys(db, list({row.file_key for row in rows}))
+    if in_use:
+        logger.info("Skipped %d queued keys that live files still use", len(in_use))
+    keys = list({row.file_key for row in rows} - in_use)
+    try:
+        errors = s3_client.delete_objects_batch(keys) if keys else {}
+    except Exception as e:
+        logger.warning("DeleteObjects failed for %d queued keys: %s", len(rows), e)
+        errors = {key: str(e) for key in keys}
+
+    done = [row.id for row in rows if row.file_key not in errors]
+    if done:
+        db.execute(delete(S3PurgeQueue).where(S3PurgeQueue.id.in_(done)))
+    for row in rows:
+        if row.file_key not in errors:
+            continue
+        attempts = row.attempts + 1
+        db.execute(
+            update(S3PurgeQueue).where(S3PurgeQueue.id == row.id).values(
+                attempts=attempts,
+                last_error=errors[row.file_key][:1000],
+                status="failed" if attempts >= PURGE_MAX_ATTEMPTS else "pending",
+                next_attempt_at=now + retry_delay(attempts),
+            )
+        )
+    db.commit()
+    return len(rows)
+
+
+def drain_purge_queue(db: Session, batch_size: int = s3_client.DELETE_BATCH_SIZE, now: datetime | None = None) -> int:
+    """Process batches until nothing is due. Returns the number of entries processed."""
+    total = 0
+    while True:
+        processed = purge_batch(db, batch_size, now)
+        if not processed:
+            return total
+        total += processed
+
+
+def purge_queue_stats(db: Session) -> dict:
+    """Pending and failed counts plus the age of the oldest pending entry, for monitoring."""
+    counts = dict(db.execute(
+        select(S3PurgeQueue.status, func.count()).group_by(S3PurgeQueue.status)
+    ).all())
+    oldest = db.execute(
+        select(func.min(S3PurgeQueue.enqueued_at)).where(S3PurgeQueue.status == "pending")
+    ).scalar()
+    return {
+        "pending": counts.get("pending", 0),
+        "failed": counts.get("failed", 0),
+        "oldest_pending_at": oldest,
+    }
+
+
+def retry_failed_purges(db: Session) -> int:
+    """Put every failed entry back in the queue with a fresh attempt count. Commits."""
+    result = db.execute(
+        update(S3PurgeQueue).where(S3PurgeQueue.status == "failed").values(
+            status="pending", attempts=0, next_attempt_at=datetime.utcnow()
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+async def run_purge_worker(session_factory, interval: float = PURGE_INTERVAL):
+    """Drain the queue every `interval` seconds until cancelled. The blocking work runs on a thread."""
+
+    def drain():
+        db = session_factory()
+        try:
+            return drain_purge_queue(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            processed = await asyncio.to_thread(drain)
+            if processed:
+                logger.info("Purged %d queued S3 objects", processed)
+        except Exception:
+            logger.exception("S3 purge worker iteration failed")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if "--retry-failed" in sys.argv:
+            print(f"{retry_failed_purges(db)} failed entries re-queued.")
+        if "--stats" not in sys.argv:
+            print(f"{drain_purge_queue(db)} entries processed.")
+        stats = purge_queue_stats(db)
+    finally:
+        db.close()
+    print(f"pending {stats['pending']}, failed {stats['failed']}, oldest pending {stats['oldest_pending_at']}")
@@ -0,0 +1,135 @@
+"""
+One-time move of objects stored under name-based keys
+(users/{id}/folders/{folder}/{filename}) to the immutable keys from
+new_file_key.
+
+Files are processed in id order, one batch at a time: the objects are copied
+server-side in parallel, the rows are pointed at the new keys and the old
+keys go on the purge queue, all committed per batch. The job can be stopped
+and rerun at any time; files already on new keys are skipped.
+
+Run it with:
+python -m services.rekey_objects [--dry-run] [--batch-size N]
+"""
+import logging
+import os
+
+from sqlalchemy import and_, bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from models import UserFile
+from services.file_records import new_file_key
+from services.purge_queue import enqueue_s3_deletes
+from services.s3_client import copy_file_in_s3
+from services.upload_service import upload_executor
+
+logger = logging.getLogger(__name__)
+
+REKEY_BATCH_SIZE = int(os.getenv("REKEY_BATCH_SIZE", "500"))
+
+# Deleted files have released their objects already
+legacy_key = and_(UserFile.file_key.not_like("users/%/objects/%"), UserFile.deleted_at.is_(None))
+
+
+def count_legacy_files(db: Session) -> int:
+    return db.execute(select(func.count()).select_from(UserFile).where(legacy_key)).scalar()
+
+
+def _copy(row, new_key: str) -> str | None:
+    try:
+        copy_file_in_s3(row.file_key, new_key, row.file_size)
+    except Exception as e:
+        return str(e)
+    return None
+
+
+def rekey_batch(db: Session, after_id: int = 0, batch_size: int = REKEY_BATCH_SIZE) -> tuple[int | None, int, list[dict]]:
+    """
+    Move the next `batch_size` legacy files with id > after_id and commit.
+    Returns (last id seen or None when done, files moved, failures).
+    """
+    rows = db.execute(
+        select(UserFile.id, UserFile.user_id, UserFile.file_key, UserFile.file_size)
+        .where(legacy_key, UserFile.id > after_id)
+        .order_by(UserFile.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return None, 0, []
+
+    new_keys = [new_file_key(row.user_id) for row in rows]
+    errors = list(upload_executor.map(_copy, rows, new_keys))
+
+    failures = []
+    moved = []
+    for row, new_key, error in zip(rows, new_keys, errors):
+        if error:
+            failures.append({"file_id": row.id, "file_key": row.file_key, "error": error})
+        else:
+            moved.append({"b_id": row.id, "b_old_key": row.file_key, "b_new_key": new_key})
+
+    if moved:
+        table = UserFile.__table__
+        db.execute(
+            update(table)
+            .where(
+                table.c.id == bindparam("b_id"),
+                table.c.file_key == bindparam("b_old_key"),
+                table.c.deleted_at.is_(None),
+            )
+            .values(file_key=bindparam("b_new_key")),
+            moved
+        )
+        # Rows deleted (or changed) while their object was copied kept the old
+        # key, so nothing points at their copy
+        new_keys_in_use = set(db.execute(
+            select(UserFile.file_key).where(UserFile.id.in_([row["b_id"] for row in moved]))
+        ).scalars())
+        unused_copies = {row["b_new_key"] for row in moved} - new_keys_in_use
+        old_keys = {row["b_old_key"] for row in moved}
+        # A key can be shared by several live rows; keep it until the last of
+        # them has moved
+        still_used = set(db.execute(
+            select(UserFile.file_key).where(UserFile.file_key.in_(old_keys), UserFile.deleted_at.is_(None))
+        ).scalars())
+        enqueue_s3_deletes(db, sorted((old_keys - still_used) | unused_copies))
+        moved = [row for row in moved if row["b_new_key"] in new_keys_in_use]
+    db.commit()
+    return rows[-1].id, len(moved), failures
+
+
+def rekey_objects(db: Session, batch_size: int = REKEY_BATCH_SIZE) -> dict:
+    """Move every legacy file. Returns {"moved": n, "failures": [...]}."""
+    moved = 0
+    failures = []
+    after_id = 0
+    while True:
+        after_id, batch_moved, batch_failures = rekey_batch(db, after_id, batch_size)
+        if after_id is None:
+            return {"moved": moved, "failures": failures}
+        moved += batch_moved
+        failures.extend(batch_failures)
+        logger.info("Rekeyed %d files (up to id %d), %d failures", moved, after_id, len(failures))
+
+
+if __name__ == "__main__":
+    import sys
+
+    from core.database import SessionLocal
+
+    batch_size = REKEY_BATCH_SIZE
+    if "--batch-size" in sys.argv:
+        batch_size = int(sys.argv[sys.argv.index("--batch-size") + 1])
+
+    db = SessionLocal()
+    try:
+        if "--dry-run" in sys.argv:
+            print(f"{count_legacy_files(db)} files still use name-based keys.")
+            sys.exit(0)
+        result = rekey_objects(db, batch_size)
+    finally:
+        db.close()
+
+    for failure in result["failures"]:
+        print(f"file {failure['file_id']} ({failure['file_key']}): {failure['error']}")
+    print(f"{result['moved']} files moved to new keys, {len(result['failures'])} failed.")
@@ -1,7 +1,11 @@
 import boto3
+import math
 import os
+from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 
+from services.url_cache import presigned_url_cache
+
 load_dotenv()
 
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
@@ -9,6 +13,21 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_BUCKET_NAME = os.getenv("AWS_BUCKET_NAME")
 AWS_REGION = os.getenv("AWS_REGION")
 
+# Size of each multipart upload part. S3 requires every part except the
+# last to be at least 5 MiB.
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))
+
+# Maximum number of keys S3 accepts in one DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+
+# Direct-to-S3 uploads: files above the threshold use presigned multipart upload
+PRESIGNED_MULTIPART_THRESHOLD = int(os.getenv("PRESIGNED_MULTIPART_THRESHOLD", str(100 * 1024 * 1024)))
+PRESIGNED_UPLOAD_EXPIRES = int(os.getenv("PRESIGNED_UPLOAD_EXPIRES", "3600"))
+MAX_UPLOAD_PARTS = 10000
+
+# Largest object a single CopyObject request can copy
+MAX_COPY_OBJECT_SIZE = 5 * 1024 ** 3
+
 s3 = boto3.client(
     "s3",
     aws_access_key_id=AWS_ACCESS_KEY_ID,
@@ -21,67 +40,245 @@ print("DEBUG key =", AWS_ACCESS_KEY_ID)
 print("DEBUG secret =", AWS_SECRET_ACCESS_KEY)
 print("DEBUG region =", AWS_REGION)
 
-def upload_file_to_s3(file, key: str):
-    s3.upload_fileobj(file, AWS_BUCKET_NAME, key)
+def upload_file_to_s3(file, key: str, part_size: int = UPLOAD_PART_SIZE) -> int:
+    """
+    Stream a file-like object to S3 without reading it fully into memory.
+    Files smaller than one part go up with a single put_object call; larger
+    files use multipart upload, holding only one part in memory at a time.
+    The multipart upload is aborted if any part fails.
+    Returns the number of bytes uploaded.
+    """
+    chunk = file.read(part_size)
+    if len(chunk) < part_size:
+        s3.put_object(Bucket=AWS_BUCKET_NAME, Key=key, Body=chunk)
+        return len(chunk)
+
+    upload_id = s3.create_multipart_upload(Bucket=AWS_BUCKET_NAME, Key=key)["UploadId"]
+    parts = []
+    total = 0
+    try:
+        while chunk:
+            part_number = len(parts) + 1
+            response = s3.upload_part(
+                Bucket=AWS_BUCKET_NAME,
+                Key=key,
+                PartNumber=part_number,
+                UploadId=upload_id,
+                Body=chunk
+            )
+            parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+            total += len(chunk)
+            chunk = file.read(part_size)
+
+        s3.complete_multipart_upload(
+            Bucket=AWS_BUCKET_NAME,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts}
+        )
+    except Exception:
+        s3.abort_multipart_upload(Bucket=AWS_BUCKET_NAME, Key=key, UploadId=upload_id)
+        raise
+
+    return total
 
 def delete_file_from_s3(key: str):
     s3.delete_object(Bucket=AWS_BUCKET_NAME, Key=key)
 
-def generate_presigned_url(key: str, expires_in: int = 300):
+def delete_files_from_s3(keys: list[str]):
     """
-    Generate a temporary URL that allows the user to access S3 file for preview (inline viewing).
-    Forces inline content disposition and proper content type.
+    Delete many objects using batched DeleteObjects calls (up to 1,000 keys each).
+    Raises if S3 reports any key it could not delete.
+    """
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        errors = delete_objects_batch(keys[start:start + DELETE_BATCH_SIZE])
+        if errors:
+            first = next(iter(errors))
+            raise RuntimeError(f"Failed to delete {len(errors)} objects, first: {first}")
+
+def delete_objects_batch(keys: list[str]) -> dict[str, str]:
+    """
+    Delete up to DELETE_BATCH_SIZE objects with one DeleteObjects call.
+    Returns {key: error message} for the keys S3 could not delete.
     """
-    # Determine content type based on file extension
+    response = s3.delete_objects(
+        Bucket=AWS_BUCKET_NAME,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+    )
+    return {
+        error.get("Key"): f"{error.get('Code')}: {error.get('Message')}"
+        for error in response.get("Errors", [])
+    }
+
+def guess_content_type(name: str) -> str:
+    """Content type to serve a file with, based on its file name's extension."""
+    name = name.lower()
     content_type = "application/octet-stream"
-    if key.lower().endswith('.pdf'):
+    if name.endswith('.pdf'):
         content_type = "application/pdf"
-    elif key.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')):
-        content_type = "image/jpeg" if key.lower().endswith(('.jpg', '.jpeg')) else f"image/{key.split('.')[-1]}"
-    elif key.lower().endswith(('.mp4', '.webm')):
-        content_type = f"video/{key.split('.')[-1]}"
-    elif key.lower().endswith(('.mp3', '.wav', '.ogg')):
-        content_type = f"audio/{key.split('.')[-1]}"
-    elif key.lower().endswith(('.txt', '.md', '.log')):
+    elif name.endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')):
+        content_type = "image/jpeg" if name.endswith(('.jpg', '.jpeg')) else f"image/{name.split('.')[-1]}"
+    elif name.endswith(('.mp4', '.webm')):
+        content_type = f"video/{name.split('.')[-1]}"
+    elif name.endswith(('.mp3', '.wav', '.ogg')):
+        content_type = f"audio/{name.split('.')[-1]}"
+    elif name.endswith(('.txt', '.md', '.log')):
         content_type = "text/plain"
-    elif key.lower().endswith(('.html', '.htm')):
+    elif name.endswith(('.html', '.htm')):
         content_type = "text/html"
-    elif key.lower().endswith(('.json',)):
+    elif name.endswith(('.json',)):
         content_type = "application/json"
-    
-    return s3.generate_presigned_url(
-        "get_object",
-        Params={
-            "Bucket": AWS_BUCKET_NAME,
-            "Key": key,
-            "ResponseContentDisposition": "inline",
-            "ResponseContentType": content_type
-        },
-        ExpiresIn=expires_in
+    return content_type
+
+def generate_presigned_url(key: str, expires_in: int = 300, filename: str | None = None):
+    """
+    Generate a temporary URL that allows the user to access S3 file for preview (inline viewing).
+    Forces inline content disposition and proper content type.
+    Keys don't carry the file name, so pass `filename` to pick the content type.
+    URLs are reused from the presigned URL cache while they have enough validity left.
+    """
+    content_type = guess_content_type(filename or key)
+
+    return presigned_url_cache.get_or_create(
+        (key, "inline", content_type),
+        expires_in,
+        lambda: s3.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": AWS_BUCKET_NAME,
+                "Key": key,
+                "ResponseContentDisposition": "inline",
+                "ResponseContentType": content_type
+            },
+            ExpiresIn=expires_in
+        )
     )
 
 def generate_download_url(key: str, filename: str, expires_in: int = 300):
     """
     Generate a presigned URL for downloading a file with proper Content-Disposition header.
     """
+    return presigned_url_cache.get_or_create(
+        (key, "attachment", filename),
+        expires_in,
+        lambda: s3.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": AWS_BUCKET_NAME,
+                "Key": key,
+                "ResponseContentDisposition": f'attachment; filename="{filename}"'
+            },
+            ExpiresIn=expires_in
+        )
+    )
+
+BUCKET_NAME = AWS_BUCKET_NAME
+
+def copy_file_in_s3(source_key: str, destination_key: str, size: int | None = None):
+    """
+    Copy a file from one S3 key to another within the same bucket.
+    CopyObject is limited to 5 GB; larger objects (pass `size`) use a
+    managed multipart copy.
+    """
+    if size is not None and size > MAX_COPY_OBJECT_SIZE:
+        s3.copy({'Bucket': AWS_BUCKET_NAME, 'Key': source_key}, AWS_BUCKET_NAME, destination_key)
+        return
+    s3.copy_object(
+        Bucket=AWS_BUCKET_NAME,
+        CopySource={'Bucket': AWS_BUCKET_NAME, 'Key': source_key},
+        Key=destination_key
+    )
+
+
+def get_multipart_part_size(file_size: int) -> int:
+    """Part size for a presigned multipart upload, staying within S3's 10,000 part limit."""
+    return max(UPLOAD_PART_SIZE, math.ceil(file_size / MAX_UPLOAD_PARTS))
+
+def generate_upload_url(key: str, content_type: str | None = None, expires_in: int = PRESIGNED_UPLOAD_EXPIRES):
+    """
+    Generate a presigned PUT URL so the client can upload a file directly to S3.
+    """
+    params = {"Bucket": AWS_BUCKET_NAME, "Key": key}
+    if content_type:
+        params["ContentType"] = content_type
+    return s3.generate_presigned_url("put_object", Params=params, ExpiresIn=expires_in)
+
+def create_multipart_upload(key: str, content_type: str | None = None) -> str:
+    """Start a multipart upload and return its upload id."""
+    params = {"Bucket": AWS_BUCKET_NAME, "Key": key}
+    if content_type:
+        params["ContentType"] = content_type
+    return s3.create_multipart_upload(**params)["UploadId"]
+
+def generate_upload_part_url(key: str, upload_id: str, part_number: int, expires_in: int = PRESIGNED_UPLOAD_EXPIRES):
+    """
+    Generate a presigned URL for uploading one part of a multipart upload.
+    """
     return s3.generate_presigned_url(
-        "get_object",
+        "upload_part",
         Params={
             "Bucket": AWS_BUCKET_NAME,
             "Key": key,
-            "ResponseContentDisposition": f'attachment; filename="{filename}"'
+            "UploadId": upload_id,
+            "PartNumber": part_number
         },
         ExpiresIn=expires_in
     )
 
-BUCKET_NAME = AWS_BUCKET_NAME
+def upload_part(key: str, upload_id: str, part_number: int, body) -> str:
+    """Upload one part of a multipart upload from bytes or a seekable file. Returns the part's ETag."""
+    response = s3.upload_part(
+        Bucket=AWS_BUCKET_NAME,
+        Key=key,
+        PartNumber=part_number,
+        UploadId=upload_id,
+        Body=body
+    )
+    return response["ETag"]
 
-def copy_file_in_s3(source_key: str, destination_key: str):
+def complete_multipart_upload(key: str, upload_id: str, parts: list[dict]) -> str:
     """
-    Copy a file from one S3 key to another within the same bucket.
+    Complete a multipart upload from its (PartNumber, ETag) list. Returns the object's ETag.
     """
-    s3.copy_object(
+    response = s3.complete_multipart_upload(
         Bucket=AWS_BUCKET_NAME,
-        CopySource={'Bucket': AWS_BUCKET_NAME, 'Key': source_key},
-        Key=destination_key
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])}
     )
+    return response["ETag"]
+
+def abort_multipart_upload(key: str, upload_id: str, missing_ok: bool = False) -> bool:
+    """
+    Abort a multipart upload. With missing_ok, an upload S3 no longer knows
+    about (already aborted or completed) returns False instead of raising.
+    """
+    try:
+        s3.abort_multipart_upload(Bucket=AWS_BUCKET_NAME, Key=key, UploadId=upload_id)
+    except ClientError as e:
+        if missing_ok and e.response.get("Error", {}).get("Code") == "NoSuchUpload":
+            return False
+        raise
+    return True
+
+def head_file_in_s3(key: str) -> dict | None:
+    """
+    Return the object's metadata (ContentLength, ETag, ...) or None if it doesn't exist.
+    """
+    try:
+        return s3.head_object(Bucket=AWS_BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+def open_file_stream(key: str, start: int | None = None, end: int | None = None):
+    """
+    Start a GET for the object and return its streaming body without reading it.
+    Iterate `body.iter_chunks(size)` to consume it a chunk at a time.
+    With `start` and `end`, only those bytes (inclusive) are fetched.
+    """
+    params = {"Bucket": AWS_BUCKET_NAME, "Key": key}
+    if start is not None:
+        params["Range"] = f"bytes={start}-{end}"
+    return s3.get_object(**params)["Body"]
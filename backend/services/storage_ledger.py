@@ -0,0 +1,258 @@
+"""
+Storage ledger for billing.
+
+Every upload and delete of a live file appends a storage_events row with
+its byte delta and advances the user's storage_usage_months row for the
+month it happened in: byte_seconds grows by active_bytes times the seconds
+since the previous event, then active_bytes takes the delta. A month's row
+opens with the balance of the user's previous row, so months without
+events need no row at all. Usage up to now is one row lookup plus
+active_bytes times the elapsed seconds, however many files the user has.
+
+compute_month_usage is the scan over user_files that the ledger replaces;
+it is exact for months whose deleted files have not been compacted yet
+(services.deleted_files), which always includes the current one. check_storage_ledger compares the two, and
+rebuild_usage_months replays storage_events to rewrite the accumulators.
+
+Run the check (and optionally the rebuild) with:
+python -m services.storage_ledger [--rebuild]
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, case, delete, func, insert, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from core.database import dialect_insert
+from models import StorageEvent, StorageUsageMonth, UserFile
+
+SECONDS_PER_DAY = 86400
+BYTES_PER_GB = 1024 ** 3
+
+
+def month_bounds(year: int, month: int) -> tuple[datetime, datetime]:
+    """Start of the month and start of the next one (naive UTC)."""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+
+def to_gb_days(byte_seconds: float) -> float:
+    return byte_seconds / BYTES_PER_GB / SECONDS_PER_DAY
+
+
+def _naive(value: datetime | None) -> datetime | None:
+    return value.replace(tzinfo=None) if value is not None and value.tzinfo else value
+
+
+def up_to_month(table, year: int, month):
+    """Rows of `table` for the given month or earlier."""
+    return or_(table.c.year < year, and_(table.c.year == year, table.c.month <= month))
+
+
+def record_storage_events(db: Session, events, at: datetime | None = None):
+    """
+    Append events given as (user_id, file_id, event_type, byte_delta) tuples,
+    all happening at `at` (default now, naive UTC), and advance the users'
+    accumulators for that month. Does not commit.
+    """
+    events = list(events)
+    if not events:
+        return
+    at = at or datetime.utcnow()
+    db.execute(insert(StorageEvent), [
+        {"user_id": user_id, "file_id": file_id, "event_type": event_type, "byte_delta": delta, "occurred_at": at}
+        for user_id, file_id, event_type, delta in events
+    ])
+
+    deltas = defaultdict(int)
+    for user_id, _, _, delta in events:
+        deltas[user_id] += delta
+    start, _ = month_bounds(at.year, at.month)
+    seconds = (at - start).total_seconds()
+    table = StorageUsageMonth.__table__
+
+    # Open the month with the balance of the user's latest earlier month
+    previous = (
+        select(table.c.active_bytes)
+        .where(table.c.user_id == bindparam("b_user_id"), up_to_month(table, at.year, at.month - 1))
+        .order_by(table.c.year.desc(), table.c.month.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    opening = dialect_insert(db, table).values(
+        user_id=bindparam("b_user_id"), year=at.year, month=at.month,
+        active_bytes=func.coalesce(previous, 0), byte_seconds=0, accounted_seconds=0,
+    )
+    db.execute(
+        opening.on_conflict_do_nothing(index_elements=["user_id", "year", "month"]),
+        [{"b_user_id": user_id} for user_id in deltas]
+    )
+
+    # An event that commits after a later one counts from the later one's time
+    later = table.c.accounted_seconds < seconds
+    db.execute(
+        update(table)
+        .where(table.c.user_id == bindparam("b_user_id"), table.c.year == at.year, table.c.month == at.month)
+        .values(
+            byte_seconds=table.c.byte_seconds + table.c.active_bytes * case((later, seconds - table.c.accounted_seconds), else_=0),
+            active_bytes=table.c.active_bytes + bindparam("b_delta"),
+            accounted_seconds=case((later, seconds), else_=table.c.accounted_seconds),
+        ),
+        [{"b_user_id": user_id, "b_delta": delta} for user_id, delta in deltas.items()]
+    )
+
+
+def get_month_usage(db: Session, user_id: int, year: int, month: int, now: datetime | None = None) -> tuple[float, int]:
+    """
+    (byte_seconds, active_bytes) of the user in the month, counted up to
+    `now` or the end of the month, whichever comes first. Reads one row.
+    """
+    start, end = month_bounds(year, month)
+    until = max((min(now or datetime.utcnow(), end) - start).total_seconds(), 0)
+    table = StorageUsageMonth.__table__
+    row = db.execute(
+        select(table.c.year, table.c.month, table.c.active_bytes, table.c.byte_seconds, table.c.accounted_seconds)
+        .where(table.c.user_id == user_id, up_to_month(table, year, month))
+        .order_by(table.c.year.desc(), table.c.month.desc())
+        .limit(1)
+    ).first()
+    if row is None:
+        return 0.0, 0
+    return usage_from_row(row, year, month, until)
+
+
+def usage_from_row(row, year: int, month: int, until: float) -> tuple[float, int]:
+    """
+    (byte_seconds, active_bytes) of a month up to `until` seconds into it,
+    from the user's latest storage_usage_months row up to that month.
+    """
+    if (row.year, row.month) != (year, month):
+        # No events this month: the carried-over balance was stored all along
+        return row.active_bytes * until, row.active_bytes
+    return row.byte_seconds + row.active_bytes * max(until - row.accounted_seconds, 0), row.active_bytes
+
+
+def compute_month_usage(db: Session, user_id: int, year: int, month: int, now: datetime | None = None) -> tuple[float, int]:
+    """
+    Same as get_month_usage, computed by scanning every user_files row of
+    the user, live or deleted.
+    """
+    start, end = month_bounds(year, month)
+    until = min(now or datetime.utcnow(), end)
+    periods = db.execute(
+        select(UserFile.file_size, UserFile.uploaded_at, UserFile.deleted_at).where(UserFile.user_id == user_id)
+    )
+
+    byte_seconds = 0.0
+    active_bytes = 0
+    for size, uploaded_at, deleted_at in periods:
+        uploaded_at, deleted_at = _naive(uploaded_at), _naive(deleted_at)
+        stored_until = until if deleted_at is None else min(deleted_at, until)
+        seconds = (stored_until - max(uploaded_at, start)).total_seconds()
+        if seconds > 0:
+            byte_seconds += size * seconds
+        if uploaded_at <= until and (deleted_at is None or deleted_at > until):
+            active_bytes += size
+    return byte_seconds, active_bytes
+
+
+def rebuild_usage_months(db: Session, user_id: int | None = None) -> int:
+    """
+    Rewrite storage_usage_months by replaying storage_events in time order,
+    and commit. Returns the number of month rows written.
+    """
+    query = select(StorageEvent.user_id, StorageEvent.byte_delta, StorageEvent.occurred_at).order_by(
+        StorageEvent.user_id, StorageEvent.occurred_at, StorageEvent.id
+    )
+    if user_id is not None:
+        query = query.where(StorageEvent.user_id == user_id)
+
+    rows = []
+    current = None
+    for event in db.execute(query).yield_per(10_000):
+        at = event.occurred_at
+        if current is None or (current["user_id"], current["year"], current["month"]) != (event.user_id, at.year, at.month):
+            opening = current["active_bytes"] if current and current["user_id"] == event.user_id else 0
+            current = {
+                "user_id": event.user_id, "year": at.year, "month": at.month,
+                "active_bytes": opening, "byte_seconds": 0.0, "accounted_seconds": 0.0,
+            }
+            rows.append(current)
+        seconds = (at - month_bounds(at.year, at.month)[0]).total_seconds()
+        current["byte_seconds"] += current["active_bytes"] * (seconds - current["accounted_seconds"])
+        current["active_bytes"] += event.byte_delta
+        current["accounted_seconds"] = seconds
+
+    stale = delete(StorageUsageMonth)
+    if user_id is not None:
+        stale = stale.where(StorageUsageMonth.user_id == user_id)
+    db.execute(stale)
+    if rows:
+        db.execute(insert(StorageUsageMonth), rows)
+    db.commit()
+    return len(rows)
+
+
+def backfill_storage_events(db: Session):
+    """
+    Build storage_events from the existing user_files rows: an upload event
+    per file and a delete event for the deleted ones. Compacted files are
+    gone from user_files, so this only rebuilds a complete ledger before the
+    first compaction. Does not commit.
+    """
+    upload = literal("upload")
+    removal = literal("delete")
+    db.execute(insert(StorageEvent).from_select(
+        ["user_id", "file_id", "event_type", "byte_delta", "occurred_at"],
+        select(UserFile.user_id, UserFile.id, upload, UserFile.file_size, UserFile.uploaded_at)
+    ))
+    db.execute(insert(StorageEvent).from_select(
+        ["user_id", "file_id", "event_type", "byte_delta", "occurred_at"],
+        select(UserFile.user_id, UserFile.id, removal, -UserFile.file_size, UserFile.deleted_at)
+        .where(UserFile.deleted_at.is_not(None))
+    ))
+
+
+def check_storage_ledger(db: Session, now: datetime | None = None, tolerance: float = 1e-6) -> list[dict]:
+    """
+    Compare this month's ledger usage with the row scan for every user with
+    files or events. Returns one entry per user whose byte-seconds differ by
+    more than `tolerance` (relative) or whose active bytes differ.
+    """
+    now = now or datetime.utcnow()
+    user_ids = set(db.execute(select(StorageEvent.user_id).distinct()).scalars())
+    user_ids |= set(db.execute(select(UserFile.user_id).distinct()).scalars())
+
+    drift = []
+    for user_id in sorted(user_ids):
+        ledger = get_month_usage(db, user_id, now.year, now.month, now)
+        actual = compute_month_usage(db, user_id, now.year, now.month, now)
+        if ledger[1] != actual[1] or abs(ledger[0] - actual[0]) > tolerance * max(actual[0], 1.0):
+            drift.append({
+                "user_id": user_id,
+                "ledger_gb_days": to_gb_days(ledger[0]), "actual_gb_days": to_gb_days(actual[0]),
+                "ledger_bytes": ledger[1], "actual_bytes": actual[1],
+            })
+    return drift
+
+
+if __name__ == "__main__":
+    import sys
+
+    from core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if "--rebuild" in sys.argv:
+            print(f"{rebuild_usage_months(db)} monthly usage rows rebuilt from storage events.")
+        results = check_storage_ledger(db)
+    finally:
+        db.close()
+
+    for entry in results:
+        print(
+            f"user {entry['user_id']}: ledger {entry['ledger_gb_days']:.6f} GB-days / {entry['ledger_bytes']} bytes, "
+            f"actual {entry['actual_gb_days']:.6f} GB-days / {entry['actual_bytes']} bytes"
+        )
+    print(f"{len(results)} users drifted.")
@@ -0,0 +1,164 @@
+"""
+Per-user and per-folder storage counters.
+
+Every route that adds, removes or moves live files calls add_storage_usage
+inside its own transaction, so /storage reads one row instead of running
+COUNT/SUM over all of a user's files. reconcile_storage_usage recomputes
+the counters from user_files and reports (and by default fixes) any drift.
+
+Run the reconciliation job with:
+python -m services.storage_usage [--dry-run]
+"""
+from collections import defaultdict
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from core.database import dialect_insert
+from models import UserFile, UserStorageUsage, FolderStorageUsage
+
+
+def add_storage_usage(db: Session, files, sign: int = 1):
+    """
+    Add (sign=1) or subtract (sign=-1) files from the storage counters.
+    `files` is an iterable of (user_id, folder_id, file_size) tuples.
+    Does not commit; the counters change together with the caller's file rows.
+    """
+    users = defaultdict(lambda: [0, 0])
+    folders = defaultdict(lambda: [0, 0])
+    for user_id, folder_id, file_size in files:
+        users[user_id][0] += sign
+        users[user_id][1] += sign * file_size
+        folders[(user_id, folder_id or 0)][0] += sign
+        folders[(user_id, folder_id or 0)][1] += sign * file_size
+
+    if not users:
+        return
+
+    for model, rows, keys in (
+        (UserStorageUsage, [
+            {"user_id": user_id, "file_count": count, "total_bytes": size}
+            for user_id, (count, size) in users.items()
+        ], ["user_id"]),
+        (FolderStorageUsage, [
+            {"user_id": user_id, "folder_id": folder_id, "file_count": count, "total_bytes": size}
+            for (user_id, folder_id), (count, size) in folders.items()
+        ], ["user_id", "folder_id"]),
+    ):
+        stmt = dialect_insert(db, model.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={
+                "file_count": model.__table__.c.file_count + stmt.excluded.file_count,
+                "total_bytes": model.__table__.c.total_bytes + stmt.excluded.total_bytes,
+            }
+        )
+        db.execute(stmt, rows)
+
+
+def get_storage_usage(db: Session, user_id: int) -> tuple[int, int]:
+    """(file_count, total_bytes) for the user's live files."""
+    usage = db.get(UserStorageUsage, user_id)
+    if usage is None:
+        return 0, 0
+    return usage.file_count, usage.total_bytes
+
+
+def compute_storage_usage(db: Session, user_id: int | None = None) -> dict[tuple[int, int], tuple[int, int]]:
+    """Recompute {(user_id, folder_id): (file_count, total_bytes)} from user_files."""
+    folder_key = func.coalesce(UserFile.folder_id, 0)
+    query = (
+        select(UserFile.user_id, folder_key, func.count(), func.sum(UserFile.file_size))
+        .where(UserFile.deleted_at.is_(None))
+        .group_by(UserFile.user_id, folder_key)
+    )
+    if user_id is not None:
+        query = query.where(UserFile.user_id == user_id)
+    return {(row[0], row[1]): (row[2], row[3] or 0) for row in db.execute(query)}
+
+
+def reconcile_storage_usage(db: Session, user_id: int | None = None, fix: bool = True) -> list[dict]:
+    """
+    Compare the counters with user_files and return one entry per drifted
+    user total or folder. With fix=True the drifted users' counters are
+    rewritten from the recomputed values and committed.
+    """
+    actual_folders = compute_storage_usage(db, user_id)
+
+    folder_query = select(FolderStorageUsage)
+    user_query = select(UserStorageUsage)
+    if user_id is not None:
+        folder_query = folder_query.where(FolderStorageUsage.user_id == user_id)
+        user_query = user_query.where(UserStorageUsage.user_id == user_id)
+    stored_folders = {
+        (row.user_id, row.folder_id): (row.file_count, row.total_bytes)
+        for row in db.scalars(folder_query)
+    }
+    stored_users = {row.user_id: (row.file_count, row.total_bytes) for row in db.scalars(user_query)}
+
+    actual_users = defaultdict(lambda: (0, 0))
+    for (uid, _), (count, size) in actual_folders.items():
+        actual_users[uid] = (actual_users[uid][0] + count, actual_users[uid][1] + size)
+
+    drift = []
+    for uid in set(actual_users) | set(stored_users):
+        stored = stored_users.get(uid, (0, 0))
+        if stored != actual_users[uid]:
+            drift.append({
+                "user_id": uid, "folder_id": None,
+                "stored_files": stored[0], "actual_files": actual_users[uid][0],
+                "stored_bytes": stored[1], "actual_bytes": actual_users[uid][1],
+            })
+    for key in set(actual_folders) | set(stored_folders):
+        stored = stored_folders.get(key, (0, 0))
+        actual = actual_folders.get(key, (0, 0))
+        if stored != actual:
+            drift.append({
+                "user_id": key[0], "folder_id": key[1],
+                "stored_files": stored[0], "actual_files": actual[0],
+                "stored_bytes": stored[1], "actual_bytes": actual[1],
+            })
+
+    if fix and drift:
+        drifted_users = {entry["user_id"] for entry in drift}
+        db.execute(delete(FolderStorageUsage).where(FolderStorageUsage.user_id.in_(drifted_users)))
+        db.execute(delete(UserStorageUsage).where(UserStorageUsage.user_id.in_(drifted_users)))
+
+        user_rows = [
+            {"user_id": uid, "file_count": actual_users[uid][0], "total_bytes": actual_users[uid][1]}
+            for uid in drifted_users
+            if uid in actual_users
+        ]
+        folder_rows = [
+            {"user_id": uid, "folder_id": folder_id, "file_count": count, "total_bytes": size}
+            for (uid, folder_id), (count, size) in actual_folders.items()
+            if uid in drifted_users
+        ]
+        if user_rows:
+            db.execute(insert(UserStorageUsage), user_rows)
+        if folder_rows:
+            db.execute(insert(FolderStorageUsage), folder_rows)
+        db.commit()
+
+    return drift
+
+
+if __name__ == "__main__":
+    import sys
+
+    from core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        results = reconcile_storage_usage(db, fix="--dry-run" not in sys.argv)
+    finally:
+        db.close()
+
+    for entry in results:
+        where = "total" if entry["folder_id"] is None else f"folder {entry['folder_id']}"
+        print(
+            f"user {entry['user_id']} {where}: "
+            f"stored {entry['stored_files']} files / {entry['stored_bytes']} bytes, "
+            f"actual {entry['actual_files']} files / {entry['actual_bytes']} bytes"
+        )
+    print(f"{len(results)} counters drifted.")
@@ -0,0 +1,28 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from core.config import UPLOAD_CONCURRENCY, UPLOAD_WORKERS
+
+# Shared by all requests so the total number of upload threads stays bounded
+upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="s3-upload")
+
+
+async def upload_files_concurrently(uploads, upload, concurrency: int = UPLOAD_CONCURRENCY):
+    """
+    Run `upload(fileobj, key)` for every (fileobj, key) pair on the upload
+    thread pool, with at most `concurrency` uploads of this batch in flight.
+    The blocking S3 calls never run on the event loop.
+    Returns one entry per upload: None on success, or the raised exception.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def run(fileobj, key):
+        async with semaphore:
+            try:
+                await loop.run_in_executor(upload_executor, upload, fileobj, key)
+            except Exception as e:
+                return e
+            return None
+
+    return await asyncio.gather(*(run(fileobj, key) for fileobj, key in uploads))
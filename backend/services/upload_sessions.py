@@ -0,0 +1,233 @@
+"""
+Resumable uploads through the API.
+
+A session maps one file onto an S3 multipart upload: chunk n of the file
+(offset (n - 1) * part_size) becomes part n. The client PUTs chunks in any
+order, can repeat a chunk that failed or got cut off, asks for the status
+to find what is still missing after an interruption, and finalizes once
+every chunk is in. A chunk is spooled to a temporary file while it
+arrives, so at most UPLOAD_CHUNK_MEMORY bytes of it are held in memory.
+
+Sessions that see no chunk for UPLOAD_SESSION_TTL seconds expire; the
+cleanup job aborts their multipart uploads so S3 drops the stored parts.
+Run it once with:
+python -m services.upload_sessions
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from core.database import dialect_insert
+from models import UploadSession, UploadSessionPart, UserFile
+from services.file_records import new_file_key
+from services.purge_queue import enqueue_s3_deletes
+from services.s3_client import abort_multipart_upload, create_multipart_upload, get_multipart_part_size
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+UPLOAD_CLEANUP_INTERVAL = float(os.getenv("UPLOAD_CLEANUP_INTERVAL", "600"))
+# Bytes of an incoming chunk kept in memory; the rest is spooled to disk
+UPLOAD_CHUNK_MEMORY = int(os.getenv("UPLOAD_CHUNK_MEMORY", str(8 * 1024 * 1024)))
+
+
+def part_count(session: UploadSession) -> int:
+    return (session.file_size + session.part_size - 1) // session.part_size
+
+
+def create_upload_session(
+    db: Session, user_id: int, folder_id: int | None, filename: str, file_size: int,
+    content_type: str | None = None
+) -> UploadSession:
+    """Start the S3 multipart upload and add its session. Does not commit."""
+    key = new_file_key(user_id)
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        folder_id=folder_id,
+        filename=filename,
+        file_size=file_size,
+        part_size=get_multipart_part_size(file_size),
+        file_key=key,
+        s3_upload_id=create_multipart_upload(key, content_type),
+        expires_at=datetime.utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL),
+    )
+    db.add(session)
+    return session
+
+
+def chunk_size_at(session: UploadSession, offset: int) -> int:
+    """
+    Size of the chunk at `offset`. Chunks must start on a part boundary and
+    fill the whole part (the last one runs to the end of the file). Raises
+    ValueError for any other offset.
+    """
+    if offset < 0 or offset >= session.file_size or offset % session.part_size:
+        raise ValueError(f"Offset must be a multiple of {session.part_size} below {session.file_size}")
+    return min(session.part_size, session.file_size - offset)
+
+
+def part_for_chunk(session: UploadSession, offset: int, length: int) -> int:
+    """Part number for a chunk at `offset` of `length` bytes. Raises ValueError if it doesn't fit (chunk_size_at)."""
+    expected = chunk_size_at(session, offset)
+    if length != expected:
+        raise ValueError(f"Chunk at offset {offset} must be {expected} bytes, got {length}")
+    return offset // session.part_size + 1
+
+
+async def spool_chunk(stream, max_length: int) -> tuple[tempfile.SpooledTemporaryFile, int]:
+    """
+    Collect a chunk from the async byte iterator `stream` (request.stream())
+    into a file that stays in memory up to UPLOAD_CHUNK_MEMORY bytes and
+    moves to disk beyond. Returns the file, rewound, and its length; the
+    caller closes it. Raises ValueError as soon as more than `max_length`
+    bytes arrive.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CHUNK_MEMORY)
+    length = 0
+    try:
+        async for data in stream:
+            length += len(data)
+            if length > max_length:
+                raise ValueError(f"Chunk is larger than the expected {max_length} bytes")
+            spool.write(data)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, length
+
+
+def record_part(db: Session, session: UploadSession, part_number: int, etag: str, size: int):
+    """Store (or replace) a received part and extend the session's expiry. Does not commit."""
+    stmt = dialect_insert(db, UploadSessionPart.__table__).values(
+        session_id=session.id, part_number=part_number, etag=etag, size=size
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["session_id", "part_number"],
+        set_={"etag": stmt.excluded.etag, "size": stmt.excluded.size},
+    ))
+    db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == session.id)
+        .values(expires_at=datetime.utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL))
+    )
+
+
+def get_parts(db: Session, session_id: str) -> list:
+    """The session's received parts as (part_number, etag, size) rows, in order."""
+    return db.execute(
+        select(UploadSessionPart.part_number, UploadSessionPart.etag, UploadSessionPart.size)
+        .where(UploadSessionPart.session_id == session_id)
+        .order_by(UploadSessionPart.part_number)
+    ).all()
+
+
+def upload_session_status(db: Session, session: UploadSession) -> dict:
+    """What the client needs to resume: received parts and the first offset still missing."""
+    parts = get_parts(db, session.id)
+    received = {part.part_number for part in parts}
+    missing = [n for n in range(1, part_count(session) + 1) if n not in received]
+    return {
+        "upload_id": session.id,
+        "filename": session.filename,
+        "file_size": session.file_size,
+        "part_size": session.part_size,
+        "received_bytes": sum(part.size for part in parts),
+        "received_parts": sorted(received),
+        "next_offset": (missing[0] - 1) * session.part_size if missing else None,
+        "expires_at": session.expires_at,
+    }
+
+
+def delete_upload_session(db: Session, session_id: str):
+    """Remove the session and its parts. Does not commit."""
+    db.execute(delete(UploadSessionPart).where(UploadSessionPart.session_id == session_id))
+    db.execute(delete(UploadSession).where(UploadSession.id == session_id))
+
+
+def expire_upload_sessions(db: Session, now: datetime | None = None, batch_size: int = 100) -> int:
+    """
+    Abort the multipart uploads of expired sessions and delete the sessions,
+    committing after each. A session whose abort fails is kept for the next
+    run. Returns the number of sessions removed.
+    """
+    now = now or datetime.utcnow()
+    sessions = db.execute(
+        select(UploadSession.id, UploadSession.file_key, UploadSession.s3_upload_id)
+        .where(UploadSession.expires_at <= now)
+        .order_by(UploadSession.expires_at)
+        .limit(batch_size)
+    ).all()
+
+    removed = 0
+    for session in sessions:
+        try:
+            aborted = abort_multipart_upload(session.file_key, session.s3_upload_id, missing_ok=True)
+        except Exception:
+            logger.exception("Failed to abort multipart upload of session %s", session.id)
+            continue
+        # S3 may have assembled the object before a finalize that never
+        # reached the database; drop it unless a file row uses it
+        if not aborted and not db.execute(
+            select(UserFile.id).where(UserFile.file_key == session.file_key).limit(1)
+        ).first():
+            enqueue_s3_deletes(db, [session.file_key])
+        delete_upload_session(db, session.id)
+        db.commit()
+        removed += 1
+    return removed
+
+
+def count_upload_sessions(db: Session, now: datetime | None = None) -> tuple[int, int]:
+    """(active, expired) session counts."""
+    now = now or datetime.utcnow()
+    expired = UploadSession.expires_at <= now
+    row = db.execute(select(
+        func.count().filter(~expired), func.count().filter(expired)
+    ).select_from(UploadSession)).one()
+    return row[0], row[1]
+
+
+async def run_upload_session_cleanup(session_factory, interval: float = UPLOAD_CLEANUP_INTERVAL):
+    """Expire abandoned sessions every `interval` seconds until cancelled. The blocking work runs on a thread."""
+
+    def expire():
+        db = session_factory()
+        try:
+            return expire_upload_sessions(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            removed = await asyncio.to_thread(expire)
+            if removed:
+                logger.info("Expired %d abandoned upload sessions", removed)
+        except Exception:
+            logger.exception("Upload session cleanup failed")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    from core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        removed = 0
+        while True:
+            batch = expire_upload_sessions(db)
+            removed += batch
+            if batch == 0:
+                break
+        active, expired = count_upload_sessions(db)
+    finally:
+        db.close()
+
+    print(f"{removed} expired upload sessions removed; {active} active, {expired} still expired.")
@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+URL_CACHE_ENABLED = os.getenv("URL_CACHE_ENABLED", "true").lower() == "true"
+URL_CACHE_MAX_ENTRIES = int(os.getenv("URL_CACHE_MAX_ENTRIES", "100000"))
+URL_CACHE_MAX_BYTES = int(os.getenv("URL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Stop handing out a cached URL once it has less than this many seconds left
+URL_CACHE_SAFETY_MARGIN = int(os.getenv("URL_CACHE_SAFETY_MARGIN", "60"))
+
+# Rough per-entry overhead of the dict slot, tuple and float on top of the strings
+ENTRY_OVERHEAD_BYTES = 200
+
+
+class PresignedUrlCache:
+    """
+    Thread-safe LRU cache of presigned URLs.
+    Entries are keyed by the caller's key (file_key, disposition, filename)
+    plus the requested lifetime, so a caller asking for a long-lived URL
+    never gets one signed for a shorter time, and reused until
+    `safety_margin` seconds before the URL expires. The cache is capped both
+    by entry count and by the approximate memory used by the stored strings.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = URL_CACHE_MAX_ENTRIES,
+        max_bytes: int = URL_CACHE_MAX_BYTES,
+        safety_margin: int = URL_CACHE_SAFETY_MARGIN,
+        enabled: bool = URL_CACHE_ENABLED,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.safety_margin = safety_margin
+        self.enabled = enabled
+        self._entries: OrderedDict[tuple, tuple[str, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, cache_key: tuple, expires_in: int, create) -> str:
+        """Return a cached URL for `cache_key`, or call `create()` to sign a new one."""
+        if not self.enabled or expires_in <= self.safety_margin:
+            return create()
+
+        cache_key = (*cache_key, expires_in)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] - self.safety_margin > now:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Sign outside the lock so concurrent misses don't serialize on HMAC work
+        url = create()
+        size = len(url) + sum(len(part) for part in cache_key if isinstance(part, str)) + ENTRY_OVERHEAD_BYTES
+
+        with self._lock:
+            old = self._entries.pop(cache_key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[cache_key] = (url, now + expires_in, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+        return url
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+presigned_url_cache = PresignedUrlCache()
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+USER_CACHE_ENABLED = os.getenv("USER_CACHE_ENABLED", "true").lower() == "true"
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+# Changes made by another process (or straight in the database) show up after at most this long
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """The fields of User the routes read, detached from any session."""
+    id: int
+    name: str
+    email: str
+    is_verified: bool
+
+    @classmethod
+    def from_user(cls, user) -> "AuthenticatedUser":
+        return cls(id=user.id, name=user.name, email=user.email, is_verified=user.is_verified)
+
+
+class AuthenticatedUserCache:
+    """
+    Thread-safe LRU cache of the users behind access tokens, so a request
+    with a known token skips the users query. Entries are keyed by the
+    token's identity claims (sub, uid, iat) and kept for `ttl` seconds.
+    invalidate() drops a user's entries right away in this process.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = USER_CACHE_MAX_ENTRIES,
+        ttl: float = USER_CACHE_TTL,
+        enabled: bool = USER_CACHE_ENABLED,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries: OrderedDict[tuple, tuple[AuthenticatedUser, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by invalidate() and clear(), so a load racing with them isn't cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, cache_key: tuple, load) -> AuthenticatedUser | None:
+        """Return the cached user for `cache_key`, or call `load()` and cache what it returns (unless None)."""
+        if not self.enabled:
+            return load()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        # Query outside the lock so concurrent misses don't wait on each other
+        user = load()
+        if user is None:
+            return None
+
+        with self._lock:
+            if generation != self._generation:
+                return user
+            self._entries.pop(cache_key, None)
+            self._entries[cache_key] = (user, now + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return user
+
+    def invalidate(self, user_id: int):
+        """Forget every cached token of the user, e.g. after their account changed."""
+        with self._lock:
+            stale = [key for key, (user, _) in self._entries.items() if user.id == user_id]
+            for key in stale:
+                del self._entries[key]
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+authenticated_user_cache = AuthenticatedUserCache()
@@ -0,0 +1,153 @@
+"""
+Streaming ZIP archives for folder downloads.
+
+stream_zip writes the archive to a write-only sink and yields its bytes as
+they are produced, so the first byte goes out as soon as the first S3 chunk
+arrives and memory stays at a few chunks no matter how large the folder is.
+Entries are written with data descriptors (no seeking back to patch sizes)
+and switch to zip64 automatically for large files and archives.
+"""
+import logging
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+ZIP_CHUNK_SIZE = int(os.getenv("ZIP_CHUNK_SIZE", str(1024 * 1024)))
+# Archive entry listing the files that could not be included
+ERROR_MANIFEST_NAME = "DOWNLOAD_ERRORS.txt"
+
+# Formats that are already compressed; deflating them again only costs CPU
+STORED_EXTENSIONS = {
+    ".7z", ".aac", ".avi", ".bz2", ".docx", ".flac", ".gif", ".gz", ".heic",
+    ".jpeg", ".jpg", ".m4a", ".mkv", ".mov", ".mp3", ".mp4", ".ogg", ".png",
+    ".pptx", ".rar", ".webm", ".webp", ".xlsx", ".xz", ".zip", ".zst",
+}
+
+# Shared by all downloads; each archive keeps at most one prefetch in flight
+prefetch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="zip-prefetch")
+
+
+@dataclass
+class ZipEntry:
+    arcname: str
+    key: str
+    size: int
+    modified_at: datetime | None = None
+
+
+class _StreamSink:
+    """Write-only file object that holds zipfile's output until the generator yields it."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compression_for(filename: str) -> int:
+    """ZIP_STORED for already-compressed formats, ZIP_DEFLATED for everything else."""
+    if os.path.splitext(filename)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def unique_arcnames(names: list[str]) -> list[str]:
+    """Make archive paths unique by appending " (n)" to the stem of repeats."""
+    seen = set()
+    result = []
+    for name in names:
+        candidate = name
+        n = 1
+        while candidate in seen:
+            stem, ext = os.path.splitext(name)
+            candidate = f"{stem} ({n}){ext}"
+            n += 1
+        seen.add(candidate)
+        result.append(candidate)
+    return result
+
+
+def _close_opened(future):
+    """Done-callback that closes a prefetched body nobody will read."""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def error_manifest(arcnames: list[str], skipped: list[tuple[str, str]]) -> tuple[str, str]:
+    """(archive path, text) of the entry listing files left out of the archive."""
+    name = unique_arcnames(arcnames + [ERROR_MANIFEST_NAME])[-1]
+    lines = [f"{len(skipped)} files could not be downloaded and are missing from this archive:", ""]
+    lines += [f"{arcname}: {error}" for arcname, error in skipped]
+    return name, "\n".join(lines) + "\n"
+
+
+def stream_zip(entries: list[ZipEntry], open_object, chunk_size: int = ZIP_CHUNK_SIZE):
+    """
+    Yield a ZIP archive of `entries` piece by piece.
+
+    `open_object(key)` must return a streaming body with iter_chunks(size)
+    (boto3's StreamingBody). The next object is opened on a background thread
+    while the current one is being streamed, hiding the GET latency.
+    Objects that can't be opened are left out and listed in a
+    ERROR_MANIFEST_NAME entry at the end of the archive; an error in the
+    middle of an object aborts the stream since its first bytes have already
+    been sent.
+    """
+    sink = _StreamSink()
+    pending = prefetch_executor.submit(open_object, entries[0].key) if entries else None
+    skipped = []
+
+    try:
+        with zipfile.ZipFile(sink, mode="w", allowZip64=True) as zf:
+            for index, entry in enumerate(entries):
+                opening, pending = pending, None
+                try:
+                    body = opening.result()
+                except Exception as e:
+                    logger.warning("Skipping %s in folder download: object could not be opened", entry.key)
+                    skipped.append((entry.arcname, str(e) or type(e).__name__))
+                    body = None
+                if index + 1 < len(entries):
+                    pending = prefetch_executor.submit(open_object, entries[index + 1].key)
+                if body is None:
+                    continue
+
+                info = zipfile.ZipInfo(entry.arcname, date_time=(entry.modified_at or datetime.now()).timetuple()[:6])
+                info.compress_type = compression_for(entry.arcname)
+                # The expected size lets zipfile decide up front whether the entry needs zip64
+                info.file_size = entry.size
+                try:
+                    with zf.open(info, mode="w") as dest:
+                        for chunk in body.iter_chunks(chunk_size):
+                            dest.write(chunk)
+                            data = sink.drain()
+                            if data:
+                                yield data
+                finally:
+                    body.close()
+                yield sink.drain()
+
+            if skipped:
+                name, text = error_manifest([entry.arcname for entry in entries], skipped)
+                zf.writestr(name, text, compress_type=zipfile.ZIP_DEFLATED)
+
+        # Central directory
+        yield sink.drain()
+    finally:
+        # The client went away or an object failed mid-stream: don't leak the prefetched body
+        if pending is not None and not pending.cancel():
+            pending.add_done_callback(_close_opened)
@@ -1,51 +1,251 @@
+import hashlib
+import os
 import sys
+import time
+import uuid
 from pathlib import Path
 
 import pytest
+from botocore.exceptions import ClientError
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
-from core.database import Base, get_db
+from core.database import Base, create_async_database_engine, create_database_engine, get_async_db, get_db
 from main import app
+from services.url_cache import presigned_url_cache
+from services.user_cache import authenticated_user_cache
 
 
 TEST_DATABASE_URL = "sqlite:///./test.db"
 
-engine = create_engine(
-    TEST_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-)
+engine = create_database_engine(TEST_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# TestClient runs every request on a new event loop, so async connections aren't pooled
+async_engine = create_async_database_engine(TEST_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 
 @pytest.fixture(scope="function")
 def db_session():
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    # User ids and emails repeat across tests
+    authenticated_user_cache.clear()
     session = TestingSessionLocal()
     try:
         yield session
     finally:
         session.close()
+        authenticated_user_cache.clear()
         Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture
+def async_session_factory(db_session):
+    """Factory of AsyncSessions on the test database, for overriding get_async_db."""
+    return TestingAsyncSessionLocal
+
+
 @pytest.fixture(scope="function")
-def client(db_session):
+def client(db_session, async_session_factory):
     def override_get_db():
         try:
             yield db_session
         finally:
             pass
 
+    async def override_get_async_db():
+        async with async_session_factory() as session:
+            yield session
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     test_client = TestClient(app)
     try:
         yield test_client
     finally:
         app.dependency_overrides.clear()
+
+
+def synthetic_bytes(key: str, offset: int, length: int) -> bytes:
+    """Deterministic content for objects stored without a body: a repeating pattern derived from the key."""
+    pattern = hashlib.sha256(key.encode()).digest() * 128  # 4 KiB
+    start = offset % len(pattern)
+    repeats = (start + length) // len(pattern) + 1
+    return (pattern * repeats)[start:start + length]
+
+
+class FakeStreamingBody:
+    """Lazily produces an object's bytes, like botocore's StreamingBody."""
+
+    def __init__(self, key: str, size: int, body: bytes | None, start: int = 0):
+        self.key = key
+        self.size = size  # Bytes this body produces, from offset `start` of the object
+        self.body = body
+        self.start = start
+        self.position = 0
+        self.closed = False
+
+    def read(self, amt: int | None = None) -> bytes:
+        length = self.size - self.position if amt is None else min(amt, self.size - self.position)
+        offset = self.start + self.position
+        if self.body is not None:
+            data = self.body[offset:offset + length]
+        else:
+            data = synthetic_bytes(self.key, offset, length)
+        self.position += length
+        return data
+
+    def iter_chunks(self, chunk_size: int = 1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeS3Client:
+    """
+    In-memory stand-in for the boto3 S3 client used by services.s3_client.
+    Set `latency` to add a delay to every call, or `store_bodies = False` to
+    keep only object sizes (for large synthetic uploads). Objects without a
+    body are read back as synthetic_bytes.
+    """
+
+    def __init__(self, latency: float = 0.0, store_bodies: bool = True):
+        self.latency = latency
+        self.store_bodies = store_bodies
+        self.objects: dict[str, dict] = {}
+        self.multipart_uploads: dict[str, dict] = {}
+        self.calls: list[str] = []
+
+    def _call(self, name: str):
+        self.calls.append(name)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _store(self, key: str, body: bytes, etag: str, size: int):
+        self.objects[key] = {
+            "Body": body if self.store_bodies else None,
+            "ETag": etag,
+            "ContentLength": size,
+        }
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        self._call("put_object")
+        body = Body if isinstance(Body, bytes) else Body.read()
+        self._store(Key, body, f'"{hashlib.md5(body).hexdigest()}"', len(body))
+        return {"ETag": self.objects[Key]["ETag"]}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._call("create_multipart_upload")
+        upload_id = uuid.uuid4().hex
+        self.multipart_uploads[upload_id] = {"Key": Key, "Parts": {}}
+        return {"UploadId": upload_id}
+
+    def _multipart_upload(self, upload_id: str, operation: str) -> dict:
+        if upload_id not in self.multipart_uploads:
+            raise ClientError({"Error": {"Code": "NoSuchUpload", "Message": "Not Found"}}, operation)
+        return self.multipart_uploads[upload_id]
+
+    def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        self._call("upload_part")
+        self._multipart_upload(UploadId, "UploadPart")
+        body = Body if isinstance(Body, bytes) else Body.read()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        self.multipart_uploads[UploadId]["Parts"][PartNumber] = {
+            "Body": body if self.store_bodies else None,
+            "ETag": etag,
+            "Size": len(body),
+        }
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._call("complete_multipart_upload")
+        self._multipart_upload(UploadId, "CompleteMultipartUpload")
+        upload = self.multipart_uploads.pop(UploadId)
+        parts = [upload["Parts"][p["PartNumber"]] for p in MultipartUpload["Parts"]]
+        body = b"".join(p["Body"] for p in parts) if self.store_bodies else None
+        digest = hashlib.md5(b"".join(bytes.fromhex(p["ETag"].strip('"')) for p in parts))
+        etag = f'"{digest.hexdigest()}-{len(parts)}"'
+        self._store(Key, body, etag, sum(p["Size"] for p in parts))
+        return {"ETag": etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._call("abort_multipart_upload")
+        self._multipart_upload(UploadId, "AbortMultipartUpload")
+        self.multipart_uploads.pop(UploadId)
+
+    def add_synthetic_object(self, key: str, size: int):
+        self._store(key, None, f'"synthetic-{size}"', size)
+        self.objects[key]["Body"] = None
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._call("get_object")
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not Found"}}, "GetObject")
+        obj = self.objects[Key]
+        start, end = 0, obj["ContentLength"] - 1
+        if "Range" in kwargs:
+            first, last = kwargs["Range"].removeprefix("bytes=").split("-")
+            start, end = int(first), min(int(last), end)
+        return {
+            "Body": FakeStreamingBody(Key, end - start + 1, obj["Body"], start),
+            "ContentLength": end - start + 1,
+            "ETag": obj["ETag"],
+        }
+
+    def head_object(self, Bucket, Key):
+        self._call("head_object")
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        obj = self.objects[Key]
+        return {"ContentLength": obj["ContentLength"], "ETag": obj["ETag"]}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        query = "&".join(f"{name}={value}" for name, value in Params.items() if name not in ("Bucket", "Key"))
+        return f"https://fake-s3.local/{Params['Key']}?method={ClientMethod}&{query}&expires={ExpiresIn}"
+
+    def copy_object(self, Bucket, CopySource, Key, **kwargs):
+        self._call("copy_object")
+        self.objects[Key] = dict(self.objects[CopySource["Key"]])
+
+    def copy(self, CopySource, Bucket, Key, **kwargs):
+        # Managed (multipart) copy used for objects over 5 GB
+        self._call("copy")
+        self.objects[Key] = dict(self.objects[CopySource["Key"]])
+
+    def delete_object(self, Bucket, Key):
+        self._call("delete_object")
+        self.objects.pop(Key, None)
+
+    def delete_objects(self, Bucket, Delete):
+        self._call("delete_objects")
+        assert len(Delete["Objects"]) <= 1000
+        for item in Delete["Objects"]:
+            self.objects.pop(item["Key"], None)
+        return {"Errors": []}
+
+
+@pytest.fixture(scope="function")
+def fake_s3(monkeypatch):
+    client = FakeS3Client()
+    monkeypatch.setattr("services.s3_client.s3", client)
+    presigned_url_cache.clear()
+    yield client
+    presigned_url_cache.clear()
+
+
+@pytest.fixture(scope="session")
+def bench_full():
+    """Benchmarks run reduced sizes unless BENCH_FULL=1 is set."""
+    return os.getenv("BENCH_FULL") == "1"
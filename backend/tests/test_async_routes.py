@@ -0,0 +1,149 @@
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import Depends, FastAPI, Query
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from core.database import Base, create_async_database_engine, create_database_engine, get_async_db, get_db
+from core.security import create_access_token, get_current_user
+from main import app
+from models import User, UserFile
+from routes.file_routes import file_list_item
+from services.file_records import insert_file_records, paginate_files
+from services.user_cache import authenticated_user_cache
+
+
+def test_async_session_dependency_reads_committed_data(client, db_session, fake_s3):
+    user = User(email="async@example.com", name="Async", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(user.email, user.id)}"}
+
+    created = client.post("/folders/create", params={"name": "docs"}, headers=headers)
+    assert created.status_code == 200
+    renamed = client.patch(f"/folders/{created.json()['id']}/rename", params={"new_name": "papers"}, headers=headers)
+
+    assert renamed.status_code == 200
+    assert [folder["name"] for folder in client.get("/folders/list", headers=headers).json()] == ["papers"]
+
+
+# GET /files/list as it was before the port: an async route querying through the blocking Session
+legacy_app = FastAPI()
+
+
+@legacy_app.get("/files/list")
+async def legacy_list_files(
+    limit: int | None = Query(None),
+    include_urls: bool = True,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user),
+):
+    query = db.query(UserFile).filter(UserFile.user_id == current_user.id, UserFile.deleted_at.is_(None))
+    files, _ = paginate_files(query, limit, None)
+    return [file_list_item(file, include_urls) for file in files]
+
+
+def test_listing_under_200_clients_with_slow_queries(tmp_path, fake_s3, bench_full):
+    clients = 200
+    rounds = 3 if bench_full else 1
+    # SQLite runs the progress handler every few virtual machine instructions;
+    # sleeping in it makes each query take a few milliseconds longer, like a
+    # busy database server. It runs on whichever thread executes the query.
+    query_delay = 0.001
+
+    def slow_down():
+        time.sleep(query_delay)
+        return 0
+
+    url = f"sqlite:///{tmp_path / 'load.db'}"
+    # A connection per client: the sync engine would otherwise wait for the
+    # pool on the event loop, which also stalls the sessions returning connections
+    engine = create_database_engine(url, pool_size=clients, max_overflow=0)
+    async_engine = create_async_database_engine(url, pool_size=clients, max_overflow=0)
+    Base.metadata.create_all(bind=engine)
+    authenticated_user_cache.clear()
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as db:
+        user = User(email="load@example.com", name="Load", password="hashed", is_verified=True)
+        db.add(user)
+        db.commit()
+        insert_file_records(db, [
+            {"user_id": user.id, "folder_id": None, "filename": f"f{i}.txt",
+             "file_key": f"users/{user.id}/objects/{i:032x}", "file_size": 10}
+            for i in range(500)
+        ])
+        db.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(user.email, user.id)}"}
+    # Only connections opened from here on are slowed down
+    engine.pool.dispose()
+
+    @event.listens_for(engine, "connect")
+    def slow_sync_queries(dbapi_connection, connection_record):
+        dbapi_connection.set_progress_handler(slow_down, 20)
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def slow_async_queries(dbapi_connection, connection_record):
+        dbapi_connection.run_async(lambda connection: connection.set_progress_handler(slow_down, 20))
+
+    def fresh_session():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async_session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def fresh_async_session():
+        async with async_session_factory() as db:
+            yield db
+
+    for target in (app, legacy_app):
+        target.dependency_overrides[get_db] = fresh_session
+        target.dependency_overrides[get_async_db] = fresh_async_session
+
+    async def load(target: FastAPI) -> dict:
+        latencies = []
+        transport = httpx.ASGITransport(app=target)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as http:
+            async def list_files():
+                for _ in range(rounds):
+                    started = time.perf_counter()
+                    response = await http.get("/files/list", params={"limit": 20}, headers=headers)
+                    latencies.append(time.perf_counter() - started)
+                    assert response.status_code == 200 and len(response.json()) == 20
+
+            started = time.perf_counter()
+            await asyncio.gather(*(list_files() for _ in range(clients)))
+            elapsed = time.perf_counter() - started
+        return {
+            "requests": len(latencies),
+            "throughput": len(latencies) / elapsed,
+            "p99_ms": statistics.quantiles(latencies, n=100)[98] * 1000,
+        }
+
+    async def scenario():
+        try:
+            return await load(legacy_app), await load(app)
+        finally:
+            await async_engine.dispose()
+
+    try:
+        blocking, ported = asyncio.run(scenario())
+    finally:
+        app.dependency_overrides.clear()
+        legacy_app.dependency_overrides.clear()
+        engine.dispose()
+
+    # Every request of both apps answered with a full page
+    assert blocking["requests"] == ported["requests"] == clients * rounds
+    if bench_full:
+        print(f"GET /files/list, {clients} concurrent clients, slowed queries:")
+        for label, result in (("blocking Session", blocking), ("AsyncSession", ported)):
+            print(f"{label}: {result['throughput']:,.0f} req/s, p99 {result['p99_ms']:.0f} ms")
+        assert ported["throughput"] > 2 * blocking["throughput"]
+        assert ported["p99_ms"] < blocking["p99_ms"] / 2
@@ -1,17 +1,8 @@
 from core.security import hash_password, create_access_token
-from models import User
+from models import EmailOutbox, User
 
 
-def test_register_creates_user_and_sends_email(client, db_session, monkeypatch):
-    sent_email = {}
-
-    def fake_send(to: str, name: str, link: str):
-        sent_email["to"] = to
-        sent_email["name"] = name
-        sent_email["link"] = link
-
-    monkeypatch.setattr("routes.auth_routes.send_verification_email", fake_send)
-
+def test_register_creates_user_and_queues_email(client, db_session):
     payload = {
         "name": "alice",
         "email": "Alice@example.com",
@@ -26,14 +17,18 @@ def test_register_creates_user_and_sends_email(client, db_session, monkeypatch):
     assert data["email"] == "alice@example.com"
     assert data["name"] == "Alice"
     assert data["is_verified"] is False
-    assert sent_email["to"] == "alice@example.com"
-    assert "verify" in sent_email["link"]
 
     # Ensure user persisted in the database
     user = db_session.query(User).filter_by(email="alice@example.com").first()
     assert user is not None
     assert user.is_verified is False
 
+    # The verification email waits in the outbox, committed with the user
+    email = db_session.query(EmailOutbox).one()
+    assert email.recipient == "alice@example.com"
+    assert email.status == "pending" and email.attempts == 0
+    assert user.verification_token in email.html_body
+
 
 def test_login_requires_verified_user(client, db_session):
     user = User(
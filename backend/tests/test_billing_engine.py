@@ -0,0 +1,137 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, or_
+
+from core.security import create_access_token
+from models import Invoice, User, UserFile
+from routes.billing_routes import PRICE_PER_GB_DAY_CENTS
+from services.billing_engine import file_usage, load_file_columns, scalar_file_usage
+from services.storage_ledger import backfill_storage_events, rebuild_usage_months
+
+PERIOD_START = datetime(2026, 8, 1)
+PERIOD_END = datetime(2026, 9, 1)
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="engine@example.com", name="Engine", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def add_random_files(db_session, user: User, count: int, seed: int = 0):
+    """Files uploaded over three months around the period, half of them deleted, with their ledger."""
+    rng = random.Random(seed)
+    files = []
+    for i in range(count):
+        uploaded = PERIOD_START - timedelta(days=40) + timedelta(seconds=rng.randint(0, 90 * 86400), microseconds=rng.randint(0, 999_999))
+        deleted = uploaded + timedelta(seconds=rng.randint(1, 60 * 86400)) if rng.random() < 0.5 else None
+        files.append({
+            "user_id": user.id, "filename": f"f{i}.bin", "file_key": f"users/{user.id}/objects/{i:032x}",
+            "file_size": rng.randint(1, 20 * 1024 ** 3), "uploaded_at": uploaded, "deleted_at": deleted,
+        })
+    db_session.execute(insert(UserFile), files)
+    backfill_storage_events(db_session)
+    rebuild_usage_months(db_session, user.id)
+
+
+def scalar_rows(db_session, user: User, start: datetime, end: datetime):
+    return db_session.query(UserFile).filter(
+        UserFile.user_id == user.id,
+        UserFile.uploaded_at < end,
+        or_(UserFile.deleted_at.is_(None), UserFile.deleted_at >= start),
+    ).all()
+
+
+def by_filename(filenames) -> list[int]:
+    """Positions of `filenames` in name order; the engine reads live and deleted files separately."""
+    return sorted(range(len(filenames)), key=filenames.__getitem__)
+
+
+@pytest.mark.parametrize("start, end", [
+    (PERIOD_START, PERIOD_END),
+    (PERIOD_START, datetime(2026, 8, 17, 13, 45, 10)),
+])
+def test_vectorized_usage_matches_the_scalar_loop(db_session, user, start, end):
+    add_random_files(db_session, user, 2000)
+
+    columns = load_file_columns(db_session, user.id, start, end)
+    usage = file_usage(columns, start, end, PRICE_PER_GB_DAY_CENTS)
+    files = scalar_rows(db_session, user, start, end)
+    expected = scalar_file_usage(files, start, end, PRICE_PER_GB_DAY_CENTS)
+
+    order = by_filename(columns.filenames.tolist())
+    files, expected = zip(*sorted(zip(files, expected), key=lambda pair: pair[0].filename))
+    assert columns.filenames[order].tolist() == [f.filename for f in files]
+    assert columns.sizes[order].tolist() == [f.file_size for f in files]
+    assert usage.size_gb[order].tolist() == [size_gb for size_gb, _, _, _ in expected]
+    assert usage.days_stored[order] == pytest.approx([days for _, days, _, _ in expected], rel=1e-9, abs=1e-9)
+    assert usage.gb_days[order] == pytest.approx([gb_days for _, _, gb_days, _ in expected], rel=1e-9, abs=1e-9)
+    assert usage.cost_cents[order].tolist() == [cents for _, _, _, cents in expected]
+    assert len(files) > 1000
+
+
+def test_invoice_lists_the_same_files_and_totals(client, db_session, user):
+    add_random_files(db_session, user, 300, seed=3)
+    files = scalar_rows(db_session, user, PERIOD_START, PERIOD_END)
+    expected = sorted(
+        (f.filename, usage) for f, usage in zip(files, scalar_file_usage(files, PERIOD_START, PERIOD_END, PRICE_PER_GB_DAY_CENTS))
+        if usage[1] > 0
+    )
+    gb_days = sum(usage[2] for _, usage in expected)
+
+    response = client.post(
+        "/billing/generate-invoice", headers={"Authorization": f"Bearer {create_access_token(user.email)}"},
+        params={"year": 2026, "month": 8}
+    )
+
+    assert response.status_code == 200
+    invoice = db_session.get(Invoice, response.json()["invoice_id"])
+    details = sorted(invoice.details["files"], key=lambda d: d["filename"])
+    assert [d["filename"] for d in details] == [name for name, _ in expected]
+    assert [d["cost_cents"] for d in details] == [usage[3] for _, usage in expected]
+    # The total is priced on the summed GB-days from the ledger, not per file
+    assert response.json()["total_gb_days"] == pytest.approx(gb_days, rel=1e-9)
+    assert abs(invoice.cost_cents - int(gb_days * PRICE_PER_GB_DAY_CENTS)) <= 1
+    assert invoice.cost_cents >= sum(usage[3] for _, usage in expected)
+
+
+def test_empty_account(db_session, user):
+    columns = load_file_columns(db_session, user.id, PERIOD_START, PERIOD_END)
+    usage = file_usage(columns, PERIOD_START, PERIOD_END, PRICE_PER_GB_DAY_CENTS)
+    assert usage.cost_cents.tolist() == [] and float(usage.gb_days.sum()) == 0.0
+
+
+def test_vectorized_vs_scalar_billing(db_session, user, bench_full):
+    count = 1_000_000 if bench_full else 100_000
+    rounds = 3
+    add_random_files(db_session, user, count, seed=11)
+
+    def vectorized():
+        columns = load_file_columns(db_session, user.id, PERIOD_START, PERIOD_END)
+        return int(file_usage(columns, PERIOD_START, PERIOD_END, PRICE_PER_GB_DAY_CENTS).cost_cents.sum())
+
+    def scalar():
+        files = scalar_rows(db_session, user, PERIOD_START, PERIOD_END)
+        result = sum(cents for _, _, _, cents in scalar_file_usage(files, PERIOD_START, PERIOD_END, PRICE_PER_GB_DAY_CENTS))
+        db_session.expunge_all()
+        return result
+
+    def timed(compute) -> tuple[float, int]:
+        started = time.perf_counter()
+        result = compute()
+        return time.perf_counter() - started, result
+
+    fast = [timed(vectorized) for _ in range(rounds)]
+    slow = [timed(scalar) for _ in range(rounds)]
+
+    fast_s = statistics.median(t for t, _ in fast)
+    slow_s = statistics.median(t for t, _ in slow)
+    print(f"{count} files: vectorized {fast_s * 1000:.0f} ms, scalar ORM loop {slow_s * 1000:.0f} ms ({slow_s / fast_s:.1f}x)")
+    assert fast[0][1] == slow[0][1]
+    assert fast_s < slow_s
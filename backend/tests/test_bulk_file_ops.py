@@ -0,0 +1,188 @@
+import time
+
+import pytest
+
+from core.security import create_access_token
+from models import Folder, User, UserFile
+from services.file_records import insert_file_records
+from services.purge_queue import drain_purge_queue, purge_queue_stats
+from services.storage_usage import reconcile_storage_usage
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="bulk@example.com", name="Bulk", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def auth(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(user.email)}"}
+
+
+def make_folder(db_session, user, name: str) -> Folder:
+    folder = Folder(name=name, user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+    return folder
+
+
+def add_files(db_session, fake_s3, user, names, folder_id=None) -> list[int]:
+    rows = [
+        {"user_id": user.id, "folder_id": folder_id, "filename": name,
+         "file_key": f"users/{user.id}/{folder_id or 'root'}/{name}", "file_size": 10}
+        for name in names
+    ]
+    ids = insert_file_records(db_session, rows)
+    db_session.commit()
+    for row in rows:
+        fake_s3.objects[row["file_key"]] = {"Body": b"x" * 10, "ETag": '"x"', "ContentLength": 10}
+    return ids
+
+
+def statuses(response) -> list[tuple]:
+    assert response.status_code == 200
+    return [(item["status"], item["error"]) for item in response.json()]
+
+
+def test_upload_after_bulk_move_keeps_the_moved_object(client, db_session, fake_s3, user):
+    source = make_folder(db_session, user, "source")
+    target = make_folder(db_session, user, "target")
+    (moved,) = add_files(db_session, fake_s3, user, ["a.txt"], source.id)
+    moved_key = db_session.get(UserFile, moved).file_key
+
+    assert statuses(client.post("/files/bulk/move", headers=auth(user), json={
+        "file_ids": [moved], "folder_id": target.id
+    })) == [("moved", None)]
+    upload = client.post(
+        f"/files/upload?folder_id={source.id}", headers=auth(user), files=[("files", ("a.txt", b"new", "text/plain"))]
+    )
+
+    assert upload.status_code == 200
+    new_key = db_session.get(UserFile, upload.json()["uploaded"][0]["file_id"]).file_key
+    assert new_key != moved_key
+    assert fake_s3.objects[moved_key]["Body"] == b"x" * 10
+
+
+def test_bulk_move_reports_each_item(client, db_session, fake_s3, user):
+    target = make_folder(db_session, user, "target")
+    a, b, dup_a = add_files(db_session, fake_s3, user, ["a.txt", "b.txt", "taken.txt"])
+    other_folder = make_folder(db_session, user, "other")
+    (same_name,) = add_files(db_session, fake_s3, user, ["a.txt"], other_folder.id)
+    (already,) = add_files(db_session, fake_s3, user, ["already.txt"], target.id)
+    add_files(db_session, fake_s3, user, ["taken.txt"], target.id)
+
+    response = client.post("/files/bulk/move", headers=auth(user), json={
+        "file_ids": [a, b, dup_a, same_name, already, 999999, a], "folder_id": target.id
+    })
+
+    assert statuses(response) == [
+        ("moved", None),
+        ("moved", None),
+        ("failed", "File 'taken.txt' already exists in the target location"),
+        ("failed", "File 'a.txt' already exists in the target location"),
+        ("moved", None),
+        ("failed", "File not found"),
+        ("failed", "Duplicate file id in request"),
+    ]
+    in_target = {f.filename for f in db_session.query(UserFile).filter_by(folder_id=target.id)}
+    assert in_target == {"a.txt", "b.txt", "already.txt", "taken.txt"}
+    assert reconcile_storage_usage(db_session, fix=False) == []
+
+
+def test_bulk_move_rejects_foreign_folder(client, db_session, fake_s3, user):
+    other = User(email="bulk-other@example.com", name="Other", password="hashed", is_verified=True)
+    db_session.add(other)
+    db_session.commit()
+    foreign = make_folder(db_session, other, "theirs")
+    ids = add_files(db_session, fake_s3, user, ["a.txt"])
+
+    response = client.post("/files/bulk/move", headers=auth(user), json={"file_ids": ids, "folder_id": foreign.id})
+
+    assert response.status_code == 404
+
+
+def test_bulk_delete_marks_files_deleted_and_queues_objects(client, db_session, fake_s3, user):
+    ids = add_files(db_session, fake_s3, user, [f"f{i}.txt" for i in range(999)])
+
+    response = client.post("/files/bulk/delete", headers=auth(user), json={"file_ids": ids + [0]})
+
+    assert statuses(response) == [("deleted", None)] * 999 + [("failed", "File not found")]
+    assert db_session.query(UserFile).filter(UserFile.deleted_at.is_(None)).count() == 0
+    assert db_session.query(UserFile).filter(UserFile.deleted_at.is_not(None)).count() == 999
+    assert fake_s3.calls == []
+    assert purge_queue_stats(db_session)["pending"] == 999
+    drain_purge_queue(db_session)
+    assert fake_s3.objects == {}
+    assert fake_s3.calls.count("delete_objects") == 1
+    assert reconcile_storage_usage(db_session, fix=False) == []
+
+
+def test_bulk_delete_over_limit_is_rejected(client, user):
+    response = client.post("/files/bulk/delete", headers=auth(user), json={"file_ids": list(range(1001))})
+
+    assert response.status_code == 400
+
+
+def test_bulk_rename_only_updates_metadata(client, db_session, fake_s3, user):
+    a, b, c, d = add_files(db_session, fake_s3, user, ["a.txt", "b.txt", "c.txt", "d.txt"])
+
+    response = client.post("/files/bulk/rename", headers=auth(user), json={"items": [
+        {"file_id": a, "new_filename": " new-a.txt "},
+        {"file_id": b, "new_filename": "c.txt"},
+        {"file_id": c, "new_filename": "  "},
+        {"file_id": d, "new_filename": "new-a.txt"},
+    ]})
+
+    assert statuses(response) == [
+        ("renamed", None),
+        ("failed", "File 'c.txt' already exists in this location"),
+        ("failed", "Filename cannot be empty"),
+        ("failed", "File 'new-a.txt' already exists in this location"),
+    ]
+    renamed = db_session.get(UserFile, a)
+    db_session.refresh(renamed)
+    assert (renamed.filename, renamed.file_key) == ("new-a.txt", f"users/{user.id}/root/a.txt")
+    assert fake_s3.calls == []
+    assert purge_queue_stats(db_session)["pending"] == 0
+
+
+def test_bulk_vs_per_item_requests(client, db_session, fake_s3, user, bench_full):
+    count = 1000 if bench_full else 200
+    target = make_folder(db_session, user, "target")
+    loop_ids = add_files(db_session, fake_s3, user, [f"loop-{i}.txt" for i in range(count)])
+    bulk_ids = add_files(db_session, fake_s3, user, [f"bulk-{i}.txt" for i in range(count)])
+    headers = auth(user)
+
+    def timed(run):
+        started = time.perf_counter()
+        run()
+        return time.perf_counter() - started
+
+    def move_loop():
+        for file_id in loop_ids:
+            assert client.post("/folders/move", headers=headers, json={"file_id": file_id, "folder_id": target.id}).status_code == 200
+
+    def delete_loop():
+        for file_id in loop_ids:
+            assert client.delete(f"/files/{file_id}", headers=headers).status_code == 200
+
+    def move_bulk():
+        response = client.post("/files/bulk/move", headers=headers, json={"file_ids": bulk_ids, "folder_id": target.id})
+        assert all(item["status"] == "moved" for item in response.json())
+
+    def delete_bulk():
+        response = client.post("/files/bulk/delete", headers=headers, json={"file_ids": bulk_ids})
+        assert all(item["status"] == "deleted" for item in response.json())
+
+    timings = {
+        "move": (timed(move_loop), timed(move_bulk)),
+        "delete": (timed(delete_loop), timed(delete_bulk)),
+    }
+
+    for name, (loop, bulk) in timings.items():
+        print(f"{count} x {name}: per-item {loop * 1000:.0f} ms, bulk {bulk * 1000:.0f} ms")
+        assert bulk < loop
+    assert db_session.query(UserFile).filter(UserFile.deleted_at.is_(None)).count() == 0
+    assert reconcile_storage_usage(db_session, fix=False) == []
@@ -0,0 +1,182 @@
+import hashlib
+import threading
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from core.security import create_access_token
+from models import Folder, S3PurgeQueue, StorageBlob, User, UserFile
+from services.blob_store import acquire_blob, dedup_report, release_file_objects
+from services.file_records import insert_file_records, new_file_key
+from services.purge_queue import drain_purge_queue
+from services.storage_usage import reconcile_storage_usage
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="dedup@example.com", name="Dedup", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def auth(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(user.email)}"}
+
+
+def make_folder(db_session, user, name: str) -> int:
+    folder = Folder(name=name, user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+    return folder.id
+
+
+def upload(client, user, name: str, body: bytes, folder_id: int | None = None) -> int:
+    response = client.post(
+        "/files/upload", headers=auth(user), params={"folder_id": folder_id} if folder_id else None,
+        files=[("files", (name, body, "text/plain"))]
+    )
+    assert response.status_code == 200
+    return response.json()["uploaded"][0]["file_id"]
+
+
+def test_same_content_in_different_folders_is_stored_once(client, db_session, fake_s3, user):
+    docs = make_folder(db_session, user, "docs")
+    backup = make_folder(db_session, user, "backup")
+    body = b"quarterly numbers" * 100
+
+    ids = [upload(client, user, "report.txt", body, docs), upload(client, user, "copy.txt", body, backup),
+           upload(client, user, "report.txt", body)]
+    other = upload(client, user, "other.txt", b"something else")
+    drain_purge_queue(db_session)
+
+    files = [db_session.get(UserFile, file_id) for file_id in ids]
+    assert {f.file_key for f in files} == {files[0].file_key}
+    assert {f.content_hash for f in files} == {hashlib.sha256(body).hexdigest()}
+    assert set(fake_s3.objects) == {files[0].file_key, db_session.get(UserFile, other).file_key}
+    assert fake_s3.objects[files[0].file_key]["Body"] == body
+    assert db_session.get(StorageBlob, (user.id, files[0].content_hash)).ref_count == 3
+    # Storage counters and billing still see every file at full size
+    assert client.get("/storage", headers=auth(user)).json() == {"total_files": 4, "total_bytes": 3 * len(body) + 14}
+
+    (report,) = client.get("/storage/dedup", headers=auth(user)).json()
+    assert report["files"] == 4 and report["stored_objects"] == 2
+    assert report["logical_bytes"] == 3 * len(body) + 14
+    assert report["stored_bytes"] == len(body) + 14
+    assert report["dedup_ratio"] == round((3 * len(body) + 14) / (len(body) + 14), 4)
+
+
+def test_object_is_purged_when_the_last_reference_goes(client, db_session, fake_s3, user):
+    folder = make_folder(db_session, user, "docs")
+    body = b"shared content"
+    single = upload(client, user, "a.txt", body)
+    in_folder = upload(client, user, "b.txt", body, folder)
+    bulk = [upload(client, user, f"c{i}.txt", body) for i in range(3)]
+    drain_purge_queue(db_session)
+    key = db_session.get(UserFile, single).file_key
+
+    assert client.delete(f"/files/{single}", headers=auth(user)).status_code == 200
+    client.post("/files/bulk/delete", headers=auth(user), json={"file_ids": bulk})
+    drain_purge_queue(db_session)
+    assert list(fake_s3.objects) == [key]
+
+    assert client.delete(f"/folders/{folder}", headers=auth(user)).status_code == 200
+    assert drain_purge_queue(db_session) == 1
+    assert fake_s3.objects == {}
+    assert db_session.query(StorageBlob).count() == 0
+    assert reconcile_storage_usage(db_session, fix=False) == []
+
+
+def test_users_do_not_share_objects(client, db_session, fake_s3, user):
+    other = User(email="dedup-other@example.com", name="Other", password="hashed", is_verified=True)
+    db_session.add(other)
+    db_session.commit()
+
+    mine = upload(client, user, "a.txt", b"same bytes")
+    theirs = upload(client, other, "a.txt", b"same bytes")
+
+    keys = {db_session.get(UserFile, mine).file_key, db_session.get(UserFile, theirs).file_key}
+    assert len(keys) == 2 and set(fake_s3.objects) == keys
+    assert [row["dedup_ratio"] for row in dedup_report(db_session)] == [1.0, 1.0]
+
+
+def test_presigned_uploads_keep_their_own_object(client, db_session, fake_s3, user):
+    key = new_file_key(user.id)
+    fake_s3.objects[key] = {"Body": b"data", "ETag": '"x"', "ContentLength": 4}
+    response = client.post("/files/complete", headers=auth(user), json={"key": key, "filename": "d.txt", "file_size": 4})
+    assert response.status_code == 200
+    upload(client, user, "e.txt", b"data")
+
+    file = db_session.get(UserFile, response.json()["file_id"])
+    assert file.content_hash is None and file.file_key == key
+    assert len(fake_s3.objects) == 2
+
+    client.delete(f"/files/{file.id}", headers=auth(user))
+    drain_purge_queue(db_session)
+    assert key not in fake_s3.objects and len(fake_s3.objects) == 1
+
+
+def test_concurrent_upload_and_delete_of_the_same_content(db_session, fake_s3, user):
+    content_hash = hashlib.sha256(b"popular").hexdigest()
+    user_id = user.id
+
+    def store(db, name: str) -> int:
+        key = new_file_key(user_id)
+        fake_s3.objects[key] = {"Body": b"popular", "ETag": '"x"', "ContentLength": 7}
+        file_key = acquire_blob(db, user_id, content_hash, key, 7)
+        (file_id,) = insert_file_records(db, [{
+            "user_id": user_id, "folder_id": None, "filename": name,
+            "file_key": file_key, "file_size": 7, "content_hash": content_hash,
+        }])
+        db.commit()
+        return file_id
+
+    def remove(db, file_id: int):
+        row = db.execute(
+            delete(UserFile).where(UserFile.id == file_id)
+            .returning(UserFile.user_id, UserFile.content_hash, UserFile.file_key)
+        ).one()
+        release_file_objects(db, [tuple(row)])
+        db.commit()
+
+    seed = store(db_session, "seed.txt")
+    errors = []
+
+    def worker(n: int):
+        db = TestingSessionLocal()
+        try:
+            for i in range(15):
+                file_id = store(db, f"w{n}-{i}.txt")
+                if i % 3:
+                    remove(db, file_id)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+    db_session.expire_all()
+    blob = db_session.get(StorageBlob, (user_id, content_hash))
+    live = db_session.execute(select(func.count()).select_from(UserFile)).scalar()
+    assert live == 1 + 6 * 5
+    assert blob.ref_count == live
+    assert db_session.query(UserFile).filter(UserFile.file_key != blob.file_key).count() == 0
+    queued = {key for (key,) in db_session.query(S3PurgeQueue.file_key)}
+    assert blob.file_key not in queued
+
+    drain_purge_queue(db_session)
+    assert list(fake_s3.objects) == [blob.file_key]
+
+    remove(db_session, seed)
+    for (file_id,) in db_session.query(UserFile.id).all():
+        remove(db_session, file_id)
+    drain_purge_queue(db_session)
+    assert fake_s3.objects == {}
+    assert db_session.query(StorageBlob).count() == 0
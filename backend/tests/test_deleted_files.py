@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect, insert, text
+
+from core.security import create_access_token
+from migrations import m0006_unified_file_lifecycle
+from models import Invoice, User, UserFile
+from services.deleted_files import compact_deleted_files, compaction_cutoff, count_deleted_files
+from services.invoice_batch import generate_invoices
+from services.storage_ledger import backfill_storage_events, get_month_usage, rebuild_usage_months
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="deleted@example.com", name="Deleted", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def auth(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(user.email)}"}
+
+
+def test_deleted_file_leaves_every_listing(client, db_session, fake_s3, user):
+    for name in ("kept.txt", "gone.txt"):
+        upload = client.post("/files/upload", headers=auth(user), files=[("files", (name, b"data", "text/plain"))])
+        assert upload.status_code == 200
+    gone = db_session.query(UserFile).filter_by(filename="gone.txt").one()
+
+    assert client.delete(f"/files/{gone.id}", headers=auth(user)).status_code == 200
+
+    listed = client.get("/files/list", headers=auth(user)).json()
+    assert [f["filename"] for f in listed] == ["kept.txt"]
+    assert client.get(f"/files/{gone.id}", headers=auth(user)).status_code == 404
+    assert client.delete(f"/files/{gone.id}", headers=auth(user)).status_code == 404
+    db_session.refresh(gone)
+    assert gone.deleted_at is not None
+    # The name is free again
+    again = client.post("/files/upload", headers=auth(user), files=[("files", ("gone.txt", b"new", "text/plain"))])
+    assert again.status_code == 200
+    assert count_deleted_files(db_session) == 1
+
+
+def test_compaction_keeps_invoice_totals(db_session, user):
+    uploaded = datetime(2026, 6, 10)
+    db_session.execute(insert(UserFile), [
+        {
+            "user_id": user.id, "filename": f"f{i}.bin", "file_key": f"users/{user.id}/objects/{i:032x}",
+            "file_size": (i + 1) * 1024 ** 3, "uploaded_at": uploaded + timedelta(days=i),
+            "deleted_at": datetime(2026, 7, 1) + timedelta(days=5 * i) if i % 2 else None,
+        }
+        for i in range(10)
+    ])
+    backfill_storage_events(db_session)
+    rebuild_usage_months(db_session)
+    assert generate_invoices(db_session, 2026, 7) == 1
+    before = db_session.query(Invoice.cost_cents, Invoice.total_gb_hours).one()
+    db_session.query(Invoice).delete()
+    db_session.commit()
+
+    removed = compact_deleted_files(db_session, before=datetime(2026, 8, 1), batch_size=2)
+
+    # Files deleted on July 6, 16 and 26 go; those deleted in August stay
+    assert removed == 3
+    assert count_deleted_files(db_session) == 2
+    assert count_deleted_files(db_session, before=datetime(2026, 8, 1)) == 0
+    assert generate_invoices(db_session, 2026, 7) == 1
+    assert db_session.query(Invoice.cost_cents, Invoice.total_gb_hours).one() == before
+    assert get_month_usage(db_session, user.id, 2026, 7, datetime(2026, 8, 1))[0] > 0
+
+
+def test_compaction_cutoff_keeps_last_month():
+    assert compaction_cutoff(datetime(2026, 10, 18)) == datetime(2026, 9, 1)
+    assert compaction_cutoff(datetime(2027, 1, 3)) == datetime(2026, 12, 1)
+
+
+def test_migration_moves_storage_history_into_user_files(db_session, user):
+    conn = db_session.connection()
+    conn.execute(text(
+        "CREATE TABLE file_storage_history (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+        "filename VARCHAR NOT NULL, file_key VARCHAR NOT NULL, file_size BIGINT NOT NULL, "
+        "uploaded_at DATETIME, deleted_at DATETIME NOT NULL)"
+    ))
+    conn.execute(text(
+        "INSERT INTO file_storage_history (user_id, filename, file_key, file_size, uploaded_at, deleted_at) "
+        "VALUES (:user_id, 'old.txt', 'users/old.txt', 10, '2026-05-01 00:00:00', '2026-05-02 00:00:00')"
+    ), {"user_id": user.id})
+
+    m0006_unified_file_lifecycle.upgrade(conn)
+    db_session.commit()
+
+    assert not inspect(db_session.get_bind()).has_table("file_storage_history")
+    moved = db_session.query(UserFile).one()
+    assert (moved.filename, moved.folder_id, moved.file_size) == ("old.txt", None, 10)
+    assert moved.deleted_at is not None
@@ -0,0 +1,229 @@
+import socket
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from aiosmtpd.controller import Controller
+from passlib.context import CryptContext
+from sqlalchemy.orm import sessionmaker
+
+from models import EmailOutbox
+from services.email_service import (
+    EMAIL_MAX_ATTEMPTS,
+    SmtpSender,
+    drain_email_outbox,
+    email_outbox_stats,
+    enqueue_email,
+    retry_delay,
+    send_email_batch,
+)
+
+
+class RecordingHandler:
+    """Counts connections and accepted messages; can be slowed down or made to refuse mail."""
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = []
+        self.delay = 0.0
+        self.refuse = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.refuse:
+            self.refuse -= 1
+            return "451 Try again later"
+        self.messages.append(envelope.rcpt_tos[0])
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    try:
+        yield handler, controller
+    finally:
+        controller.stop()
+
+
+@pytest.fixture
+def sender(smtp_server):
+    _, controller = smtp_server
+    sender = SmtpSender(
+        host=controller.hostname, port=controller.port, username=None, password=None,
+        from_address="noreply@example.com", starttls=False, timeout=5,
+    )
+    yield sender
+    sender.close()
+
+
+def queue(db, count: int):
+    for i in range(count):
+        enqueue_email(db, f"user{i}@example.com", "Hello", f"<p>{i}</p>")
+    db.commit()
+
+
+def test_batch_reuses_one_connection(db_session, smtp_server, sender):
+    handler, _ = smtp_server
+    queue(db_session, 12)
+
+    assert drain_email_outbox(db_session, sender, batch_size=5) == 12
+    queue(db_session, 3)
+    assert drain_email_outbox(db_session, sender) == 3
+
+    assert len(handler.messages) == 15
+    assert handler.connections == 1 and sender.connections == 1
+    assert db_session.query(EmailOutbox).count() == 0
+
+
+def test_refused_email_is_retried_with_backoff(db_session, smtp_server, sender):
+    handler, _ = smtp_server
+    handler.refuse = 1
+    queue(db_session, 1)
+    now = datetime.utcnow()
+
+    assert drain_email_outbox(db_session, sender, now=now) == 1
+    email = db_session.query(EmailOutbox).one()
+    assert (email.status, email.attempts) == ("pending", 1)
+    assert "451" in email.last_error
+    assert email.next_attempt_at == now + retry_delay(1)
+    # Not due yet
+    assert drain_email_outbox(db_session, sender, now=now) == 0
+
+    assert drain_email_outbox(db_session, sender, now=email.next_attempt_at) == 1
+    assert handler.messages == ["user0@example.com"]
+    assert db_session.query(EmailOutbox).count() == 0
+
+
+def test_email_that_cannot_be_built_fails_alone(db_session, smtp_server, sender, monkeypatch):
+    handler, _ = smtp_server
+    queue(db_session, 3)
+    send = sender.send
+
+    def send_or_break(to, subject, html):
+        if to == "user1@example.com":
+            raise UnicodeEncodeError("ascii", to, 0, 1, "ordinal not in range(128)")
+        send(to, subject, html)
+
+    monkeypatch.setattr(sender, "send", send_or_break)
+    now = datetime.utcnow()
+
+    assert drain_email_outbox(db_session, sender, now=now) == 3
+    assert handler.messages == ["user0@example.com", "user2@example.com"]
+    email = db_session.query(EmailOutbox).one()
+    assert (email.recipient, email.status, email.attempts) == ("user1@example.com", "pending", 1)
+    assert "ordinal not in range" in email.last_error
+    assert email.next_attempt_at == now + retry_delay(1)
+
+
+def test_concurrent_senders_deliver_each_email_once(db_session, smtp_server):
+    handler, controller = smtp_server
+    handler.delay = 0.01
+    queue(db_session, 40)
+    session_factory = sessionmaker(bind=db_session.get_bind())
+    processed = []
+
+    def run_sender():
+        sender = SmtpSender(
+            host=controller.hostname, port=controller.port, username=None, password=None,
+            from_address="noreply@example.com", starttls=False, timeout=5,
+        )
+        db = session_factory()
+        try:
+            processed.append(drain_email_outbox(db, sender, batch_size=5))
+        finally:
+            db.close()
+            sender.close()
+
+    threads = [threading.Thread(target=run_sender) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(processed) == 40
+    assert sorted(handler.messages) == sorted(f"user{i}@example.com" for i in range(40))
+    assert db_session.query(EmailOutbox).count() == 0
+
+
+def test_claimed_batch_is_not_due_for_another_sender(db_session, smtp_server, sender, monkeypatch):
+    queue(db_session, 2)
+    session_factory = sessionmaker(bind=db_session.get_bind())
+    seen_by_other = []
+    send = sender.send
+
+    def send_and_poll(to, subject, html):
+        other = session_factory()
+        try:
+            seen_by_other.append(send_email_batch(other, sender))
+        finally:
+            other.close()
+        send(to, subject, html)
+
+    monkeypatch.setattr(sender, "send", send_and_poll)
+
+    assert send_email_batch(db_session, sender) == 2
+    assert seen_by_other == [0, 0]
+
+
+def test_email_fails_after_max_attempts(db_session):
+    queue(db_session, 1)
+    # Nothing listens on this port
+    sender = SmtpSender(host="127.0.0.1", port=1, username=None, password=None,
+                        from_address="noreply@example.com", starttls=False, timeout=1)
+    now = datetime.utcnow()
+
+    for _ in range(EMAIL_MAX_ATTEMPTS):
+        assert drain_email_outbox(db_session, sender, now=now) == 1
+        now += timedelta(days=1)
+
+    email = db_session.query(EmailOutbox).one()
+    assert (email.status, email.attempts) == ("failed", EMAIL_MAX_ATTEMPTS)
+    assert drain_email_outbox(db_session, sender, now=now) == 0
+    assert email_outbox_stats(db_session)["failed"] == 1
+
+
+def test_registration_latency_does_not_depend_on_smtp(client, db_session, smtp_server, sender, monkeypatch, bench_full):
+    handler, _ = smtp_server
+    handler.delay = 0.2
+    registrations = 60 if bench_full else 15
+    monkeypatch.setattr("core.security.pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=4))
+
+    latencies = []
+    for i in range(registrations):
+        started = time.perf_counter()
+        response = client.post("/auth/register", json={
+            "name": f"user{i}", "email": f"user{i}@example.com",
+            "password": "pw", "confirm_password": "pw",
+        })
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+    assert email_outbox_stats(db_session)["pending"] == registrations
+
+    started = time.perf_counter()
+    drain_email_outbox(db_session, sender)
+    delivered = time.perf_counter() - started
+
+    print(
+        f"{registrations} registrations with a {handler.delay * 1000:.0f} ms SMTP server: "
+        f"median {statistics.median(latencies) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms; "
+        f"outbox delivered in {delivered:.2f} s over {handler.connections} connection(s)"
+    )
+    assert len(handler.messages) == registrations and handler.connections == 1
+    assert statistics.median(latencies) < handler.delay / 2
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import DateTime, select
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from core.security import create_access_token
+from models import Folder, User, UserFile
+from services.file_records import cursor_filter, encode_cursor
+
+
+@pytest.fixture
+def user_with_files(db_session):
+    user = User(email="pages@example.com", name="Pages", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    folder = Folder(name="Docs", user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+
+    base = datetime(2025, 1, 1, 12, 0, 0)
+    for i in range(10):
+        db_session.add(UserFile(
+            user_id=user.id,
+            folder_id=folder.id,
+            filename=f"doc-{i}.txt",
+            file_key=f"users/{user.id}/folders/{folder.id}/doc-{i}.txt",
+            file_size=10,
+            # Several files share a timestamp so the id tie-breaker matters
+            uploaded_at=base + timedelta(minutes=i // 3),
+        ))
+    db_session.commit()
+    return user, folder
+
+
+def auth(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(user.email)}"}
+
+
+def fetch_all_pages(client, url: str, user: User, limit: int, **extra) -> list[list[dict]]:
+    pages = []
+    cursor = None
+    while True:
+        params = {"limit": limit, **extra}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(url, headers=auth(user), params=params)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+
+
+def test_list_pages_cover_every_file_once_newest_first(client, user_with_files, fake_s3):
+    user, _ = user_with_files
+
+    pages = fetch_all_pages(client, "/files/list", user, limit=4)
+
+    assert [len(page) for page in pages] == [4, 4, 2]
+    names = [item["filename"] for page in pages for item in page]
+    assert names == [f"doc-{i}.txt" for i in reversed(range(10))]
+
+
+def test_in_folder_pages_without_urls(client, user_with_files, fake_s3):
+    user, folder = user_with_files
+
+    pages = fetch_all_pages(client, f"/files/in-folder/{folder.id}", user, limit=3, include_urls="false")
+
+    items = [item for page in pages for item in page]
+    assert len(items) == 10
+    assert len({item["id"] for item in items}) == 10
+    assert all(item["preview_url"] is None and item["download_url"] is None for item in items)
+    assert fake_s3.calls == []
+
+
+def test_listings_share_one_item_shape(client, user_with_files, fake_s3):
+    user, folder = user_with_files
+    params = {"limit": 2, "include_urls": "false"}
+
+    listed = client.get("/files/list", headers=auth(user), params=params).json()
+    in_folder = client.get(f"/files/in-folder/{folder.id}", headers=auth(user), params=params).json()
+
+    assert listed == in_folder
+
+
+def test_listing_without_limit_returns_everything(client, user_with_files, fake_s3):
+    user, folder = user_with_files
+
+    response = client.get(f"/files/in-folder/{folder.id}", headers=auth(user))
+
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+    assert len(response.json()) == 10
+    assert all(item["preview_url"] for item in response.json())
+
+
+def test_invalid_cursor_is_rejected(client, user_with_files):
+    user, _ = user_with_files
+
+    response = client.get("/files/list", headers=auth(user), params={"limit": 2, "cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+
+def test_cursor_compares_timestamps_on_postgres():
+    cursor = encode_cursor(datetime(2025, 1, 1, 12, 0, 0, 250000), 7)
+
+    compiled = select(UserFile.id).where(cursor_filter("postgresql", cursor)).compile(dialect=asyncpg.dialect())
+
+    assert "VARCHAR" not in str(compiled)
+    uploaded_at = [param for param in compiled.binds.values() if param.value == datetime(2025, 1, 1, 12, 0, 0, 250000)]
+    assert uploaded_at and all(isinstance(param.type, DateTime) for param in uploaded_at)
+
+
+def test_malformed_cursor_timestamp_is_rejected_on_postgres():
+    with pytest.raises(ValueError):
+        cursor_filter("postgresql", encode_cursor("yesterday", 7))
+
+
+def test_file_urls_batch_only_returns_own_files(client, db_session, user_with_files, fake_s3):
+    user, _ = user_with_files
+    other = User(email="other@example.com", name="Other", password="hashed", is_verified=True)
+    db_session.add(other)
+    db_session.commit()
+    foreign = UserFile(user_id=other.id, filename="x.txt", file_key="users/x.txt", file_size=1)
+    db_session.add(foreign)
+    db_session.commit()
+    own_ids = [f.id for f in db_session.query(UserFile).filter_by(user_id=user.id).limit(3)]
+
+    response = client.post("/files/urls", headers=auth(user), json={"file_ids": own_ids + [foreign.id]})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert sorted(item["id"] for item in data) == sorted(own_ids)
+    assert all("method=get_object" in item["download_url"] for item in data)
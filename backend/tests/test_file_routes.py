@@ -57,7 +57,7 @@ def test_list_files_returns_user_files(client, db_session, monkeypatch):
 
     monkeypatch.setattr(
         "routes.file_routes.generate_presigned_url",
-        lambda key: f"https://example.com/{key}",
+        lambda key, filename=None: f"https://example.com/{key}",
     )
     monkeypatch.setattr(
         "routes.file_routes.generate_download_url",
@@ -0,0 +1,180 @@
+import io
+import threading
+import tracemalloc
+import zipfile
+
+import pytest
+
+from core.security import create_access_token
+from models import Folder, User, UserFile
+from services.zip_stream import ERROR_MANIFEST_NAME, ZipEntry, stream_zip
+
+
+@pytest.fixture
+def user_folder(db_session):
+    user = User(email="zip@example.com", name="Zip", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    folder = Folder(name="Trip", user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+    return user, folder
+
+
+def add_file(db_session, user, folder, filename: str, size: int):
+    db_session.add(UserFile(
+        user_id=user.id,
+        folder_id=folder.id,
+        filename=filename,
+        file_key=f"users/{user.id}/folders/{folder.id}/{filename}",
+        file_size=size,
+    ))
+    db_session.commit()
+
+
+def open_fake(fake_s3):
+    return lambda key: fake_s3.get_object(Bucket="bucket", Key=key)["Body"]
+
+
+def test_download_folder_streams_valid_archive(client, db_session, user_folder, fake_s3):
+    user, folder = user_folder
+    contents = {"notes.txt": b"hello " * 1000, "photo.jpg": bytes(range(256)) * 40, "empty.csv": b""}
+    for name, body in contents.items():
+        add_file(db_session, user, folder, name, len(body))
+        fake_s3.objects[f"users/{user.id}/folders/{folder.id}/{name}"] = {
+            "Body": body, "ETag": '"x"', "ContentLength": len(body)
+        }
+    # Listed in the database but missing from S3: left out and listed in the error manifest
+    add_file(db_session, user, folder, "lost.txt", 10)
+
+    response = client.get(
+        f"/folders/{folder.id}/download",
+        headers={"Authorization": f"Bearer {create_access_token(user.email)}"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == sorted([*contents, ERROR_MANIFEST_NAME])
+        assert "lost.txt: " in zf.read(ERROR_MANIFEST_NAME).decode()
+        for name, body in contents.items():
+            assert zf.read(name) == body
+        assert zf.getinfo("photo.jpg").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("notes.txt").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_stream_zip_memory_stays_flat_for_large_folders(tmp_path, fake_s3, bench_full):
+    file_size = (256 if bench_full else 32) * 1024 * 1024
+    file_count = 16 if bench_full else 8
+    entries = []
+    for i in range(file_count):
+        # Mostly already-compressed media, plus one file that gets deflated
+        name = f"clip-{i}.mp4" if i else "raw-0.bin"
+        fake_s3.add_synthetic_object(f"users/1/{name}", file_size)
+        entries.append(ZipEntry(arcname=name, key=f"users/1/{name}", size=file_size))
+
+    archive = tmp_path / "folder.zip"
+    tracemalloc.start()
+    try:
+        with open(archive, "wb") as out:
+            for piece in stream_zip(entries, open_fake(fake_s3)):
+                out.write(piece)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    total = file_size * file_count
+    print(f"{total // 2**20} MiB folder: peak {peak / 2**20:.1f} MiB traced while streaming")
+    assert peak < 16 * 1024 * 1024
+
+    with zipfile.ZipFile(archive) as zf:
+        assert zf.testzip() is None
+        assert [info.file_size for info in zf.infolist()] == [file_size] * file_count
+        assert zf.getinfo("raw-0.bin").compress_type == zipfile.ZIP_DEFLATED
+        assert zf.getinfo("clip-1.mp4").compress_type == zipfile.ZIP_STORED
+
+
+def test_stream_zip_writes_zip64_records(tmp_path, fake_s3, monkeypatch):
+    # Lower the limit so zip64 entries and end records are exercised without writing 4 GiB
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 1024 * 1024)
+    entries = []
+    for i in range(3):
+        fake_s3.add_synthetic_object(f"users/1/big-{i}.zip", 2 * 1024 * 1024)
+        entries.append(ZipEntry(arcname=f"big-{i}.zip", key=f"users/1/big-{i}.zip", size=2 * 1024 * 1024))
+
+    data = b"".join(stream_zip(entries, open_fake(fake_s3)))
+
+    assert b"PK\x06\x06" in data  # zip64 end of central directory record
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert [info.file_size for info in zf.infolist()] == [2 * 1024 * 1024] * 3
+
+
+def test_stream_zip_opens_next_object_while_streaming(fake_s3):
+    for i in range(3):
+        fake_s3.add_synthetic_object(f"users/1/f{i}.txt", 4096)
+    opened = {key: threading.Event() for key in fake_s3.objects}
+
+    def open_object(key):
+        body = fake_s3.get_object(Bucket="bucket", Key=key)["Body"]
+        opened[key].set()
+        return body
+
+    entries = [ZipEntry(arcname=f"f{i}.txt", key=f"users/1/f{i}.txt", size=4096) for i in range(3)]
+    stream = stream_zip(entries, open_object, chunk_size=1024)
+    first = next(stream)  # the first chunk of f0.txt has been written
+
+    assert opened["users/1/f1.txt"].wait(timeout=5)
+    assert not opened["users/1/f2.txt"].is_set()
+    with zipfile.ZipFile(io.BytesIO(first + b"".join(stream))) as zf:
+        assert zf.namelist() == ["f0.txt", "f1.txt", "f2.txt"]
+    assert fake_s3.calls.count("get_object") == 3
+
+
+def test_stream_zip_lists_objects_it_could_not_open(fake_s3):
+    for name in ("a.txt", "c.txt"):
+        fake_s3.add_synthetic_object(f"users/1/{name}", 100)
+    entries = [ZipEntry(arcname=name, key=f"users/1/{name}", size=100) for name in ("a.txt", "b.txt", "c.txt")]
+
+    data = b"".join(stream_zip(entries, open_fake(fake_s3)))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.namelist() == ["a.txt", "c.txt", ERROR_MANIFEST_NAME]
+        manifest = zf.read(ERROR_MANIFEST_NAME).decode()
+    assert "1 files could not be downloaded" in manifest
+    assert "b.txt: " in manifest
+
+
+def test_stream_zip_closes_the_prefetched_object_when_the_client_leaves(fake_s3):
+    for i in range(2):
+        fake_s3.add_synthetic_object(f"users/1/f{i}.txt", 4096)
+    bodies = {}
+
+    class TrackedBody:
+        def __init__(self, body):
+            self.body = body
+            self.closed = threading.Event()
+
+        def iter_chunks(self, size):
+            return self.body.iter_chunks(size)
+
+        def close(self):
+            self.closed.set()
+
+    def open_object(key):
+        bodies[key] = TrackedBody(fake_s3.get_object(Bucket="bucket", Key=key)["Body"])
+        return bodies[key]
+
+    entries = [ZipEntry(arcname=f"f{i}.txt", key=f"users/1/f{i}.txt", size=4096) for i in range(2)]
+    stream = stream_zip(entries, open_object, chunk_size=1024)
+    next(stream)
+    stream.close()
+
+    assert bodies["users/1/f0.txt"].closed.is_set()
+    # The prefetch may still be running; its body is closed once it arrives
+    for _ in range(50):
+        if "users/1/f1.txt" in bodies:
+            break
+        threading.Event().wait(0.1)
+    assert bodies["users/1/f1.txt"].closed.wait(timeout=5)
@@ -0,0 +1,148 @@
+import io
+import time
+import zipfile
+
+import pytest
+from sqlalchemy import insert
+
+from core.security import create_access_token
+from models import Folder, User, UserFile
+from services.file_records import insert_file_records
+from services.folder_tree import get_subtree_files, get_subtree_folders
+from services.purge_queue import drain_purge_queue
+from services.storage_usage import get_storage_usage, reconcile_storage_usage
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="tree@example.com", name="Tree", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def auth(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(user.email)}"}
+
+
+def make_folder(db_session, user, name: str, parent_id: int | None = None) -> int:
+    result = db_session.execute(
+        insert(Folder).returning(Folder.id),
+        [{"user_id": user.id, "name": name, "parent_id": parent_id}]
+    )
+    return result.scalar_one()
+
+
+def add_files(db_session, fake_s3, user, folder_id: int, count: int, prefix: str = "f"):
+    rows = [
+        {"user_id": user.id, "folder_id": folder_id, "filename": f"{prefix}-{i}.txt",
+         "file_key": f"users/{user.id}/folders/{folder_id}/{prefix}-{i}.txt", "file_size": 10}
+        for i in range(count)
+    ]
+    insert_file_records(db_session, rows)
+    for row in rows:
+        fake_s3.objects[row["file_key"]] = {"Body": b"x" * 10, "ETag": '"x"', "ContentLength": 10}
+
+
+def test_deep_tree_resolves_paths_in_one_query(db_session, fake_s3, user):
+    root = make_folder(db_session, user, "root")
+    parent = root
+    for depth in range(1, 101):
+        parent = make_folder(db_session, user, f"d{depth}", parent)
+        add_files(db_session, fake_s3, user, parent, 1)
+    db_session.commit()
+
+    folders = get_subtree_folders(db_session, user.id, root)
+    files = get_subtree_files(db_session, user.id, root)
+
+    assert len(folders) == 101
+    assert folders[0] == (root, "")
+    assert folders[-1][1] == "/".join(f"d{i}" for i in range(1, 101))
+    assert len(files) == 100
+    deepest = max(files, key=lambda item: item[1].count("/"))[1]
+    assert deepest == "/".join(f"d{i}" for i in range(1, 101)) + "/f-0.txt"
+
+
+def test_subtree_stops_at_other_users_folders(db_session, fake_s3, user):
+    other = User(email="tree-other@example.com", name="Other", password="hashed", is_verified=True)
+    db_session.add(other)
+    db_session.commit()
+    root = make_folder(db_session, user, "root")
+    foreign = make_folder(db_session, other, "foreign", root)
+    add_files(db_session, fake_s3, other, foreign, 2)
+    db_session.commit()
+
+    assert get_subtree_folders(db_session, user.id, root) == [(root, "")]
+    assert get_subtree_files(db_session, user.id, root) == []
+    assert get_subtree_folders(db_session, other.id, root) == []
+
+
+def test_download_folder_includes_subfolders(client, db_session, fake_s3, user):
+    root = make_folder(db_session, user, "Trip")
+    photos = make_folder(db_session, user, "photos", root)
+    day1 = make_folder(db_session, user, "day1", photos)
+    add_files(db_session, fake_s3, user, root, 1, "notes")
+    add_files(db_session, fake_s3, user, photos, 2, "img")
+    add_files(db_session, fake_s3, user, day1, 1, "img")
+    db_session.commit()
+
+    response = client.get(f"/folders/{root}/download", headers=auth(user))
+
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == [
+            "notes-0.txt", "photos/day1/img-0.txt", "photos/img-0.txt", "photos/img-1.txt"
+        ]
+
+
+def test_delete_wide_tree_removes_everything_below(client, db_session, fake_s3, user):
+    root = make_folder(db_session, user, "root")
+    keep = make_folder(db_session, user, "keep")
+    add_files(db_session, fake_s3, user, keep, 3)
+    for i in range(300):
+        child = make_folder(db_session, user, f"c{i}", root)
+        add_files(db_session, fake_s3, user, child, 5)
+    db_session.commit()
+
+    response = client.delete(f"/folders/{root}", headers=auth(user))
+
+    assert response.status_code == 200
+    assert db_session.query(Folder).filter_by(user_id=user.id).count() == 1
+    assert db_session.query(UserFile).filter_by(user_id=user.id, deleted_at=None).count() == 3
+    assert db_session.query(UserFile).filter(UserFile.deleted_at.is_not(None), UserFile.folder_id.is_(None)).count() == 1500
+    assert drain_purge_queue(db_session) == 1500
+    assert len(fake_s3.objects) == 3
+    assert fake_s3.calls.count("delete_objects") == 2
+    assert "delete_object" not in fake_s3.calls
+    assert get_storage_usage(db_session, user.id) == (3, 30)
+    assert reconcile_storage_usage(db_session, fix=False) == []
+
+
+def test_delete_time_for_large_subtree(client, db_session, fake_s3, user, bench_full):
+    file_count = 50_000 if bench_full else 10_000
+    root = make_folder(db_session, user, "big")
+    per_folder = 100
+    for i in range(file_count // per_folder):
+        # Alternate between wide and nested placement
+        parent = root if i % 2 == 0 else child
+        child = make_folder(db_session, user, f"sub{i}", parent)
+        add_files(db_session, fake_s3, user, child, per_folder)
+    db_session.commit()
+
+    started = time.perf_counter()
+    response = client.delete(f"/folders/{root}", headers=auth(user))
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200
+    assert "delete_objects" not in fake_s3.calls
+
+    started = time.perf_counter()
+    drain_purge_queue(db_session)
+    purge_elapsed = time.perf_counter() - started
+
+    print(f"{file_count} files in subtree: delete {elapsed * 1000:.0f} ms, purge {purge_elapsed * 1000:.0f} ms, "
+          f"{fake_s3.calls.count('delete_objects')} DeleteObjects calls")
+    assert fake_s3.objects == {}
+    assert fake_s3.calls.count("delete_objects") == file_count // 1000
+    assert db_session.query(UserFile).filter(UserFile.deleted_at.is_(None)).count() == 0
+    assert db_session.query(Folder).count() == 0
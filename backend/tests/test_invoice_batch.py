@@ -0,0 +1,139 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from core.security import create_access_token
+from models import Invoice, StorageEvent, User, UserFile
+from services.invoice_batch import generate_invoices, run_invoice_batch, user_id_ranges
+from services.storage_ledger import backfill_storage_events, rebuild_usage_months
+from tests.conftest import TEST_DATABASE_URL
+
+PERIOD_START = datetime(2026, 8, 1)
+
+
+def add_users_with_files(db_session, users: int, files_per_user: int, seed: int = 0) -> list[int]:
+    """Users with files uploaded around August 2026, some deleted, with their ledger."""
+    rng = random.Random(seed)
+    first = (db_session.execute(select(User.id).order_by(User.id.desc()).limit(1)).scalar() or 0) + 1
+    db_session.execute(insert(User), [
+        {"id": first + i, "email": f"batch{first + i}@example.com", "name": "Batch", "password": "hashed", "is_verified": True}
+        for i in range(users)
+    ])
+    files = []
+    for user_id in range(first, first + users):
+        for n in range(files_per_user):
+            uploaded = PERIOD_START - timedelta(days=40) + timedelta(seconds=rng.randint(0, 75 * 86400))
+            deleted = uploaded + timedelta(seconds=rng.randint(1, 40 * 86400)) if rng.random() < 0.4 else None
+            files.append({
+                "user_id": user_id, "filename": f"f{n}.bin", "file_key": f"users/{user_id}/objects/{n:032x}",
+                "file_size": rng.randint(1, 50 * 1024 ** 3), "uploaded_at": uploaded, "deleted_at": deleted,
+            })
+    if files:
+        db_session.execute(insert(UserFile), files)
+    db_session.query(StorageEvent).delete()
+    backfill_storage_events(db_session)
+    rebuild_usage_months(db_session)
+    return list(range(first, first + users))
+
+
+def invoices(db_session) -> dict:
+    db_session.expire_all()
+    return {
+        invoice.user_id: (invoice.cost_cents, invoice.total_gb_hours)
+        for invoice in db_session.query(Invoice).filter_by(billing_year=2026, billing_month=8)
+    }
+
+
+def test_batch_matches_the_invoice_route(client, db_session):
+    user_ids = add_users_with_files(db_session, 20, 15)
+    for user_id in user_ids:
+        user = db_session.get(User, user_id)
+        response = client.post(
+            "/billing/generate-invoice", headers={"Authorization": f"Bearer {create_access_token(user.email)}"},
+            params={"year": 2026, "month": 8}
+        )
+        assert response.status_code == 200
+    from_route = invoices(db_session)
+    db_session.query(Invoice).delete()
+    db_session.commit()
+
+    assert generate_invoices(db_session, 2026, 8, chunk_size=7) == len(from_route)
+
+    from_batch = invoices(db_session)
+    assert from_batch.keys() == from_route.keys()
+    assert from_batch == from_route
+
+
+def test_batch_is_idempotent_and_skips_billed_users(client, db_session):
+    user_ids = add_users_with_files(db_session, 10, 5, seed=1)
+    billed = db_session.get(User, user_ids[0])
+    client.post(
+        "/billing/generate-invoice", headers={"Authorization": f"Bearer {create_access_token(billed.email)}"},
+        params={"year": 2026, "month": 8}
+    )
+    empty = User(email="batch-empty@example.com", name="Empty", password="hashed", is_verified=True)
+    db_session.add(empty)
+    db_session.commit()
+
+    first_run = generate_invoices(db_session, 2026, 8)
+    second_run = generate_invoices(db_session, 2026, 8)
+
+    billed_users = invoices(db_session).keys()
+    assert first_run == len(billed_users) - 1 and second_run == 0
+    assert empty.id not in billed_users
+    assert db_session.query(Invoice).filter_by(user_id=billed.id).count() == 1
+    # The route refuses a second invoice for a period the batch billed
+    other = db_session.get(User, user_ids[1])
+    response = client.post(
+        "/billing/generate-invoice", headers={"Authorization": f"Bearer {create_access_token(other.email)}"},
+        params={"year": 2026, "month": 8}
+    )
+    assert response.status_code == 400
+
+
+def test_user_id_ranges_cover_every_user(db_session):
+    user_ids = add_users_with_files(db_session, 10, 0)
+
+    ranges = user_id_ranges(db_session, 3)
+
+    assert len(ranges) == 3
+    assert ranges[0][0] == user_ids[0] and ranges[-1][1] == user_ids[-1]
+    assert all(previous[1] + 1 == current[0] for previous, current in zip(ranges, ranges[1:]))
+
+
+def test_worker_processes_bill_the_same_as_one_pass(db_session):
+    add_users_with_files(db_session, 40, 4, seed=2)
+
+    assert run_invoice_batch(TEST_DATABASE_URL, 2026, 8, workers=3) > 0
+    parallel = invoices(db_session)
+    db_session.query(Invoice).delete()
+    db_session.commit()
+    generate_invoices(db_session, 2026, 8)
+
+    assert invoices(db_session) == parallel
+
+
+def test_batch_invoicing_throughput(db_session, bench_full):
+    users = 100_000 if bench_full else 10_000
+    files_per_user = 3
+    add_users_with_files(db_session, users, files_per_user, seed=3)
+
+    started = time.perf_counter()
+    created = generate_invoices(db_session, 2026, 8)
+    single = time.perf_counter() - started
+    db_session.query(Invoice).delete()
+    db_session.commit()
+
+    started = time.perf_counter()
+    assert run_invoice_batch(TEST_DATABASE_URL, 2026, 8, workers=4) == created
+    parallel = time.perf_counter() - started
+
+    file_rows = users * files_per_user
+    print(
+        f"{users} users / {file_rows} file rows -> {created} invoices: "
+        f"1 process {single:.2f} s ({file_rows / single:,.0f} file rows/s, {created / single:,.0f} invoices/s), "
+        f"4 workers {parallel:.2f} s ({file_rows / parallel:,.0f} file rows/s, {created / parallel:,.0f} invoices/s)"
+    )
+    assert created > users * 0.9
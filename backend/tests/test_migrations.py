@@ -0,0 +1,183 @@
+import ast
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from core.database import Base, create_database_engine
+from migrations import prepare_database
+from services.storage_ledger import BYTES_PER_GB, SECONDS_PER_DAY, check_storage_ledger, compute_month_usage, get_month_usage
+from services.storage_usage import reconcile_storage_usage
+
+# The schema databases had before the first migration
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER NOT NULL, name VARCHAR NOT NULL, email VARCHAR NOT NULL, "
+    "password VARCHAR NOT NULL, is_verified BOOLEAN NOT NULL, verification_token VARCHAR, folder_id INTEGER, "
+    "PRIMARY KEY (id), CONSTRAINT fk_user_folder FOREIGN KEY(folder_id) REFERENCES folders (id))",
+    "CREATE UNIQUE INDEX ix_users_verification_token ON users (verification_token)",
+    "CREATE UNIQUE INDEX ix_users_email ON users (email)",
+    "CREATE INDEX ix_users_id ON users (id)",
+    "CREATE INDEX ix_users_name ON users (name)",
+    "CREATE TABLE file_storage_history (id INTEGER NOT NULL, user_id INTEGER NOT NULL, filename VARCHAR NOT NULL, "
+    "file_key VARCHAR NOT NULL, file_size BIGINT NOT NULL, uploaded_at DATETIME NOT NULL, "
+    "deleted_at DATETIME NOT NULL, storage_cost BIGINT, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))",
+    "CREATE INDEX ix_file_storage_history_id ON file_storage_history (id)",
+    "CREATE TABLE folders (id INTEGER NOT NULL, user_id INTEGER, name VARCHAR, parent_id INTEGER, "
+    "created_at DATETIME, color TEXT DEFAULT '#FBBF24', PRIMARY KEY (id), "
+    "FOREIGN KEY(user_id) REFERENCES users (id), FOREIGN KEY(parent_id) REFERENCES folders (id))",
+    "CREATE INDEX ix_folders_id ON folders (id)",
+    "CREATE INDEX ix_folders_name ON folders (name)",
+    "CREATE TABLE user_files (id INTEGER NOT NULL, user_id INTEGER NOT NULL, folder_id INTEGER, "
+    "filename VARCHAR NOT NULL, file_key VARCHAR NOT NULL, file_size BIGINT NOT NULL, "
+    "uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP, deleted_at DATETIME, PRIMARY KEY (id), "
+    "FOREIGN KEY(user_id) REFERENCES users (id), FOREIGN KEY(folder_id) REFERENCES folders (id))",
+    "CREATE INDEX ix_user_files_id ON user_files (id)",
+    "CREATE INDEX ix_user_files_file_key ON user_files (file_key)",
+    "CREATE TABLE invoices (id INTEGER NOT NULL, user_id INTEGER NOT NULL, billing_month INTEGER NOT NULL, "
+    "billing_year INTEGER NOT NULL, total_gb_hours BIGINT NOT NULL, cost_cents BIGINT NOT NULL, "
+    "status VARCHAR NOT NULL, stripe_invoice_id VARCHAR, stripe_payment_intent_id VARCHAR, "
+    "created_at DATETIME DEFAULT CURRENT_TIMESTAMP, due_date DATETIME NOT NULL, paid_at DATETIME, details JSON, "
+    "PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))",
+    "CREATE INDEX ix_invoices_id ON invoices (id)",
+]
+
+
+def legacy_engine(tmp_path, name: str = "legacy.db"):
+    engine = create_database_engine(f"sqlite:///{tmp_path / name}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+    return engine
+
+
+def index_definitions(engine) -> dict:
+    """{index name: (table, sql)} of every named index, as SQLite stores it."""
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        )).all()
+    # Whitespace differs between CREATE INDEX as typed and as rendered
+    return {row.name: (row.tbl_name, " ".join(row.sql.split())) for row in rows}
+
+
+def test_migrated_database_matches_a_new_one(tmp_path):
+    migrated = legacy_engine(tmp_path)
+    fresh = create_database_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    try:
+        prepare_database(migrated)
+        Base.metadata.create_all(bind=fresh)
+
+        assert index_definitions(migrated) == index_definitions(fresh)
+        migrated_tables, fresh_tables = inspect(migrated), inspect(fresh)
+        assert set(migrated_tables.get_table_names()) - {"schema_migrations"} == set(fresh_tables.get_table_names())
+        for table in fresh_tables.get_table_names():
+            columns = {column["name"] for column in fresh_tables.get_columns(table)}
+            assert {column["name"] for column in migrated_tables.get_columns(table)} == columns, table
+    finally:
+        migrated.dispose()
+        fresh.dispose()
+
+
+def test_storage_history_is_billed_after_migrating(tmp_path):
+    engine = legacy_engine(tmp_path)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO users (id, name, email, password, is_verified) VALUES (1, 'Legacy', 'legacy@example.com', 'x', 1)"
+            ))
+            conn.execute(text(
+                "INSERT INTO file_storage_history (user_id, filename, file_key, file_size, uploaded_at, deleted_at) "
+                "VALUES (1, 'old.bin', 'users/1/old.bin', :size, '2026-09-02 00:00:00', '2026-09-03 00:00:00')"
+            ), {"size": BYTES_PER_GB})
+        prepare_database(engine)
+
+        now = datetime(2026, 9, 30)
+        with Session(engine) as db:
+            ledger = get_month_usage(db, 1, 2026, 9, now)
+            assert ledger == compute_month_usage(db, 1, 2026, 9, now)
+        assert ledger == (BYTES_PER_GB * SECONDS_PER_DAY, 0)
+    finally:
+        engine.dispose()
+
+
+def test_migrations_do_not_depend_on_current_models_or_services():
+    # A migration must keep doing what it shipped with when the models change later
+    for path in (Path(__file__).resolve().parents[1] / "migrations").glob("m*.py"):
+        for node in ast.walk(ast.parse(path.read_text())):
+            modules = [node.module or ""] if isinstance(node, ast.ImportFrom) else (
+                [alias.name for alias in node.names] if isinstance(node, ast.Import) else []
+            )
+            for module in modules:
+                assert module.split(".")[0] not in {"models", "services"}, f"{path.name} imports {module}"
+
+
+def test_migrated_data_matches_the_services(tmp_path):
+    engine = legacy_engine(tmp_path)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO users (id, name, email, password, is_verified) VALUES (1, 'Legacy', 'legacy@example.com', 'x', 1)"
+            ))
+            conn.execute(text("INSERT INTO folders (id, user_id, name) VALUES (5, 1, 'docs')"))
+            conn.execute(text(
+                "INSERT INTO user_files (user_id, folder_id, filename, file_key, file_size, uploaded_at, deleted_at) VALUES "
+                "(1, NULL, 'a.txt', 'users/1/a.txt', 100, '2026-09-01 00:00:00', NULL), "
+                "(1, 5, 'b.txt', 'users/1/b.txt', 200, '2026-09-02 00:00:00', NULL), "
+                "(1, 5, 'c.txt', 'users/1/c.txt', 300, '2026-09-03 00:00:00', '2026-09-04 00:00:00')"
+            ))
+            conn.execute(text(
+                "INSERT INTO file_storage_history (user_id, filename, file_key, file_size, uploaded_at, deleted_at) "
+                "VALUES (1, 'old.bin', 'users/1/old.bin', 400, '2026-08-20 00:00:00', '2026-09-05 00:00:00')"
+            ))
+        prepare_database(engine)
+
+        with Session(engine) as db:
+            assert reconcile_storage_usage(db, fix=False) == []
+            assert check_storage_ledger(db, now=datetime(2026, 9, 30)) == []
+            queued = db.execute(text("SELECT file_key, status, attempts FROM s3_purge_queue")).all()
+        assert queued == [("users/1/c.txt", "pending", 0)]
+    finally:
+        engine.dispose()
+
+
+def insert_invoices(engine, invoices: list[tuple]):
+    """Insert (id, status, stripe_invoice_id) invoices for user 1, all billing 2026-09."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (id, name, email, password, is_verified) VALUES (1, 'Legacy', 'legacy@example.com', 'x', 1)"
+        ))
+        for invoice_id, status, stripe_id in invoices:
+            conn.execute(text(
+                "INSERT INTO invoices (id, user_id, billing_month, billing_year, total_gb_hours, cost_cents, status, "
+                "stripe_invoice_id, due_date) VALUES (:id, 1, 9, 2026, 10, 100, :status, :stripe_id, '2026-10-15')"
+            ), {"id": invoice_id, "status": status, "stripe_id": stripe_id})
+
+
+def test_duplicate_invoices_keep_the_settled_one(tmp_path):
+    engine = legacy_engine(tmp_path)
+    try:
+        insert_invoices(engine, [(1, "pending", None), (2, "paid", "in_123"), (3, "pending", None)])
+        prepare_database(engine)
+
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT id, status FROM invoices")).all() == [(2, "paid")]
+    finally:
+        engine.dispose()
+
+
+def test_duplicate_settled_invoices_fail_the_migration(tmp_path):
+    engine = legacy_engine(tmp_path)
+    try:
+        insert_invoices(engine, [(1, "paid", "in_1"), (2, "pending", "in_2"), (3, "pending", None)])
+
+        with pytest.raises(RuntimeError, match=r"user 1 2026-09: #1 \(paid\), #2 \(pending\), #3 \(pending\)"):
+            prepare_database(engine)
+
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM invoices")).scalar() == 3
+            applied = conn.execute(text("SELECT name FROM schema_migrations")).scalars().all()
+        assert "0005_invoice_period_unique" not in applied
+    finally:
+        engine.dispose()
@@ -0,0 +1,169 @@
+import statistics
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from core.security import create_access_token
+from models import Folder, S3PurgeQueue, User, UserFile
+from services.file_records import insert_file_records, soft_delete_files
+from services.purge_queue import drain_purge_queue
+from services.rekey_objects import count_legacy_files, rekey_objects
+from services.s3_client import copy_file_in_s3
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="keys@example.com", name="Keys", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def auth(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(user.email)}"}
+
+
+def upload(client, user, name: str, body: bytes = b"data") -> int:
+    response = client.post("/files/upload", headers=auth(user), files=[("files", (name, body, "text/plain"))])
+    assert response.status_code == 200
+    return response.json()["uploaded"][0]["file_id"]
+
+
+def test_rename_latency_does_not_depend_on_file_size(client, db_session, fake_s3, user, bench_full):
+    small, huge = insert_file_records(db_session, [
+        {"user_id": user.id, "folder_id": None, "filename": "small.bin",
+         "file_key": f"users/{user.id}/objects/{'a' * 32}", "file_size": 1024},
+        {"user_id": user.id, "folder_id": None, "filename": "huge.bin",
+         "file_key": f"users/{user.id}/objects/{'b' * 32}", "file_size": 20 * 1024 ** 3},
+    ])
+    db_session.commit()
+    fake_s3.add_synthetic_object(f"users/{user.id}/objects/{'a' * 32}", 1024)
+    fake_s3.add_synthetic_object(f"users/{user.id}/objects/{'b' * 32}", 20 * 1024 ** 3)
+    headers = auth(user)
+
+    timings = {}
+    for name, file_id in (("1 KiB", small), ("20 GiB", huge)):
+        samples = []
+        for i in range(20):
+            started = time.perf_counter()
+            response = client.patch(f"/files/{file_id}/rename", headers=headers, params={"new_filename": f"{name}-{i}.bin"})
+            samples.append(time.perf_counter() - started)
+            assert response.status_code == 200
+        timings[name] = statistics.median(samples)
+
+    # No S3 call at all is what makes rename cost independent of the size
+    assert fake_s3.calls == []
+    assert db_session.query(S3PurgeQueue).count() == 0
+    if bench_full:
+        print(", ".join(f"{name}: {t * 1000:.2f} ms" for name, t in timings.items()))
+        assert timings["20 GiB"] < timings["1 KiB"] * 3 + 0.005
+
+
+def test_uploads_get_opaque_keys_that_survive_rename_and_move(client, db_session, fake_s3, user):
+    folder = Folder(name="Docs", user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+    file_id = upload(client, user, "report.txt")
+    key = db_session.get(UserFile, file_id).file_key
+    assert key.startswith(f"users/{user.id}/objects/") and "report" not in key
+
+    client.patch(f"/files/{file_id}/rename", headers=auth(user), params={"new_filename": "final.pdf"})
+    client.post("/folders/move", headers=auth(user), json={"file_id": file_id, "folder_id": folder.id})
+
+    db_session.expire_all()
+    moved = db_session.get(UserFile, file_id)
+    assert (moved.filename, moved.folder_id, moved.file_key) == ("final.pdf", folder.id, key)
+    preview = client.get(f"/files/{file_id}", headers=auth(user)).json()["preview_url"]
+    assert "ResponseContentType=application/pdf" in preview
+
+
+def test_reupload_after_delete_gets_a_new_object(client, db_session, fake_s3, user):
+    first = upload(client, user, "notes.txt", b"old")
+    client.delete(f"/files/{first}", headers=auth(user))
+    second = upload(client, user, "notes.txt", b"new")
+
+    drain_purge_queue(db_session)
+
+    key = db_session.get(UserFile, second).file_key
+    assert fake_s3.objects[key]["Body"] == b"new"
+    assert len(fake_s3.objects) == 1
+
+
+def test_complete_rejects_a_key_already_in_use(client, db_session, fake_s3, user):
+    file_id = upload(client, user, "taken.txt")
+    key = db_session.get(UserFile, file_id).file_key
+
+    response = client.post(
+        "/files/complete", headers=auth(user), json={"key": key, "filename": "copy.txt", "file_size": 4}
+    )
+
+    assert response.status_code == 400
+    assert db_session.query(UserFile).count() == 1
+
+
+def test_rekey_moves_legacy_keys_in_batches(db_session, fake_s3, user):
+    rows = [
+        {"user_id": user.id, "folder_id": None, "filename": f"f{i}.txt",
+         "file_key": f"users/{user.id}/f{i}.txt", "file_size": 10}
+        for i in range(25)
+    ]
+    rows.append({"user_id": user.id, "folder_id": None, "filename": "movie.mkv",
+                 "file_key": f"users/{user.id}/movie.mkv", "file_size": 6 * 1024 ** 3})
+    rows.append({"user_id": user.id, "folder_id": None, "filename": "gone.txt",
+                 "file_key": f"users/{user.id}/gone.txt", "file_size": 10})
+    insert_file_records(db_session, rows)
+    # A deleted row sharing its key with a live file is left alone
+    db_session.add(UserFile(user_id=user.id, filename="f0.txt", file_key=f"users/{user.id}/f0.txt",
+                            file_size=10, deleted_at=datetime.utcnow()))
+    db_session.commit()
+    for row in rows[:-1]:
+        fake_s3.add_synthetic_object(row["file_key"], row["file_size"])
+
+    result = rekey_objects(db_session, batch_size=10)
+
+    assert result["moved"] == 26
+    assert [f["file_key"] for f in result["failures"]] == [f"users/{user.id}/gone.txt"]
+    assert fake_s3.calls.count("copy") == 1
+    assert count_legacy_files(db_session) == 1
+    new_keys = [
+        key for (key,) in db_session.query(UserFile.file_key).filter(
+            UserFile.filename != "gone.txt", UserFile.deleted_at.is_(None)
+        )
+    ]
+    assert all(key.startswith(f"users/{user.id}/objects/") for key in new_keys)
+    assert len(set(new_keys)) == 26
+
+    drain_purge_queue(db_session)
+    assert set(fake_s3.objects) == set(new_keys)
+
+    # Rerunning only retries the file that failed
+    again = rekey_objects(db_session, batch_size=10)
+    assert again["moved"] == 0 and len(again["failures"]) == 1
+
+
+def test_rekey_releases_the_copy_of_a_file_deleted_meanwhile(db_session, fake_s3, user, monkeypatch):
+    key = f"users/{user.id}/report.pdf"
+    insert_file_records(db_session, [
+        {"user_id": user.id, "folder_id": None, "filename": "report.pdf", "file_key": key, "file_size": 10}
+    ])
+    db_session.commit()
+    fake_s3.add_synthetic_object(key, 10)
+    session_factory = sessionmaker(bind=db_session.get_bind())
+
+    def copy_while_deleting(source_key, destination_key, size=None):
+        copy_file_in_s3(source_key, destination_key, size)
+        with session_factory() as other:
+            soft_delete_files(other, other.query(UserFile).filter_by(file_key=source_key).all())
+            other.commit()
+
+    monkeypatch.setattr("services.rekey_objects.copy_file_in_s3", copy_while_deleting)
+
+    result = rekey_objects(db_session)
+
+    assert result == {"moved": 0, "failures": []}
+    db_session.expire_all()
+    assert db_session.query(UserFile.file_key).scalar() == key
+    drain_purge_queue(db_session)
+    assert not fake_s3.objects
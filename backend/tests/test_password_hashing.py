@@ -0,0 +1,136 @@
+import asyncio
+import statistics
+import threading
+import time
+
+import httpx
+import pytest
+from passlib.context import CryptContext
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from core.database import get_async_db, get_db
+from core.security import create_access_token
+from main import app
+from models import Folder, User
+from services.file_records import insert_file_records
+from services.password_hashing import PasswordHasher, PasswordHashingBusy
+
+# Cheap hashes keep the load test short; verification cost follows the stored hash
+fast_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=8)
+
+
+def test_hasher_rejects_once_workers_and_queue_are_full():
+    hasher = PasswordHasher(workers=1, max_queued=1)
+    release = threading.Event()
+
+    async def burst():
+        running = asyncio.ensure_future(hasher.run(release.wait))
+        queued = asyncio.ensure_future(hasher.run(lambda: "queued"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PasswordHashingBusy):
+            await hasher.run(lambda: "rejected")
+        stats = hasher.stats()
+        release.set()
+        return await running, await queued, stats
+
+    running, queued, stats = asyncio.run(burst())
+
+    assert (running, queued) == (True, "queued")
+    assert (stats["running"], stats["queued"], stats["rejected"]) == (1, 1, 1)
+    assert hasher.stats()["completed"] == 2 and hasher.stats()["max_wait_ms"] > 0
+
+
+def test_login_returns_429_when_hashing_is_saturated(client, db_session, monkeypatch):
+    db_session.add(User(email="busy@example.com", name="Busy", password=fast_context.hash("pw"), is_verified=True))
+    db_session.commit()
+
+    async def saturated(fn, *args):
+        raise PasswordHashingBusy()
+
+    monkeypatch.setattr("core.security.password_hasher.run", saturated)
+    response = client.post("/auth/login", json={"email": "busy@example.com", "password": "pw"})
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+
+
+class SharedPoolHasher:
+    """bcrypt on FastAPI's own threadpool, as the sync login route did."""
+
+    async def run(self, fn, *args):
+        return await run_in_threadpool(fn, *args)
+
+
+def test_listing_latency_during_login_burst(db_session, async_session_factory, fake_s3, monkeypatch, bench_full):
+    logins = 400 if bench_full else 150
+    listings = 60
+    user = User(email="burst@example.com", name="Burst", password=fast_context.hash("pw"), is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    folder = Folder(name="docs", user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+    insert_file_records(db_session, [
+        {"user_id": user.id, "folder_id": folder.id, "filename": f"f{i}.txt",
+         "file_key": f"users/{user.id}/objects/{i:032x}", "file_size": 10}
+        for i in range(20)
+    ])
+    db_session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(user.email, user.id)}"}
+    session_factory = sessionmaker(bind=db_session.get_bind())
+
+    def fresh_session():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def fresh_async_session():
+        async with async_session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = fresh_session
+    app.dependency_overrides[get_async_db] = fresh_async_session
+
+    async def scenario(burst: bool):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            async def login():
+                return (await http.post("/auth/login", json={"email": user.email, "password": "pw"})).status_code
+
+            async def list_folder():
+                latencies = []
+                for _ in range(listings):
+                    started = time.perf_counter()
+                    response = await http.get(f"/files/in-folder/{folder.id}", headers=headers)
+                    latencies.append(time.perf_counter() - started)
+                    assert response.status_code == 200
+                return latencies
+
+            logins_done = asyncio.gather(*(login() for _ in range(logins))) if burst else asyncio.sleep(0, [])
+            await asyncio.sleep(0)
+            latencies = await list_folder()
+            return latencies, await logins_done
+
+    def p99(latencies) -> float:
+        return statistics.quantiles(latencies, n=100)[98] * 1000
+
+    try:
+        baseline, _ = asyncio.run(scenario(burst=False))
+        hasher = PasswordHasher(workers=1, max_queued=32)
+        monkeypatch.setattr("core.security.password_hasher", hasher)
+        dedicated, statuses = asyncio.run(scenario(burst=True))
+        monkeypatch.setattr("core.security.password_hasher", SharedPoolHasher())
+        shared, shared_statuses = asyncio.run(scenario(burst=True))
+    finally:
+        app.dependency_overrides.clear()
+
+    print(
+        f"folder listing p99 with {logins} concurrent logins: idle {p99(baseline):.0f} ms, "
+        f"dedicated hashing pool {p99(dedicated):.0f} ms ({statuses.count(429)} logins got 429, {hasher.stats()}), "
+        f"shared threadpool {p99(shared):.0f} ms"
+    )
+    assert set(statuses) <= {200, 429} and statuses.count(200) >= 33
+    assert set(shared_statuses) == {200}
+    assert p99(dedicated) < p99(shared)
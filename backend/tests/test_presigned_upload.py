@@ -0,0 +1,204 @@
+from core.security import create_access_token
+from models import Folder, S3PurgeQueue, User, UserFile
+
+
+def create_user(db_session, email: str = "direct@example.com") -> User:
+    user = User(email=email, name="Direct", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+def auth(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(user.email)}"}
+
+
+def test_presigned_put_upload_creates_file_record(client, db_session, fake_s3):
+    user = create_user(db_session)
+    data = b"uploaded straight to S3"
+
+    presign = client.post(
+        "/files/presign",
+        headers=auth(user),
+        json={"filename": "direct.txt", "file_size": len(data), "content_type": "text/plain"},
+    )
+    assert presign.status_code == 200
+    body = presign.json()
+    assert body["method"] == "put"
+    assert "method=put_object" in body["upload_url"]
+
+    # The browser PUTs the bytes to S3; the API never sees them
+    etag = fake_s3.put_object(Bucket=None, Key=body["key"], Body=data)["ETag"]
+
+    complete = client.post(
+        "/files/complete",
+        headers=auth(user),
+        json={"key": body["key"], "filename": "direct.txt", "file_size": len(data), "etag": etag},
+    )
+    assert complete.status_code == 200
+
+    db_file = db_session.query(UserFile).filter_by(user_id=user.id).one()
+    assert db_file.id == complete.json()["file_id"]
+    assert db_file.file_key == body["key"]
+    assert db_file.file_size == len(data)
+
+
+def test_presigned_multipart_upload(client, db_session, fake_s3, monkeypatch):
+    monkeypatch.setattr("routes.file_routes.PRESIGNED_MULTIPART_THRESHOLD", 10)
+    monkeypatch.setattr("services.s3_client.UPLOAD_PART_SIZE", 8)
+    user = create_user(db_session)
+    folder = Folder(name="Videos", user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+    data = b"0123456789abcdefghij"
+
+    presign = client.post(
+        "/files/presign",
+        headers=auth(user),
+        json={"filename": "clip.mp4", "file_size": len(data), "folder_id": folder.id},
+    )
+    body = presign.json()
+    assert body["method"] == "multipart"
+    assert body["part_size"] == 8
+    assert [p["part_number"] for p in body["parts"]] == [1, 2, 3]
+
+    parts = []
+    for part in body["parts"]:
+        start = (part["part_number"] - 1) * body["part_size"]
+        response = fake_s3.upload_part(
+            Bucket=None,
+            Key=body["key"],
+            PartNumber=part["part_number"],
+            UploadId=body["upload_id"],
+            Body=data[start:start + body["part_size"]],
+        )
+        parts.append({"part_number": part["part_number"], "etag": response["ETag"]})
+
+    complete = client.post(
+        "/files/complete",
+        headers=auth(user),
+        json={
+            "key": body["key"],
+            "filename": "clip.mp4",
+            "file_size": len(data),
+            "folder_id": folder.id,
+            "upload_id": body["upload_id"],
+            "parts": parts,
+        },
+    )
+
+    assert complete.status_code == 200
+    assert fake_s3.objects[body["key"]]["Body"] == data
+    db_file = db_session.query(UserFile).filter_by(user_id=user.id).one()
+    assert db_file.folder_id == folder.id
+
+
+def test_complete_rejects_size_mismatch_and_removes_object(client, db_session, fake_s3):
+    user = create_user(db_session)
+    presign = client.post(
+        "/files/presign", headers=auth(user), json={"filename": "short.txt", "file_size": 100}
+    ).json()
+    fake_s3.put_object(Bucket=None, Key=presign["key"], Body=b"too short")
+
+    complete = client.post(
+        "/files/complete",
+        headers=auth(user),
+        json={"key": presign["key"], "filename": "short.txt", "file_size": 100},
+    )
+
+    assert complete.status_code == 400
+    assert presign["key"] not in fake_s3.objects
+    assert db_session.query(UserFile).count() == 0
+
+
+def test_complete_rejects_missing_object(client, db_session, fake_s3):
+    user = create_user(db_session)
+    presign = client.post(
+        "/files/presign", headers=auth(user), json={"filename": "never.txt", "file_size": 5}
+    ).json()
+
+    complete = client.post(
+        "/files/complete",
+        headers=auth(user),
+        json={"key": presign["key"], "filename": "never.txt", "file_size": 5},
+    )
+
+    assert complete.status_code == 400
+    assert complete.json()["detail"] == "Uploaded object not found in S3"
+
+
+def test_complete_rejects_another_users_key(client, db_session, fake_s3):
+    owner = create_user(db_session, "owner@example.com")
+    intruder = create_user(db_session, "intruder@example.com")
+    key = f"users/{owner.id}/secret.txt"
+    fake_s3.put_object(Bucket=None, Key=key, Body=b"secret")
+
+    complete = client.post(
+        "/files/complete",
+        headers=auth(intruder),
+        json={"key": key, "filename": "secret.txt", "file_size": 6},
+    )
+
+    assert complete.status_code == 400
+    assert key in fake_s3.objects
+    assert db_session.query(UserFile).count() == 0
+
+
+def test_presign_rejects_existing_filename(client, db_session, fake_s3):
+    user = create_user(db_session)
+    db_session.add(UserFile(user_id=user.id, filename="taken.txt", file_key="users/1/taken.txt", file_size=1))
+    db_session.commit()
+
+    presign = client.post(
+        "/files/presign", headers=auth(user), json={"filename": "taken.txt", "file_size": 5}
+    )
+
+    assert presign.status_code == 400
+    assert "already exists" in presign.json()["detail"]
+
+
+def test_complete_rejects_another_users_folder(client, db_session, fake_s3):
+    owner = create_user(db_session, "owner@example.com")
+    intruder = create_user(db_session, "intruder@example.com")
+    folder = Folder(name="private", user_id=owner.id)
+    db_session.add(folder)
+    db_session.commit()
+    presign = client.post(
+        "/files/presign", headers=auth(intruder), json={"filename": "drop.txt", "file_size": 4}
+    ).json()
+    fake_s3.put_object(Bucket=None, Key=presign["key"], Body=b"drop")
+
+    complete = client.post(
+        "/files/complete",
+        headers=auth(intruder),
+        json={"key": presign["key"], "filename": "drop.txt", "file_size": 4, "folder_id": folder.id},
+    )
+
+    assert complete.status_code == 404
+    assert db_session.query(UserFile).count() == 0
+
+
+def test_complete_queues_object_of_a_rejected_name(client, db_session, fake_s3):
+    user = create_user(db_session)
+    presign = client.post(
+        "/files/presign", headers=auth(user), json={"filename": "race.txt", "file_size": 4}
+    ).json()
+    fake_s3.put_object(Bucket=None, Key=presign["key"], Body=b"race")
+    # Another upload took the name after the presign
+    db_session.add(UserFile(user_id=user.id, filename="race.txt", file_key=f"users/{user.id}/other", file_size=1))
+    db_session.commit()
+
+    complete = client.post(
+        "/files/complete",
+        headers=auth(user),
+        json={"key": presign["key"], "filename": "race.txt", "file_size": 4},
+    )
+    empty = client.post(
+        "/files/complete",
+        headers=auth(user),
+        json={"key": presign["key"], "filename": "dir/", "file_size": 4},
+    )
+
+    assert complete.status_code == 400 and empty.status_code == 400
+    assert [row.file_key for row in db_session.query(S3PurgeQueue)] == [presign["key"]]
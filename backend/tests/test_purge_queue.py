@@ -0,0 +1,138 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.security import create_access_token
+from models import S3PurgeQueue, User, UserFile
+from services import purge_queue
+from services.file_records import insert_file_records
+from services.purge_queue import (
+    drain_purge_queue, enqueue_s3_deletes, purge_queue_stats, retry_failed_purges, run_purge_worker
+)
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="purge@example.com", name="Purge", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def add_objects(fake_s3, keys):
+    for key in keys:
+        fake_s3.objects[key] = {"Body": b"x", "ETag": '"x"', "ContentLength": 1}
+
+
+def test_delete_file_only_touches_the_database(client, db_session, fake_s3, user):
+    insert_file_records(db_session, [
+        {"user_id": user.id, "folder_id": None, "filename": "a.txt", "file_key": "users/1/a.txt", "file_size": 1}
+    ])
+    db_session.commit()
+    add_objects(fake_s3, ["users/1/a.txt"])
+    file_id = db_session.query(UserFile).one().id
+
+    response = client.delete(f"/files/{file_id}", headers={"Authorization": f"Bearer {create_access_token(user.email)}"})
+
+    assert response.status_code == 200
+    assert fake_s3.calls == []
+    assert purge_queue_stats(db_session)["pending"] == 1
+
+    assert drain_purge_queue(db_session) == 1
+    assert fake_s3.objects == {}
+    assert purge_queue_stats(db_session) == {"pending": 0, "failed": 0, "oldest_pending_at": None}
+
+
+def test_drain_uses_batches_of_1000(db_session, fake_s3):
+    keys = [f"users/1/f{i}" for i in range(2500)]
+    add_objects(fake_s3, keys)
+    enqueue_s3_deletes(db_session, keys)
+    db_session.commit()
+
+    assert drain_purge_queue(db_session) == 2500
+
+    assert fake_s3.calls.count("delete_objects") == 3
+    assert fake_s3.objects == {}
+    assert db_session.query(S3PurgeQueue).count() == 0
+
+
+def test_keys_a_live_file_uses_are_not_deleted(db_session, fake_s3, user):
+    # Queued by an earlier delete, then reused by a new upload before the purge ran
+    add_objects(fake_s3, ["users/1/a.txt", "users/1/b.txt"])
+    enqueue_s3_deletes(db_session, ["users/1/a.txt", "users/1/b.txt"])
+    insert_file_records(db_session, [
+        {"user_id": user.id, "folder_id": None, "filename": "a.txt", "file_key": "users/1/a.txt", "file_size": 1}
+    ])
+    db_session.commit()
+
+    assert drain_purge_queue(db_session) == 2
+
+    assert set(fake_s3.objects) == {"users/1/a.txt"}
+    assert db_session.query(S3PurgeQueue).count() == 0
+
+
+def test_failed_keys_back_off_then_give_up(db_session, fake_s3, monkeypatch):
+    monkeypatch.setattr(purge_queue, "PURGE_MAX_ATTEMPTS", 3)
+    add_objects(fake_s3, ["ok", "locked"])
+    real_delete_objects = fake_s3.delete_objects
+
+    def delete_objects(Bucket, Delete):
+        real_delete_objects(Bucket, {"Objects": [o for o in Delete["Objects"] if o["Key"] != "locked"]})
+        return {"Errors": [{"Key": "locked", "Code": "AccessDenied", "Message": "Access Denied"}]}
+
+    monkeypatch.setattr(fake_s3, "delete_objects", delete_objects)
+    enqueue_s3_deletes(db_session, ["ok", "locked"])
+    db_session.commit()
+    now = datetime.utcnow()
+
+    assert drain_purge_queue(db_session, now=now) == 2
+    entry = db_session.query(S3PurgeQueue).one()
+    assert (entry.file_key, entry.attempts, entry.status) == ("locked", 1, "pending")
+    assert entry.last_error == "AccessDenied: Access Denied"
+    assert "ok" not in fake_s3.objects
+
+    # Not due again until the backoff has passed
+    assert drain_purge_queue(db_session, now=now + timedelta(seconds=1)) == 0
+    assert drain_purge_queue(db_session, now=now + timedelta(seconds=31)) == 1
+    assert drain_purge_queue(db_session, now=now + timedelta(seconds=200)) == 1
+    db_session.expire_all()
+    assert db_session.query(S3PurgeQueue).one().status == "failed"
+    assert purge_queue_stats(db_session)["failed"] == 1
+
+    monkeypatch.setattr(fake_s3, "delete_objects", real_delete_objects)
+    assert retry_failed_purges(db_session) == 1
+    assert drain_purge_queue(db_session) == 1
+    assert fake_s3.objects == {}
+
+
+def test_s3_outage_keeps_keys_queued(db_session, fake_s3, monkeypatch):
+    def unavailable(Bucket, Delete):
+        raise ConnectionError("S3 unreachable")
+
+    monkeypatch.setattr(fake_s3, "delete_objects", unavailable)
+    enqueue_s3_deletes(db_session, ["a", "b"])
+    db_session.commit()
+
+    assert drain_purge_queue(db_session) == 2
+
+    rows = db_session.query(S3PurgeQueue).all()
+    assert [(row.attempts, row.status, row.last_error) for row in rows] == [(1, "pending", "S3 unreachable")] * 2
+
+
+def test_worker_drains_in_the_background(db_session, fake_s3):
+    add_objects(fake_s3, ["a", "b"])
+    enqueue_s3_deletes(db_session, ["a", "b"])
+    db_session.commit()
+
+    async def run_briefly():
+        worker = asyncio.create_task(run_purge_worker(lambda: db_session, interval=0.01))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not fake_s3.objects:
+                break
+        worker.cancel()
+
+    asyncio.run(run_briefly())
+
+    assert fake_s3.objects == {}
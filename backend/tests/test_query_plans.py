@@ -0,0 +1,125 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from core.security import create_access_token
+from models import Folder, User, UserFile
+
+
+@pytest.fixture
+def captured_queries(db_session, async_session_factory):
+    """Record every SELECT the routes run against user_files or folders, through either session type."""
+    engines = [db_session.get_bind(), async_session_factory.kw["bind"].sync_engine]
+    queries = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        sql = statement.lower()
+        if sql.lstrip().startswith("select") and ("user_files" in sql or "folders" in sql):
+            queries.append((statement, parameters))
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", capture)
+    yield queries
+    for engine in engines:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+@pytest.fixture
+def seeded(db_session):
+    user = User(email="plans@example.com", name="Plans", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    folder = Folder(name="Work", user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+    for i in range(20):
+        db_session.add(UserFile(
+            user_id=user.id,
+            folder_id=folder.id if i % 2 else None,
+            filename=f"file-{i}.txt",
+            file_key=f"users/{user.id}/file-{i}.txt",
+            file_size=100,
+        ))
+    db_session.commit()
+    file_in_folder = db_session.query(UserFile).filter_by(user_id=user.id, folder_id=folder.id).first()
+    return user, folder, file_in_folder
+
+
+def query_plans(db_session, queries) -> list[str]:
+    plans = []
+    with db_session.get_bind().connect() as conn:
+        for statement, parameters in queries:
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            plans.append("\n".join(row[-1] for row in rows))
+    return plans
+
+
+def route_calls(user, folder, file_in_folder):
+    return [
+        ("list files page", "get", "/files/list", {"params": {"limit": 5}}, "ix_user_files_user_uploaded"),
+        ("files in folder", "get", f"/files/in-folder/{folder.id}", {}, "ix_user_files_user_folder_uploaded"),
+        ("folder contents", "get", f"/folders/in_folder/{folder.id}", {}, "ix_user_files_user_folder"),
+        (
+            "upload duplicate check", "post", f"/files/upload?folder_id={folder.id}",
+            {"files": [("files", ("new.txt", b"data", "text/plain"))]},
+            "ix_user_files_user_folder_name",
+        ),
+        (
+            "rename duplicate check", "patch", f"/files/{file_in_folder.id}/rename",
+            {"params": {"new_filename": "renamed.txt"}},
+            "ix_user_files_user_folder_name",
+        ),
+        (
+            "move duplicate check", "post", "/folders/move",
+            {"json": {"file_id": file_in_folder.id, "folder_id": None}},
+            "ix_user_files_user_folder_name",
+        ),
+        (
+            "create folder duplicate check", "post", "/folders/create",
+            {"params": {"name": "Personal", "parent_id": folder.id}},
+            "ix_folders_user_parent_name",
+        ),
+        ("folder list", "get", "/folders/list", {}, "ix_folders_user_parent_name"),
+        (
+            "invoice file breakdown", "post", "/billing/generate-invoice",
+            {"params": {"year": 2026, "month": 8}},
+            "ix_user_files_user_deleted",
+        ),
+    ]
+
+
+def test_route_queries_use_composite_indexes(client, db_session, fake_s3, seeded, captured_queries):
+    user, folder, file_in_folder = seeded
+    fake_s3.put_object(Bucket=None, Key=file_in_folder.file_key, Body=b"data")
+    headers = {"Authorization": f"Bearer {create_access_token(user.email)}"}
+
+    for name, method, url, kwargs, expected_index in route_calls(user, folder, file_in_folder):
+        captured_queries.clear()
+        response = getattr(client, method)(url, headers=headers, **kwargs)
+        assert response.status_code == 200, name
+
+        plans = query_plans(db_session, captured_queries)
+        assert plans, name
+        assert any(expected_index in plan for plan in plans), f"{name}:\n" + "\n---\n".join(plans)
+        for plan in plans:
+            # Every lookup is an index search, never a full table scan
+            assert "SCAN user_files" not in plan and "SCAN folders" not in plan, f"{name}:\n{plan}"
+
+
+def test_unique_index_blocks_duplicate_live_filenames(db_session):
+    user = User(email="unique@example.com", name="Unique", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    db_session.add(UserFile(user_id=user.id, filename="a.txt", file_key="k1", file_size=1))
+    db_session.commit()
+
+    db_session.add(UserFile(user_id=user.id, filename="a.txt", file_key="k2", file_size=1))
+    with pytest.raises(Exception):
+        db_session.commit()
+    db_session.rollback()
+
+    # A soft-deleted row does not count against the live name
+    db_session.query(UserFile).filter_by(filename="a.txt").update({"deleted_at": datetime(2025, 1, 1)})
+    db_session.add(UserFile(user_id=user.id, filename="a.txt", file_key="k3", file_size=1))
+    db_session.commit()
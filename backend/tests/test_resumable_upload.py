@@ -0,0 +1,253 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.security import create_access_token
+from models import Folder, S3PurgeQueue, UploadSession, UploadSessionPart, User, UserFile
+from services.upload_sessions import UPLOAD_SESSION_TTL, expire_upload_sessions, spool_chunk
+
+CONTENT = os.urandom(35)  # five chunks of 8 bytes, the last one 3 bytes
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="resume@example.com", name="Resume", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture(autouse=True)
+def small_parts(monkeypatch):
+    monkeypatch.setattr("services.s3_client.UPLOAD_PART_SIZE", 8)
+
+
+def auth(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(user.email)}"}
+
+
+def start(client, user, filename: str = "video.mp4", size: int = len(CONTENT), folder_id: int | None = None) -> dict:
+    response = client.post(
+        "/files/uploads", headers=auth(user), json={"filename": filename, "file_size": size, "folder_id": folder_id}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def put_chunk(client, user, upload_id: str, offset: int, body: bytes):
+    return client.put(f"/files/uploads/{upload_id}", headers=auth(user), params={"offset": offset}, content=body)
+
+
+def test_interrupted_upload_resumes_from_status(client, db_session, fake_s3, user):
+    session = start(client, user)
+    upload_id = session["upload_id"]
+    assert (session["part_size"], session["next_offset"]) == (8, 0)
+
+    real_upload_part = fake_s3.upload_part
+    failures = {3}
+
+    def flaky_upload_part(**kwargs):
+        if kwargs["PartNumber"] in failures:
+            failures.discard(kwargs["PartNumber"])
+            raise ConnectionError("connection reset")
+        return real_upload_part(**kwargs)
+
+    fake_s3.upload_part = flaky_upload_part
+
+    assert put_chunk(client, user, upload_id, 0, CONTENT[0:8]).status_code == 200
+    assert put_chunk(client, user, upload_id, 8, CONTENT[8:16]).status_code == 200
+    # S3 drops the third chunk, and the fourth is cut off in transit
+    assert put_chunk(client, user, upload_id, 16, CONTENT[16:24]).status_code == 502
+    assert put_chunk(client, user, upload_id, 24, CONTENT[24:29]).status_code == 400
+
+    # The client comes back later and asks where to continue
+    status = client.get(f"/files/uploads/{upload_id}", headers=auth(user)).json()
+    assert status["received_parts"] == [1, 2]
+    assert status["received_bytes"] == 16
+    offset = status["next_offset"]
+    assert offset == 16
+    while offset is not None:
+        response = put_chunk(client, user, upload_id, offset, CONTENT[offset:offset + 8])
+        assert response.status_code == 200
+        offset = response.json()["next_offset"]
+
+    response = client.post(f"/files/uploads/{upload_id}/complete", headers=auth(user))
+
+    assert response.status_code == 200
+    file = db_session.get(UserFile, response.json()["file_id"])
+    assert (file.filename, file.file_size) == ("video.mp4", len(CONTENT))
+    assert fake_s3.objects[file.file_key]["Body"] == CONTENT
+    assert db_session.query(UploadSession).count() == 0
+    assert db_session.query(UploadSessionPart).count() == 0
+    assert client.get("/storage", headers=auth(user)).json() == {"total_files": 1, "total_bytes": len(CONTENT)}
+
+
+def test_chunks_can_arrive_out_of_order_and_be_resent(client, db_session, fake_s3, user):
+    upload_id = start(client, user)["upload_id"]
+
+    for offset in (32, 8, 24, 0):
+        assert put_chunk(client, user, upload_id, offset, CONTENT[offset:offset + 8]).status_code == 200
+    # A chunk sent twice replaces the earlier copy
+    assert put_chunk(client, user, upload_id, 8, b"XXXXXXXX").status_code == 200
+    assert put_chunk(client, user, upload_id, 8, CONTENT[8:16]).status_code == 200
+
+    incomplete = client.post(f"/files/uploads/{upload_id}/complete", headers=auth(user))
+    assert incomplete.status_code == 400
+    assert incomplete.json()["detail"] == "Upload is missing 1 of 5 chunks"
+
+    assert put_chunk(client, user, upload_id, 16, CONTENT[16:24]).status_code == 200
+    response = client.post(f"/files/uploads/{upload_id}/complete", headers=auth(user))
+
+    assert response.status_code == 200
+    key = db_session.get(UserFile, response.json()["file_id"]).file_key
+    assert fake_s3.objects[key]["Body"] == CONTENT
+
+
+@pytest.mark.parametrize("offset, body", [(4, b"x" * 8), (40, b"x" * 8), (0, b"x" * 9), (32, b"x" * 8)])
+def test_misaligned_chunks_are_rejected(client, fake_s3, user, offset, body):
+    upload_id = start(client, user)["upload_id"]
+
+    response = put_chunk(client, user, upload_id, offset, body)
+
+    assert response.status_code == 400
+    assert "upload_part" not in fake_s3.calls
+
+
+def test_chunks_without_a_declared_size_are_streamed(client, db_session, fake_s3, user):
+    upload_id = start(client, user)["upload_id"]
+
+    def pieces(body: bytes):
+        for i in range(0, len(body), 3):
+            yield body[i:i + 3]
+
+    # Generator bodies go out with chunked transfer encoding, no Content-Length
+    for offset in range(0, len(CONTENT), 8):
+        assert put_chunk(client, user, upload_id, offset, pieces(CONTENT[offset:offset + 8])).status_code == 200
+    too_long = put_chunk(client, user, upload_id, 0, pieces(b"x" * 20))
+    response = client.post(f"/files/uploads/{upload_id}/complete", headers=auth(user))
+
+    assert too_long.status_code == 400
+    assert response.status_code == 200
+    key = db_session.get(UserFile, response.json()["file_id"]).file_key
+    assert fake_s3.objects[key]["Body"] == CONTENT
+
+
+def test_large_chunks_spill_to_disk(monkeypatch):
+    monkeypatch.setattr("services.upload_sessions.UPLOAD_CHUNK_MEMORY", 1024)
+
+    async def stream():
+        for _ in range(8):
+            yield b"x" * 512
+
+    spool, length = asyncio.run(spool_chunk(stream(), 4096))
+    with spool:
+        assert length == 4096
+        assert spool._rolled  # moved out of memory past UPLOAD_CHUNK_MEMORY
+        assert spool.read() == b"x" * 4096
+
+
+def test_name_conflict_keeps_the_session(client, db_session, fake_s3, user):
+    upload_id = start(client, user, "clip.mp4")["upload_id"]
+    for offset in range(0, len(CONTENT), 8):
+        put_chunk(client, user, upload_id, offset, CONTENT[offset:offset + 8])
+    client.post("/files/upload", headers=auth(user), files=[("files", ("clip.mp4", b"other", "video/mp4"))])
+
+    conflict = client.post(f"/files/uploads/{upload_id}/complete", headers=auth(user))
+    assert conflict.status_code == 400
+
+    response = client.post(f"/files/uploads/{upload_id}/complete", headers=auth(user), json={"filename": "clip (2).mp4"})
+    assert response.status_code == 200
+    assert response.json()["filename"] == "clip (2).mp4"
+
+
+def test_sessions_belong_to_their_user(client, db_session, fake_s3, user):
+    other = User(email="resume-other@example.com", name="Other", password="hashed", is_verified=True)
+    db_session.add(other)
+    db_session.commit()
+    upload_id = start(client, user)["upload_id"]
+
+    assert client.get(f"/files/uploads/{upload_id}", headers=auth(other)).status_code == 404
+    assert put_chunk(client, other, upload_id, 0, CONTENT[:8]).status_code == 404
+    assert client.delete(f"/files/uploads/{upload_id}", headers=auth(other)).status_code == 404
+
+
+def test_abandoned_sessions_expire_and_their_parts_are_dropped(client, db_session, fake_s3, user):
+    abandoned = start(client, user, "old.mp4")["upload_id"]
+    put_chunk(client, user, abandoned, 0, CONTENT[:8])
+    cancelled = start(client, user, "cancelled.mp4")["upload_id"]
+    assert client.delete(f"/files/uploads/{cancelled}", headers=auth(user)).status_code == 200
+    assert len(fake_s3.multipart_uploads) == 1
+
+    later = datetime.utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL + 1)
+    db_session.query(UploadSession).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db_session.commit()
+    assert client.get(f"/files/uploads/{abandoned}", headers=auth(user)).status_code == 410
+
+    assert expire_upload_sessions(db_session, now=later) == 1
+    assert fake_s3.multipart_uploads == {}
+    assert db_session.query(UploadSession).count() == 0
+    assert db_session.query(UploadSessionPart).count() == 0
+    assert client.get(f"/files/uploads/{abandoned}", headers=auth(user)).status_code == 404
+
+
+def test_object_assembled_without_a_record_is_recovered_or_purged(client, db_session, fake_s3, user):
+    # Finalize is retried after S3 assembled the object but the record wasn't saved
+    retried = start(client, user, "a.mp4")
+    lost = start(client, user, "b.mp4")
+    for session in (retried, lost):
+        for offset in range(0, len(CONTENT), 8):
+            put_chunk(client, user, session["upload_id"], offset, CONTENT[offset:offset + 8])
+        row = db_session.get(UploadSession, session["upload_id"])
+        parts = fake_s3.multipart_uploads[row.s3_upload_id]["Parts"]
+        fake_s3.complete_multipart_upload(
+            Bucket="bucket", Key=row.file_key, UploadId=row.s3_upload_id,
+            MultipartUpload={"Parts": [{"PartNumber": n, "ETag": p["ETag"]} for n, p in sorted(parts.items())]}
+        )
+
+    response = client.post(f"/files/uploads/{retried['upload_id']}/complete", headers=auth(user))
+    assert response.status_code == 200
+    assert fake_s3.objects[db_session.get(UserFile, response.json()["file_id"]).file_key]["Body"] == CONTENT
+
+    # The other client never came back: cleanup queues its orphaned object
+    lost_key = db_session.get(UploadSession, lost["upload_id"]).file_key
+    expire_upload_sessions(db_session, now=datetime.utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL + 1))
+    assert [key for (key,) in db_session.query(S3PurgeQueue.file_key)] == [lost_key]
+
+
+def upload_all_chunks(client, user, upload_id: str):
+    for offset in range(0, len(CONTENT), 8):
+        assert put_chunk(client, user, upload_id, offset, CONTENT[offset:offset + 8]).status_code == 200
+
+
+def test_deleting_the_folder_ends_its_uploads(client, db_session, fake_s3, user):
+    folder = Folder(name="videos", user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+    upload_id = start(client, user, folder_id=folder.id)["upload_id"]
+    upload_all_chunks(client, user, upload_id)
+
+    assert client.delete(f"/folders/{folder.id}", headers=auth(user)).status_code == 200
+
+    assert client.post(f"/files/uploads/{upload_id}/complete", headers=auth(user)).status_code == 410
+    assert db_session.get(UploadSession, upload_id).folder_id is None
+    assert expire_upload_sessions(db_session) == 1
+    assert fake_s3.multipart_uploads == {}
+    assert db_session.query(UserFile).count() == 0
+
+
+def test_finalize_rejects_a_folder_that_is_gone(client, db_session, fake_s3, user):
+    folder = Folder(name="videos", user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+    upload_id = start(client, user, folder_id=folder.id)["upload_id"]
+    upload_all_chunks(client, user, upload_id)
+    # A folder that no longer exists, e.g. removed outside delete_subtree
+    db_session.query(UploadSession).update({"folder_id": folder.id + 1})
+    db_session.commit()
+
+    response = client.post(f"/files/uploads/{upload_id}/complete", headers=auth(user))
+
+    assert response.status_code == 404
+    assert db_session.query(UserFile).count() == 0
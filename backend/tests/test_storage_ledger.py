@@ -0,0 +1,169 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from core.security import create_access_token
+from models import StorageEvent, StorageUsageMonth, User, UserFile
+from services.file_records import new_file_key
+from services.storage_ledger import (
+    backfill_storage_events,
+    check_storage_ledger,
+    compute_month_usage,
+    get_month_usage,
+    rebuild_usage_months,
+    record_storage_events,
+)
+
+START = datetime(2026, 6, 20)
+MONTHS = [(2026, 6), (2026, 7), (2026, 8), (2026, 9)]
+
+
+def make_user(db_session, email: str) -> User:
+    user = User(email=email, name="Ledger", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def random_history(db_session, user: User, seed: int, steps: int = 300, check=None):
+    """
+    Uploads and deletes at increasing times over three months, as the routes
+    would record them. `check(at)` runs every 50 steps.
+    """
+    rng = random.Random(seed)
+    at = START
+    live = []
+    for step in range(steps):
+        at += timedelta(seconds=rng.randint(1, 6 * 3600))
+        if rng.random() < 0.55 or not live:
+            file = UserFile(
+                user_id=user.id, filename=f"f{step}.bin", file_key=new_file_key(user.id),
+                file_size=rng.randint(1, 5 * 1024 ** 3), uploaded_at=at,
+            )
+            db_session.add(file)
+            db_session.flush()
+            record_storage_events(db_session, [(user.id, file.id, "upload", file.file_size)], at=at)
+            live.append(file)
+        else:
+            file = live.pop(rng.randrange(len(live)))
+            file.deleted_at = at
+            record_storage_events(db_session, [(user.id, file.id, "delete", -file.file_size)], at=at)
+        if check and step % 50 == 49:
+            db_session.commit()
+            check(at)
+    db_session.commit()
+    return at
+
+
+def assert_matches_scan(db_session, user_id: int, now: datetime):
+    for year, month in MONTHS:
+        ledger = get_month_usage(db_session, user_id, year, month, now)
+        scan = compute_month_usage(db_session, user_id, year, month, now)
+        assert ledger[1] == scan[1]
+        assert ledger[0] == pytest.approx(scan[0], rel=1e-9)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_ledger_matches_a_full_scan(db_session, seed):
+    user = make_user(db_session, f"ledger{seed}@example.com")
+    checks = []
+
+    def check(now):
+        assert_matches_scan(db_session, user.id, now)
+        checks.append(now)
+
+    last = random_history(db_session, user, seed, check=check)
+
+    # At the last event and after it, including months with no events yet
+    for now in (last, last + timedelta(hours=1), last + timedelta(days=40)):
+        assert_matches_scan(db_session, user.id, now)
+    assert len(checks) == 6
+
+    assert rebuild_usage_months(db_session, user.id) > 0
+    assert_matches_scan(db_session, user.id, last + timedelta(days=20))
+
+
+def test_backfill_rebuilds_the_same_usage(db_session):
+    user = make_user(db_session, "backfill@example.com")
+    last = random_history(db_session, user, seed=7)
+    recorded = {
+        (row.year, row.month): (row.active_bytes, row.byte_seconds)
+        for row in db_session.query(StorageUsageMonth).filter_by(user_id=user.id)
+    }
+
+    db_session.query(StorageEvent).delete()
+    db_session.query(StorageUsageMonth).delete()
+    backfill_storage_events(db_session)
+    rebuild_usage_months(db_session)
+
+    rebuilt = {
+        (row.year, row.month): (row.active_bytes, row.byte_seconds)
+        for row in db_session.query(StorageUsageMonth).filter_by(user_id=user.id)
+    }
+    assert rebuilt.keys() == recorded.keys()
+    for key, (active_bytes, byte_seconds) in recorded.items():
+        assert rebuilt[key][0] == active_bytes
+        assert rebuilt[key][1] == pytest.approx(byte_seconds, rel=1e-9)
+    assert check_storage_ledger(db_session, now=last) == []
+
+
+def test_billing_endpoints_read_the_ledger(client, db_session, fake_s3):
+    user = make_user(db_session, "billing-ledger@example.com")
+    headers = {"Authorization": f"Bearer {create_access_token(user.email)}"}
+    for name in ("kept.bin", "deleted.bin"):
+        upload = client.post("/files/upload", headers=headers, files=[("files", (name, b"x" * 1000, "application/octet-stream"))])
+        assert upload.status_code == 200
+    deleted = db_session.query(UserFile).filter_by(user_id=user.id, filename="deleted.bin").one()
+    assert client.delete(f"/files/{deleted.id}", headers=headers).status_code == 200
+
+    # The billing page calls /billing/usage without parameters and renders the file lists
+    usage = client.get("/billing/usage", headers=headers)
+    totals = client.get("/billing/usage", headers=headers, params={"include_files": False})
+    billing = client.get("/files/billing", headers=headers)
+
+    assert usage.status_code == 200 and totals.status_code == 200 and billing.status_code == 200
+    assert [f["filename"] for f in usage.json()["active_files"]] == ["kept.bin"]
+    assert [f["filename"] for f in usage.json()["deleted_files"]] == ["deleted.bin"]
+    for f in usage.json()["active_files"] + usage.json()["deleted_files"]:
+        assert {"filename", "size_gb", "days_stored", "cost_this_month"} <= f.keys()
+    assert totals.json()["active_files"] == [] and totals.json()["deleted_files"] == []
+    assert usage.json()["current_month_gb_hours"] >= 0 and "current_month_cost" in usage.json()
+    assert billing.json()["estimated_cost"] >= billing.json()["actual_cost"] >= 0
+
+
+def test_ledger_reads_vs_full_scans(db_session, bench_full):
+    files = 100_000 if bench_full else 10_000
+    rounds = 20 if bench_full else 5
+    user = make_user(db_session, "ledger-bench@example.com")
+    uploaded = datetime(2026, 9, 1)
+    db_session.execute(insert(UserFile), [
+        {
+            "user_id": user.id, "filename": f"f{i}.bin", "file_key": f"users/{user.id}/objects/{i:032x}",
+            "file_size": 1000 + i, "uploaded_at": uploaded + timedelta(seconds=i),
+        }
+        for i in range(files)
+    ])
+    db_session.commit()
+    backfill_storage_events(db_session)
+    rebuild_usage_months(db_session)
+    now = datetime(2026, 9, 20)
+
+    def timed(read) -> tuple[float, tuple]:
+        started = time.perf_counter()
+        result = read(db_session, user.id, now.year, now.month, now)
+        return time.perf_counter() - started, result
+
+    ledger = [timed(get_month_usage) for _ in range(rounds)]
+    scan = [timed(compute_month_usage) for _ in range(rounds)]
+
+    assert ledger[0][1][1] == scan[0][1][1]
+    assert ledger[0][1][0] == pytest.approx(scan[0][1][0], rel=1e-9)
+    if bench_full:
+        ledger_ms = statistics.median(t for t, _ in ledger) * 1000
+        scan_ms = statistics.median(t for t, _ in scan) * 1000
+        print(f"{files} files: ledger read {ledger_ms:.2f} ms, full scan {scan_ms:.1f} ms")
+        assert ledger_ms < scan_ms
@@ -0,0 +1,116 @@
+import time
+
+from sqlalchemy import func
+
+from core.security import create_access_token
+from models import Folder, User, UserFile, UserStorageUsage
+from services.file_records import insert_file_records
+from services.storage_usage import get_storage_usage, reconcile_storage_usage
+
+
+def create_user(db_session, email: str = "usage@example.com") -> User:
+    user = User(email=email, name="Usage", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+def auth(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(user.email)}"}
+
+
+def folder_usage(client, user) -> dict:
+    response = client.get("/storage/folders", headers=auth(user))
+    assert response.status_code == 200
+    return {row["folder_id"]: (row["total_files"], row["total_bytes"]) for row in response.json()}
+
+
+def test_counters_follow_upload_move_and_delete(client, db_session, fake_s3):
+    user = create_user(db_session)
+    folder = Folder(name="Music", user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+
+    client.post(
+        "/files/upload",
+        headers=auth(user),
+        files=[
+            ("files", ("a.mp3", b"a" * 100, "audio/mpeg")),
+            ("files", ("b.mp3", b"b" * 50, "audio/mpeg")),
+        ],
+    )
+    assert client.get("/storage", headers=auth(user)).json() == {"total_files": 2, "total_bytes": 150}
+    assert folder_usage(client, user) == {None: (2, 150)}
+
+    file_a = db_session.query(UserFile).filter_by(filename="a.mp3").one()
+    client.post("/folders/move", headers=auth(user), json={"file_id": file_a.id, "folder_id": folder.id})
+    assert folder_usage(client, user) == {None: (1, 50), folder.id: (1, 100)}
+
+    file_b = db_session.query(UserFile).filter_by(filename="b.mp3").one()
+    client.delete(f"/files/{file_b.id}", headers=auth(user))
+    assert client.get("/storage", headers=auth(user)).json() == {"total_files": 1, "total_bytes": 100}
+
+    client.delete(f"/folders/{folder.id}", headers=auth(user))
+    assert client.get("/storage", headers=auth(user)).json() == {"total_files": 0, "total_bytes": 0}
+    assert folder_usage(client, user) == {}
+    assert reconcile_storage_usage(db_session, fix=False) == []
+
+
+def test_reconcile_reports_and_fixes_drift(db_session):
+    user = create_user(db_session)
+    insert_file_records(db_session, [
+        {"user_id": user.id, "filename": f"f{i}", "file_key": f"k{i}", "file_size": 10, "folder_id": None}
+        for i in range(3)
+    ])
+    db_session.commit()
+
+    # Simulate a write that bypassed the counters
+    db_session.add(UserFile(user_id=user.id, filename="sneaky", file_key="k-sneaky", file_size=5))
+    db_session.commit()
+
+    drift = reconcile_storage_usage(db_session, fix=False)
+    assert {(d["user_id"], d["folder_id"]) for d in drift} == {(user.id, None), (user.id, 0)}
+    total = next(d for d in drift if d["folder_id"] is None)
+    assert (total["stored_files"], total["actual_files"]) == (3, 4)
+    assert (total["stored_bytes"], total["actual_bytes"]) == (30, 35)
+
+    reconcile_storage_usage(db_session, fix=True)
+    assert get_storage_usage(db_session, user.id) == (4, 35)
+    assert reconcile_storage_usage(db_session, fix=False) == []
+
+
+def test_storage_latency_counters_vs_full_scan(client, db_session, bench_full):
+    user = create_user(db_session)
+    file_count = 100_000 if bench_full else 20_000
+    for start in range(0, file_count, 10_000):
+        insert_file_records(db_session, [
+            {"user_id": user.id, "filename": f"f{i}", "file_key": f"users/{user.id}/f{i}",
+             "file_size": 1000, "folder_id": None}
+            for i in range(start, min(start + 10_000, file_count))
+        ])
+    db_session.commit()
+
+    def scan():
+        count = db_session.query(UserFile).filter(UserFile.user_id == user.id).count()
+        total = db_session.query(func.sum(UserFile.file_size)).filter(UserFile.user_id == user.id).scalar()
+        return count, total
+
+    def counters():
+        db_session.expire_all()
+        return get_storage_usage(db_session, user.id)
+
+    timings = {}
+    for name, read in (("COUNT/SUM scan", scan), ("counters", counters)):
+        started = time.perf_counter()
+        for _ in range(20):
+            result = read()
+        timings[name] = (time.perf_counter() - started) / 20
+        assert result == (file_count, file_count * 1000)
+
+    print(f"{file_count} files: " + ", ".join(f"{name} {t * 1000:.2f} ms" for name, t in timings.items()))
+    assert timings["counters"] < timings["COUNT/SUM scan"]
+
+    response = client.get("/storage", headers=auth(user))
+    assert response.json() == {"total_files": file_count, "total_bytes": file_count * 1000}
+    assert db_session.get(UserStorageUsage, user.id).file_count == file_count
@@ -0,0 +1,197 @@
+import os
+import statistics
+import time
+from pathlib import Path
+
+import pytest
+
+from core.security import create_access_token
+from models import User, UserFile
+from routes.file_routes import parse_range
+from services.file_records import insert_file_records, new_file_key
+from services.object_cache import ObjectCache
+from tests.conftest import synthetic_bytes
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="stream@example.com", name="Stream", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ObjectCache(directory=str(tmp_path / "cache"), max_bytes=10 * 1024 ** 2, max_object_bytes=8 * 1024 ** 2)
+    monkeypatch.setattr("services.object_cache.object_cache", cache)
+    return cache
+
+
+def auth(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(user.email)}"}
+
+
+def add_file(db_session, fake_s3, user, name: str, size: int, key: str | None = None) -> tuple[int, str]:
+    key = key or new_file_key(user.id)
+    (file_id,) = insert_file_records(db_session, [
+        {"user_id": user.id, "folder_id": None, "filename": name, "file_key": key, "file_size": size}
+    ])
+    db_session.commit()
+    fake_s3.add_synthetic_object(key, size)
+    return file_id, key
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-", (10, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("bytes=0-9,20-29", None),
+    ("items=0-9", None),
+    ("bytes=9-0", None),
+    ("bytes=abc", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_full_download_fills_the_cache(client, db_session, fake_s3, user, cache):
+    file_id, key = add_file(db_session, fake_s3, user, "movie.mp4", 100_000)
+
+    first = client.get(f"/files/{file_id}/stream", headers=auth(user))
+    second = client.get(f"/files/{file_id}/stream", headers=auth(user), params={"download": True})
+
+    for response in (first, second):
+        assert response.status_code == 200
+        assert response.content == synthetic_bytes(key, 0, 100_000)
+        assert response.headers["content-length"] == "100000"
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["content-type"] == "video/mp4"
+    assert first.headers["etag"] == second.headers["etag"]
+    assert second.headers["content-disposition"] == "attachment; filename*=UTF-8''movie.mp4"
+    assert fake_s3.calls.count("get_object") == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["entries"] == 1
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_range_requests(client, db_session, fake_s3, user, cache, cached):
+    file_id, key = add_file(db_session, fake_s3, user, "song.mp3", 5000)
+    if cached:
+        client.get(f"/files/{file_id}/stream", headers=auth(user))
+    calls_before = fake_s3.calls.count("get_object")
+
+    for header, (start, end) in (("bytes=100-199", (100, 199)), ("bytes=-10", (4990, 4999)), ("bytes=4000-", (4000, 4999))):
+        response = client.get(f"/files/{file_id}/stream", headers={**auth(user), "Range": header})
+        assert response.status_code == 206
+        assert response.headers["content-range"] == f"bytes {start}-{end}/5000"
+        assert response.content == synthetic_bytes(key, start, end - start + 1)
+
+    unsatisfiable = client.get(f"/files/{file_id}/stream", headers={**auth(user), "Range": "bytes=5000-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == "bytes */5000"
+    # Hits never touch S3; range misses fetch only the range and aren't cached
+    assert fake_s3.calls.count("get_object") - calls_before == (0 if cached else 3)
+    assert cache.stats()["entries"] == (1 if cached else 0)
+
+
+def test_conditional_requests(client, db_session, fake_s3, user, cache):
+    file_id, key = add_file(db_session, fake_s3, user, "doc.pdf", 1000)
+    etag = client.get(f"/files/{file_id}/stream", headers=auth(user)).headers["etag"]
+    calls_before = len(fake_s3.calls)
+
+    not_modified = client.get(f"/files/{file_id}/stream", headers={**auth(user), "If-None-Match": f'"other", W/{etag}'})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == etag
+    assert len(fake_s3.calls) == calls_before
+
+    # A stale If-Range sends the whole file instead of the range
+    stale = client.get(f"/files/{file_id}/stream", headers={**auth(user), "Range": "bytes=0-9", "If-Range": '"old"'})
+    current = client.get(f"/files/{file_id}/stream", headers={**auth(user), "Range": "bytes=0-9", "If-Range": etag})
+    assert (stale.status_code, len(stale.content)) == (200, 1000)
+    assert (current.status_code, len(current.content)) == (206, 10)
+
+
+def test_cache_evicts_least_recently_used(client, db_session, fake_s3, user, cache):
+    files = [add_file(db_session, fake_s3, user, f"f{i}.bin", 3 * 1024 ** 2) for i in range(4)]
+    big_id, _ = add_file(db_session, fake_s3, user, "big.bin", 9 * 1024 ** 2)
+    legacy_id, _ = add_file(db_session, fake_s3, user, "old.bin", 1000, key=f"users/{user.id}/old.bin")
+
+    for file_id, _ in files[:3]:
+        client.get(f"/files/{file_id}/stream", headers=auth(user))
+    client.get(f"/files/{files[0][0]}/stream", headers=auth(user))  # f0 is now the most recent
+    client.get(f"/files/{files[3][0]}/stream", headers=auth(user))  # evicts f1
+    client.get(f"/files/{big_id}/stream", headers=auth(user))
+    client.get(f"/files/{legacy_id}/stream", headers=auth(user))
+
+    assert list(cache._entries) == [files[2][1], files[0][1], files[3][1]]
+    assert cache.stats()["bytes"] == 9 * 1024 ** 2
+    assert cache.stats()["evictions"] == 1
+    assert len(list(Path(cache.directory).iterdir())) == 3
+
+
+def test_workers_sharing_the_cache_directory_keep_their_own_files(client, db_session, fake_s3, user, cache):
+    # Another running worker's entry, and one left by a worker that exited
+    root = Path(cache.root)
+    running, exited = root / f"worker-{os.getppid()}", root / "worker-999999999"
+    for directory in (running, exited):
+        directory.mkdir(parents=True)
+        (directory / "entry").write_bytes(b"x")
+    file_id, _ = add_file(db_session, fake_s3, user, "a.bin", 1000)
+
+    assert client.get(f"/files/{file_id}/stream", headers=auth(user)).status_code == 200
+
+    assert (running / "entry").exists() and not exited.exists()
+    assert Path(cache.directory) == root / f"worker-{os.getpid()}"
+    assert len(list(Path(cache.directory).iterdir())) == 1
+
+
+def test_missing_object_and_foreign_file(client, db_session, fake_s3, user, cache):
+    file_id, key = add_file(db_session, fake_s3, user, "gone.txt", 10)
+    del fake_s3.objects[key]
+    other = User(email="stream-other@example.com", name="Other", password="hashed", is_verified=True)
+    db_session.add(other)
+    db_session.commit()
+
+    assert client.get(f"/files/{file_id}/stream", headers=auth(user)).status_code == 404
+    assert client.get(f"/files/{file_id}/stream", headers=auth(other)).status_code == 404
+
+
+def test_cache_hits_vs_cold_s3_reads(client, db_session, fake_s3, user, cache, bench_full):
+    size = 8 * 1024 ** 2 if bench_full else 2 * 1024 ** 2
+    rounds = 20 if bench_full else 8
+    fake_s3.latency = 0.02  # Round trip to the bucket
+    file_id, _ = add_file(db_session, fake_s3, user, "hot.bin", size)
+    headers = auth(user)
+
+    def timed(extra_headers=None) -> float:
+        started = time.perf_counter()
+        response = client.get(f"/files/{file_id}/stream", headers={**headers, **(extra_headers or {})})
+        elapsed = time.perf_counter() - started
+        assert response.status_code in (200, 206)
+        return elapsed
+
+    cold = []
+    for _ in range(rounds):
+        cache.clear()
+        cold.append(timed())
+    hot = [timed() for _ in range(rounds)]
+    hot_range = [timed({"Range": f"bytes={size // 2}-{size // 2 + 65535}"}) for _ in range(rounds)]
+    cache.clear()
+    cold_range = [timed({"Range": f"bytes={size // 2}-{size // 2 + 65535}"}) for _ in range(rounds)]
+
+    mib = size / 1024 ** 2
+    print(
+        f"{mib:.0f} MiB object: cold {statistics.median(cold) * 1000:.1f} ms ({mib / statistics.median(cold):.0f} MiB/s), "
+        f"cached {statistics.median(hot) * 1000:.1f} ms ({mib / statistics.median(hot):.0f} MiB/s); "
+        f"64 KiB range: cold {statistics.median(cold_range) * 1000:.1f} ms, cached {statistics.median(hot_range) * 1000:.1f} ms"
+    )
+    assert statistics.median(hot) < statistics.median(cold)
+    assert statistics.median(hot_range) < statistics.median(cold_range)
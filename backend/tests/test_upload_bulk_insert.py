@@ -0,0 +1,164 @@
+import time
+
+from sqlalchemy import event
+
+from core.security import create_access_token
+from models import User, UserFile
+from services.file_records import find_existing_filenames, insert_file_records
+
+
+def create_user(db_session, email: str) -> User:
+    user = User(email=email, name="Bulk", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+def count_commits(db_session) -> list:
+    commits = []
+
+    def on_commit(session):
+        commits.append(1)
+
+    event.listen(db_session, "after_commit", on_commit)
+    return commits
+
+
+def file_rows(user_id: int, count: int, prefix: str) -> list[dict]:
+    return [
+        {
+            "user_id": user_id,
+            "filename": f"{prefix}-{i}.txt",
+            "file_key": f"users/{user_id}/{prefix}-{i}.txt",
+            "file_size": 100,
+            "folder_id": None,
+        }
+        for i in range(count)
+    ]
+
+
+def insert_one_by_one(db_session, rows: list[dict]):
+    """The previous upload path: duplicate check, commit and refresh per file."""
+    for row in rows:
+        db_session.query(UserFile).filter(
+            UserFile.user_id == row["user_id"],
+            UserFile.filename == row["filename"],
+            UserFile.folder_id == row["folder_id"],
+            UserFile.deleted_at.is_(None)
+        ).first()
+        db_file = UserFile(**row)
+        db_session.add(db_file)
+        db_session.commit()
+        db_session.refresh(db_file)
+
+
+def insert_in_bulk(db_session, rows: list[dict]):
+    find_existing_filenames(db_session, rows[0]["user_id"], None, [row["filename"] for row in rows])
+    insert_file_records(db_session, rows)
+    db_session.commit()
+
+
+def test_bulk_insert_uses_one_commit_and_beats_per_file_loop(db_session):
+    user = create_user(db_session, "bench@example.com")
+
+    for count in (10, 100, 1000):
+        results = {}
+        for name, insert in (("per-file", insert_one_by_one), ("bulk", insert_in_bulk)):
+            commits = count_commits(db_session)
+            started = time.perf_counter()
+            insert(db_session, file_rows(user.id, count, f"{name}-{count}"))
+            results[name] = (len(commits), time.perf_counter() - started)
+
+        print(
+            f"{count:>5} files: per-file {results['per-file'][0]} commits {results['per-file'][1] * 1000:.0f} ms, "
+            f"bulk {results['bulk'][0]} commits {results['bulk'][1] * 1000:.0f} ms"
+        )
+        assert results["per-file"][0] == count
+        assert results["bulk"][0] == 1
+        assert results["bulk"][1] < results["per-file"][1]
+
+    assert db_session.query(UserFile).filter_by(user_id=user.id).count() == 2 * (10 + 100 + 1000)
+
+
+def test_find_existing_filenames_returns_only_live_matches(db_session):
+    user = create_user(db_session, "dupes@example.com")
+    insert_file_records(db_session, file_rows(user.id, 3, "doc"))
+    db_session.commit()
+
+    existing = find_existing_filenames(db_session, user.id, None, ["doc-0.txt", "doc-2.txt", "new.txt"])
+
+    assert existing == {"doc-0.txt", "doc-2.txt"}
+
+
+def test_upload_batch_commits_once(client, db_session, async_session_factory, fake_s3):
+    user = create_user(db_session, "batch@example.com")
+    token = create_access_token(user.email)
+    # The route commits through an AsyncSession; count the transactions it commits on the connection
+    engine = async_session_factory.kw["bind"].sync_engine
+    commits = []
+
+    def on_commit(conn):
+        commits.append(1)
+
+    event.listen(engine, "commit", on_commit)
+    try:
+        response = client.post(
+            "/files/upload",
+            headers={"Authorization": f"Bearer {token}"},
+            files=[("files", (f"file-{i}.txt", b"data", "text/plain")) for i in range(100)],
+        )
+    finally:
+        event.remove(engine, "commit", on_commit)
+
+    assert response.status_code == 200
+    ids = [item["file_id"] for item in response.json()["uploaded"]]
+    assert len(set(ids)) == 100
+    assert len(commits) == 1
+    assert db_session.query(UserFile).filter_by(user_id=user.id).count() == 100
+
+
+def test_upload_removes_stored_objects_when_insert_fails(client, db_session, fake_s3, monkeypatch):
+    user = create_user(db_session, "rollback@example.com")
+    token = create_access_token(user.email)
+
+    def broken_insert(db, rows):
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setattr("routes.file_routes.insert_file_records", broken_insert)
+
+    response = client.post(
+        "/files/upload",
+        headers={"Authorization": f"Bearer {token}"},
+        files=[("files", (f"file-{i}.txt", b"data", "text/plain")) for i in range(5)],
+    )
+
+    assert response.status_code == 500
+    assert "disk I/O error" in response.json()["detail"]
+    assert not fake_s3.objects
+    assert db_session.query(UserFile).filter_by(user_id=user.id).count() == 0
+
+
+def test_failed_upload_keeps_objects_that_a_committed_file_uses(client, db_session, fake_s3, monkeypatch):
+    user = create_user(db_session, "shared@example.com")
+    token = create_access_token(user.email)
+    key = f"users/{user.id}/objects/{'a' * 32}"
+    insert_file_records(db_session, [
+        {"user_id": user.id, "folder_id": None, "filename": "other.txt", "file_key": key, "file_size": 4}
+    ])
+    db_session.commit()
+
+    def broken_insert(db, rows):
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setattr("routes.file_routes.new_file_key", lambda user_id: key)
+    monkeypatch.setattr("routes.file_routes.insert_file_records", broken_insert)
+
+    response = client.post(
+        "/files/upload",
+        headers={"Authorization": f"Bearer {token}"},
+        files=[("files", ("file.txt", b"data", "text/plain"))],
+    )
+
+    assert response.status_code == 500
+    assert key in fake_s3.objects
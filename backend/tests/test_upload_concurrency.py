@@ -0,0 +1,113 @@
+import asyncio
+import io
+import threading
+import time
+
+from core.security import create_access_token
+from models import User, UserFile
+from services.s3_client import upload_file_to_s3
+from services.upload_service import upload_files_concurrently
+
+S3_LATENCY = 0.02
+BATCH_SIZE = 48
+
+
+def upload_batch(concurrency: int) -> float:
+    """Upload a batch of small files and return throughput in files/sec."""
+    uploads = [(io.BytesIO(b"x" * 1024), f"bench/{concurrency}/{i}") for i in range(BATCH_SIZE)]
+    started = time.perf_counter()
+    errors = asyncio.run(upload_files_concurrently(uploads, upload_file_to_s3, concurrency=concurrency))
+    elapsed = time.perf_counter() - started
+    assert errors == [None] * BATCH_SIZE
+    return BATCH_SIZE / elapsed
+
+
+def test_batch_upload_throughput_scales_with_concurrency(fake_s3, bench_full):
+    fake_s3.latency = S3_LATENCY
+
+    throughput = {concurrency: upload_batch(concurrency) for concurrency in (1, 4, 16)}
+
+    assert len(fake_s3.objects) == 3 * BATCH_SIZE
+    # Wall-clock comparisons only when benchmarking; they are noisy on a busy machine
+    if bench_full:
+        for concurrency, files_per_sec in throughput.items():
+            print(f"concurrency {concurrency:>2}: {files_per_sec:.0f} files/sec")
+        assert throughput[4] > 2.5 * throughput[1]
+        assert throughput[16] > 2 * throughput[4]
+
+
+def test_uploads_overlap_up_to_the_concurrency_limit(fake_s3):
+    fake_s3.latency = S3_LATENCY
+    lock = threading.Lock()
+    in_flight = [0]
+    peak = [0]
+
+    def tracked_upload(fileobj, key):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        try:
+            upload_file_to_s3(fileobj, key)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    uploads = [(io.BytesIO(b"x"), f"overlap/{i}") for i in range(16)]
+    errors = asyncio.run(upload_files_concurrently(uploads, tracked_upload, concurrency=4))
+
+    assert errors == [None] * 16
+    assert 1 < peak[0] <= 4
+
+
+def test_upload_reports_per_file_failures(client, db_session, fake_s3, monkeypatch):
+    user = User(email="batch@example.com", name="Batch", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    token = create_access_token(user.email)
+
+    original_put_object = fake_s3.put_object
+
+    def failing_put_object(**kwargs):
+        if kwargs["Body"] == b"bad":
+            raise ConnectionError("S3 unavailable")
+        return original_put_object(**kwargs)
+
+    monkeypatch.setattr(fake_s3, "put_object", failing_put_object)
+
+    response = client.post(
+        "/files/upload",
+        headers={"Authorization": f"Bearer {token}"},
+        files=[
+            ("files", ("good.txt", b"good", "text/plain")),
+            ("files", ("bad.txt", b"bad", "text/plain")),
+        ],
+    )
+
+    assert response.status_code == 200
+    results = {item["filename"]: item for item in response.json()["uploaded"]}
+    assert results["good.txt"]["status"] == "uploaded"
+    assert results["bad.txt"]["status"] == "failed"
+    assert "S3 unavailable" in results["bad.txt"]["error"]
+
+    db_files = db_session.query(UserFile).filter_by(user_id=user.id).all()
+    assert [f.filename for f in db_files] == ["good.txt"]
+
+
+def test_upload_rejects_duplicate_names_in_one_batch(client, db_session, fake_s3):
+    user = User(email="dupes@example.com", name="Dupes", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    token = create_access_token(user.email)
+
+    response = client.post(
+        "/files/upload",
+        headers={"Authorization": f"Bearer {token}"},
+        files=[
+            ("files", ("same.txt", b"one", "text/plain")),
+            ("files", ("same.txt", b"two", "text/plain")),
+        ],
+    )
+
+    assert response.status_code == 400
+    assert not fake_s3.objects
+    assert db_session.query(UserFile).filter_by(user_id=user.id).count() == 0
@@ -0,0 +1,114 @@
+import io
+import time
+import tracemalloc
+
+import pytest
+
+from core.security import create_access_token
+from models import User, UserFile
+from services.s3_client import upload_file_to_s3
+
+MB = 1024 * 1024
+PART_SIZE = 4 * MB
+
+
+class SyntheticFile(io.RawIOBase):
+    """Read-only file of `size` bytes generated on demand, never held in memory."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def read(self, n: int = -1) -> bytes:
+        remaining = self.size - self.position
+        if n < 0 or n > remaining:
+            n = remaining
+        self.position += n
+        return b"\x00" * n
+
+
+def measure_upload(size: int) -> tuple[int, float]:
+    """Upload a synthetic file and return (peak traced bytes, seconds)."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    upload_file_to_s3(SyntheticFile(size), f"bench/{size}", part_size=PART_SIZE)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def test_small_file_uses_single_put(fake_s3):
+    uploaded = upload_file_to_s3(io.BytesIO(b"hello"), "users/1/hello.txt", part_size=PART_SIZE)
+
+    assert uploaded == 5
+    assert fake_s3.calls == ["put_object"]
+    assert fake_s3.objects["users/1/hello.txt"]["Body"] == b"hello"
+
+
+def test_large_file_is_uploaded_in_parts(fake_s3):
+    data = bytes(range(256)) * (PART_SIZE * 7 // 2 // 256)
+
+    uploaded = upload_file_to_s3(io.BytesIO(data), "users/1/big.bin", part_size=PART_SIZE)
+
+    assert uploaded == len(data)
+    assert fake_s3.calls.count("upload_part") == 4
+    assert fake_s3.calls[-1] == "complete_multipart_upload"
+    assert fake_s3.objects["users/1/big.bin"]["Body"] == data
+    assert not fake_s3.multipart_uploads
+
+
+def test_failed_part_aborts_multipart_upload(fake_s3, monkeypatch):
+    original_upload_part = fake_s3.upload_part
+
+    def flaky_upload_part(**kwargs):
+        if kwargs["PartNumber"] == 2:
+            raise ConnectionError("network blip")
+        return original_upload_part(**kwargs)
+
+    monkeypatch.setattr(fake_s3, "upload_part", flaky_upload_part)
+
+    with pytest.raises(ConnectionError):
+        upload_file_to_s3(SyntheticFile(3 * PART_SIZE), "users/1/broken.bin", part_size=PART_SIZE)
+
+    assert "abort_multipart_upload" in fake_s3.calls
+    assert "users/1/broken.bin" not in fake_s3.objects
+    assert not fake_s3.multipart_uploads
+
+
+def test_upload_memory_stays_flat_as_file_size_grows(fake_s3):
+    fake_s3.store_bodies = False
+
+    results = {size: measure_upload(size) for size in (32 * MB, 128 * MB, 512 * MB)}
+
+    for size, (peak, elapsed) in results.items():
+        print(f"{size // MB:>4} MB: peak {peak / MB:.1f} MB, {size / MB / elapsed:.0f} MB/s")
+        assert fake_s3.objects[f"bench/{size}"]["ContentLength"] == size
+        # Only the current part (plus the fake client's hashing) is ever resident
+        assert peak < 3 * PART_SIZE
+
+    smallest_peak = results[32 * MB][0]
+    largest_peak = results[512 * MB][0]
+    assert largest_peak < smallest_peak + PART_SIZE
+
+
+def test_upload_route_streams_to_s3(client, db_session, fake_s3):
+    user = User(email="stream@example.com", name="Stream", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    token = create_access_token(user.email)
+
+    response = client.post(
+        "/files/upload",
+        headers={"Authorization": f"Bearer {token}"},
+        files=[("files", ("report.txt", b"quarterly numbers", "text/plain"))],
+    )
+
+    assert response.status_code == 200
+    db_file = db_session.query(UserFile).filter_by(user_id=user.id).one()
+    assert db_file.file_key.startswith(f"users/{user.id}/objects/")
+    assert fake_s3.objects[db_file.file_key]["Body"] == b"quarterly numbers"
+    assert db_file.file_size == len(b"quarterly numbers")
@@ -0,0 +1,141 @@
+import time
+
+import boto3
+
+from core.security import create_access_token
+from models import Folder, User
+from services.file_records import insert_file_records
+from services.url_cache import PresignedUrlCache, presigned_url_cache
+
+
+class Signer:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return f"https://bucket.s3.amazonaws.com/object?signature={self.calls}"
+
+
+def test_cache_reuses_url_until_safety_margin(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("services.url_cache.time.monotonic", lambda: clock[0])
+    cache = PresignedUrlCache(max_entries=10, max_bytes=10_000, safety_margin=60, enabled=True)
+    sign = Signer()
+
+    first = cache.get_or_create(("users/1/a.pdf", "inline", None), 300, sign)
+    clock[0] += 200
+    assert cache.get_or_create(("users/1/a.pdf", "inline", None), 300, sign) == first
+
+    # 241 seconds in, less than the 60 second margin is left
+    clock[0] += 41
+    assert cache.get_or_create(("users/1/a.pdf", "inline", None), 300, sign) != first
+    assert sign.calls == 2
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_cache_keys_include_disposition_and_filename():
+    cache = PresignedUrlCache(max_entries=10, max_bytes=10_000, safety_margin=60, enabled=True)
+    sign = Signer()
+
+    cache.get_or_create(("users/1/a.pdf", "inline", None), 300, sign)
+    cache.get_or_create(("users/1/a.pdf", "attachment", "a.pdf"), 300, sign)
+    cache.get_or_create(("users/1/a.pdf", "attachment", "renamed.pdf"), 300, sign)
+
+    assert sign.calls == 3
+    assert cache.stats()["entries"] == 3
+
+
+def test_cache_never_returns_a_url_signed_for_less_time(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("services.url_cache.time.monotonic", lambda: clock[0])
+    cache = PresignedUrlCache(max_entries=10, max_bytes=10_000, safety_margin=60, enabled=True)
+    sign = Signer()
+
+    short = cache.get_or_create(("users/1/a.pdf", "inline", None), 300, sign)
+    clock[0] += 200
+    long = cache.get_or_create(("users/1/a.pdf", "inline", None), 3600, sign)
+
+    assert long != short
+    assert cache.get_or_create(("users/1/a.pdf", "inline", None), 3600, sign) == long
+    assert cache.get_or_create(("users/1/a.pdf", "inline", None), 300, sign) == short
+    assert sign.calls == 2
+
+
+def test_cache_evicts_least_recently_used_entries():
+    cache = PresignedUrlCache(max_entries=2, max_bytes=10_000, safety_margin=60, enabled=True)
+    sign = Signer()
+
+    cache.get_or_create(("a",), 300, sign)
+    cache.get_or_create(("b",), 300, sign)
+    cache.get_or_create(("a",), 300, sign)
+    cache.get_or_create(("c",), 300, sign)
+
+    assert cache.stats()["evictions"] == 1
+    cache.get_or_create(("a",), 300, sign)
+    assert sign.calls == 3
+    cache.get_or_create(("b",), 300, sign)
+    assert sign.calls == 4
+
+
+def test_cache_respects_memory_cap():
+    cache = PresignedUrlCache(max_entries=1000, max_bytes=2_000, safety_margin=60, enabled=True)
+    sign = Signer()
+
+    for i in range(100):
+        cache.get_or_create((f"users/1/file-{i}",), 300, sign)
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 2_000
+    assert stats["entries"] < 100
+
+
+def time_listing(client, token: str, folder_id: int) -> float:
+    started = time.perf_counter()
+    response = client.get(f"/files/in-folder/{folder_id}", headers={"Authorization": f"Bearer {token}"})
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200
+    return elapsed
+
+
+def test_listing_latency_with_and_without_cache(client, db_session, monkeypatch, bench_full):
+    # Real SigV4 signing with dummy credentials; nothing is sent over the network
+    signer = boto3.client(
+        "s3", region_name="us-east-1", aws_access_key_id="bench", aws_secret_access_key="bench"
+    )
+    monkeypatch.setattr("services.s3_client.s3", signer)
+    monkeypatch.setattr("services.s3_client.AWS_BUCKET_NAME", "bench-bucket")
+    monkeypatch.setattr("routes.file_routes.print", lambda *args: None, raising=False)
+
+    user = User(email="many@example.com", name="Many", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    folder = Folder(name="Photos", user_id=user.id)
+    db_session.add(folder)
+    db_session.commit()
+    token = create_access_token(user.email)
+
+    listed = 0
+    for count in ((1000, 10000) if bench_full else (1000,)):
+        insert_file_records(db_session, [
+            {"user_id": user.id, "filename": f"photo-{listed + i}.jpg",
+             "file_key": f"users/{user.id}/photo-{listed + i}.jpg", "file_size": 1024, "folder_id": folder.id}
+            for i in range(count - listed)
+        ])
+        db_session.commit()
+        listed = count
+
+        presigned_url_cache.clear()
+        monkeypatch.setattr(presigned_url_cache, "enabled", False)
+        uncached = time_listing(client, token, folder.id)
+
+        monkeypatch.setattr(presigned_url_cache, "enabled", True)
+        time_listing(client, token, folder.id)
+        cached = time_listing(client, token, folder.id)
+
+        print(f"{count:>6} files: no cache {uncached * 1000:.0f} ms, warm cache {cached * 1000:.0f} ms")
+        assert presigned_url_cache.stats()["hits"] == 2 * count
+        assert cached < uncached
+
+    presigned_url_cache.clear()
@@ -0,0 +1,131 @@
+import time
+
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from core.security import create_access_token, get_current_user
+from models import User
+from services.user_cache import AuthenticatedUser, AuthenticatedUserCache, authenticated_user_cache
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="cached@example.com", name="Cached", password="hashed", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture
+def user_queries(db_session):
+    """Count the SELECTs against users."""
+    engine = db_session.get_bind()
+    queries = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lower().lstrip().startswith("select") and "from users" in statement.lower():
+            queries.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    yield queries
+    event.remove(engine, "before_cursor_execute", capture)
+
+
+def auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_repeated_requests_look_the_user_up_once(client, user, user_queries):
+    token = create_access_token(user.email, user.id)
+
+    for _ in range(5):
+        response = client.get("/auth/me", headers=auth(token))
+        assert response.status_code == 200
+        assert response.json()["email"] == user.email
+
+    assert len(user_queries) == 1
+    assert authenticated_user_cache.stats()["hits"] == 4
+
+
+def test_token_with_stale_email_is_rejected(client, db_session, user):
+    token = create_access_token("old-address@example.com", user.id)
+
+    assert client.get("/auth/me", headers=auth(token)).status_code == 401
+
+
+def test_verification_invalidates_cached_user(client, db_session):
+    user = User(email="pending@example.com", name="Pending", password="hashed", is_verified=False, verification_token="t0k3n")
+    db_session.add(user)
+    db_session.commit()
+    token = create_access_token(user.email, user.id)
+    assert client.get("/auth/me", headers=auth(token)).json()["is_verified"] is False
+
+    assert client.get("/auth/verify/t0k3n").status_code == 200
+
+    assert client.get("/auth/me", headers=auth(token)).json()["is_verified"] is True
+
+
+def test_cache_expires_and_evicts(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("services.user_cache.time.monotonic", lambda: clock[0])
+    cache = AuthenticatedUserCache(max_entries=2, ttl=60, enabled=True)
+    loads = []
+
+    def loader(user_id):
+        def load():
+            loads.append(user_id)
+            return AuthenticatedUser(id=user_id, name="U", email=f"u{user_id}@example.com", is_verified=True)
+        return load
+
+    cache.get_or_load(("u1", 1, 0), loader(1))
+    clock[0] += 59
+    cache.get_or_load(("u1", 1, 0), loader(1))
+    clock[0] += 2
+    cache.get_or_load(("u1", 1, 0), loader(1))
+    assert loads == [1, 1]
+
+    cache.get_or_load(("u2", 2, 0), loader(2))
+    cache.get_or_load(("u3", 3, 0), loader(3))
+    assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] == 1
+
+    cache.invalidate(3)
+    cache.get_or_load(("u3", 3, 0), loader(3))
+    assert loads == [1, 1, 2, 3, 3]
+    # Unknown users are not cached
+    assert cache.get_or_load(("u4", 4, 0), lambda: None) is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_authentication_throughput_with_and_without_cache(db_session, user, user_queries, monkeypatch, bench_full):
+    requests = 20_000 if bench_full else 2000
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_access_token(user.email, user.id))
+    session_factory = sessionmaker(bind=db_session.get_bind())
+    user_queries.clear()
+
+    def run() -> float:
+        started = time.perf_counter()
+        for _ in range(requests):
+            # A session per request, like get_db, so nothing comes from the identity map
+            db = session_factory()
+            try:
+                assert get_current_user(credentials, db).id == user.id
+            finally:
+                db.close()
+        return time.perf_counter() - started
+
+    monkeypatch.setattr(authenticated_user_cache, "enabled", False)
+    uncached = run()
+    uncached_queries = len(user_queries)
+    monkeypatch.setattr(authenticated_user_cache, "enabled", True)
+    user_queries.clear()
+    cached = run()
+
+    print(
+        f"{requests} authentications: without cache {requests / uncached:,.0f}/s ({uncached_queries} user queries), "
+        f"with cache {requests / cached:,.0f}/s ({len(user_queries)} user queries)"
+    )
+    assert uncached_queries == requests
+    assert len(user_queries) == 1
+    assert cached < uncached